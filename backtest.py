@@ -0,0 +1,208 @@
+import itertools
+import numpy as np
+
+from my_client_config import EXCHANGE_COMMISSION
+from var_engine import batch_forecast, get_trend_offset, to_var_coefficients
+from feature_engine import DEFAULT_FEATURES, get_pipeline
+from parallel_search import SEARCH_WORKERS, get_search_pool
+
+
+def forecast_all_ticks(model, candles, selected_features, num_values_for_predict: int, num_predictions: int):
+    """
+    Прогнозы, которые trading_bot сделал бы после закрытия каждой свечи (окно из num_values_for_predict
+    последних свечей), одним батчем. Возвращает индексы свечей решений и прогнозы цен (ticks x steps x k).
+    """
+    model = to_var_coefficients(model)
+    pipeline = get_pipeline(tuple(selected_features))
+    data = pipeline.compute(candles)
+
+    first_tick = max(num_values_for_predict + pipeline.warm_up, model.k_ar) - 1
+    ticks = np.arange(first_tick, len(candles))
+    forecasts = batch_forecast(coefs=model.coefs,
+                               trend_offset=get_trend_offset(model, num_predictions),
+                               data=data,
+                               ends=ticks + 1,
+                               steps=num_predictions)
+
+    if not pipeline.is_raw:
+        forecasts = forecasts[:, :, pipeline.price_columns]
+
+    return ticks, forecasts
+
+
+def get_order_prices(forecasts, model_accuracy: float, min_price_increment: float):
+    """
+    buy_sell_benefit для всех тиков сразу.
+    """
+    predict_buy = forecasts.reshape(len(forecasts), -1).min(axis=1)
+    predict_sell = forecasts.reshape(len(forecasts), -1).max(axis=1)
+
+    buy = np.round((1 + model_accuracy) * predict_buy / min_price_increment) * min_price_increment
+    sell = np.round((1 - model_accuracy) * predict_sell / min_price_increment) * min_price_increment
+    benefit = sell - buy > (sell + buy) * EXCHANGE_COMMISSION
+
+    return benefit, buy, sell
+
+
+def get_fills(candles, ticks, buy, sell, ttl_candles: int):
+    """
+    Лимитная заявка, выставленная после свечи tick, исполняется, если за следующие ttl_candles свечей
+    low опустился до цены покупки (high поднялся до цены продажи).
+    """
+    count = len(candles)
+    low = np.concatenate([candles['low'], np.full(ttl_candles, np.inf)])
+    high = np.concatenate([candles['high'], np.full(ttl_candles, -np.inf)])
+
+    future_low = np.lib.stride_tricks.sliding_window_view(low[1:], ttl_candles).min(axis=1)[:count]
+    future_high = np.lib.stride_tricks.sliding_window_view(high[1:], ttl_candles).max(axis=1)[:count]
+
+    return buy >= future_low[ticks], sell <= future_high[ticks]
+
+
+def simulate(candles, ticks, benefit, buy, sell, buy_filled, sell_filled, limitations_cash, ttl_candles: int):
+    """
+    Проход по тикам с проверками limitations_cash как в trading_bot. Исполнение заявки меняет
+    деньги/лоты в момент окончания её жизни, комиссия EXCHANGE_COMMISSION списывается с каждой сделки.
+    """
+    quantity = limitations_cash['quantity']
+    stock_in_lot = limitations_cash['stock_in_lot']
+    min_count_lot = limitations_cash['min_count_lot']
+    min_count_money = limitations_cash['min_count_money']
+    money = float(limitations_cash['current_count_money'])
+    lots = int(limitations_cash['current_count_lot'])
+
+    close = candles['close']
+    equity = np.empty(len(ticks))
+    pending = {}
+    placed = filled = 0
+
+    for n, tick in enumerate(ticks):
+        for delta_money, delta_lots in pending.pop(tick, ()):
+            money += delta_money
+            lots += delta_lots
+
+        if benefit[n]:
+            settle_tick = tick + ttl_candles
+
+            if money - buy[n] * quantity * stock_in_lot > min_count_money:
+                placed += 1
+                if buy_filled[n]:
+                    filled += 1
+                    price = buy[n] * quantity * stock_in_lot
+                    pending.setdefault(settle_tick, []).append((-price * (1 + EXCHANGE_COMMISSION), quantity))
+
+            if lots - quantity >= min_count_lot:
+                placed += 1
+                if sell_filled[n]:
+                    filled += 1
+                    price = sell[n] * quantity * stock_in_lot
+                    pending.setdefault(settle_tick, []).append((price * (1 - EXCHANGE_COMMISSION), -quantity))
+
+        equity[n] = money + lots * stock_in_lot * close[tick]
+
+    for settlements in pending.values():
+        for delta_money, delta_lots in settlements:
+            money += delta_money
+            lots += delta_lots
+
+    return equity, placed, filled, money, lots
+
+
+def get_max_drawdown(equity):
+    """
+    Максимальная относительная просадка от предыдущего пика. Точки, где пик не положителен, не учитываются.
+    """
+    if len(equity) == 0:
+        return 0.0
+    peak = np.maximum.accumulate(equity)
+    drawdown = np.divide(peak - equity, peak, out=np.zeros(len(equity)), where=peak > 0)
+    return float(np.max(drawdown))
+
+
+def run_backtest(candles, forecasts_data, config_bot, model_accuracy: float = None, quantity: int = None,
+                 ttl_candles: int = 1):
+    """
+    Бэктест стратегии trading_bot на сохранённых свечах.
+
+    :param forecasts_data: результат forecast_all_ticks (тики, прогнозы)
+    :param ttl_candles: время жизни заявки в свечах (live_time_order = interval_time, т.е. одна свеча)
+    :return: отчёт с PnL, долей исполненных заявок и максимальной просадкой
+    """
+    ticks, forecasts = forecasts_data
+    limitations_cash = dict(config_bot['limitations_cash'])
+    if quantity is not None:
+        limitations_cash['quantity'] = quantity
+    if model_accuracy is None:
+        model_accuracy = config_bot['limitations_technical']['model_accuracy']
+
+    benefit, buy, sell = get_order_prices(forecasts, model_accuracy, limitations_cash['min_price_increment'])
+    buy_filled, sell_filled = get_fills(candles, ticks, buy, sell, ttl_candles)
+
+    equity, placed, filled, money, lots = simulate(candles, ticks, benefit, buy, sell, buy_filled, sell_filled,
+                                                   limitations_cash, ttl_candles)
+
+    start_equity = (config_bot['limitations_cash']['current_count_money'] +
+                    config_bot['limitations_cash']['current_count_lot'] * limitations_cash['stock_in_lot'] *
+                    candles['close'][ticks[0]]) if len(ticks) else 0.0
+
+    return {
+        "model_accuracy": model_accuracy,
+        "quantity": limitations_cash['quantity'],
+        "pnl": float(equity[-1] - start_equity) if len(equity) else 0.0,
+        "orders": placed,
+        "filled": filled,
+        "fill_rate": filled / placed if placed else 0.0,
+        "max_drawdown": get_max_drawdown(equity),
+        "final_money": float(money),
+        "final_lots": lots
+    }
+
+
+def _run_backtest_args(args):
+    return run_backtest(*args)
+
+
+def sweep_backtest(candles, model, config_bot, model_accuracies, quantities, workers: int = None,
+                   selected_features=DEFAULT_FEATURES):
+    """
+    Перебор model_accuracy x quantity в общем пуле процессов (get_search_pool, spawn). Прогноз считается
+    один раз: он не зависит от перебираемых параметров.
+    """
+    forecasts_data = forecast_all_ticks(model=model,
+                                        candles=candles,
+                                        selected_features=list(selected_features),
+                                        num_values_for_predict=config_bot['limitations_technical']['num_values_for_predict'],
+                                        num_predictions=config_bot['limitations_technical']['num_predictions'])
+
+    tasks = [(candles, forecasts_data, config_bot, model_accuracy, quantity)
+             for model_accuracy, quantity in itertools.product(model_accuracies, quantities)]
+
+    if workers == 1:
+        return [run_backtest(*task) for task in tasks]
+
+    return list(get_search_pool(workers or SEARCH_WORKERS).map(_run_backtest_args, tasks,
+                                                               chunksize=max(1, len(tasks) // 64)))
+
+
+if __name__ == "__main__":
+    from config_store import ConfigStore
+    from candle_store import get_candle_store
+    from model_registry import get_model
+
+    config_bots = ConfigStore().get_config_bots()
+
+    for bot_name, config_bot in config_bots.items():
+        parameters_model = config_bot['parameters_model']
+        candles = np.array(get_candle_store(parameters_model['figi'], parameters_model['interval_time']).window(10**9))
+        model = get_model(parameters_model['path_model'])
+
+        model_accuracy = config_bot['limitations_technical']['model_accuracy']
+        reports = sweep_backtest(candles=candles,
+                                 model=model,
+                                 config_bot=config_bot,
+                                 model_accuracies=[model_accuracy * factor for factor in (0.5, 0.75, 1, 1.5, 2)],
+                                 quantities=[1, 2, 5])
+
+        print(bot_name)
+        for report in sorted(reports, key=lambda x: x['pnl'], reverse=True):
+            print(report)
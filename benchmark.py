@@ -0,0 +1,257 @@
+import os
+import sys
+import json
+import time as t
+import argparse
+import tempfile
+from contextlib import ExitStack, contextmanager
+from datetime import datetime, timezone
+import numpy as np
+
+
+PATH_BASELINE = 'benchmark_baseline.json'
+REGRESSION_THRESHOLD = 0.2
+
+SEED = 42
+CANDLES_IN_DAY = 84
+TEST_ROWS = 14 * CANDLES_IN_DAY
+TRAINING_ROWS = 23 * CANDLES_IN_DAY
+
+# Фиксированное время бенчмарков с синтетическим рынком: среда, 15:00 по Москве (торговая сессия).
+BENCH_TIME = datetime(2026, 3, 4, 12, 0, tzinfo=timezone.utc)
+BENCH_HISTORY_MINUTES = 60 * 24 * 30
+
+VTBR_CONFIG = {
+    "limitations_technical": {
+        "model_accuracy": 0.001,
+        "num_values_for_predict": 39,
+        "num_predictions": 1
+    },
+    "limitations_cash": {
+        "min_count_lot": 0,
+        "min_count_money": 100,
+        "current_count_lot": 1,
+        "current_count_money": 800,
+        "quantity": 1,
+        "min_price_increment": 5e-06,
+        "stock_in_lot": 10000
+    },
+    "parameters_model": {
+        "path_model": "",
+        "name_model": "BENCH_model_minute_10",
+        "figi": "BENCH0000001",
+        "interval_time": "10m",
+        "day_for_training": 14,
+        "order": 35,
+        "mean_relative_error": 0.001,
+        "mean_absolute_error": 3e-05,
+        "num_values_for_predict": 39,
+        "num_predictions": 1,
+        "spread_days_percent": 0.3,
+        "spread_order_percent": 0.2,
+        "spread_num_values_for_predict": 0.5
+    }
+}
+
+
+def get_synthetic_values(rows: int, seed: int = SEED):
+    """
+    Фиксированный набор цен, похожий на VTBR: (rows x 4) open, close, high, low.
+    """
+    rng = np.random.default_rng(seed)
+    close = 0.0225 * np.exp(np.cumsum(rng.normal(0, 5e-4, rows)))
+    open_ = np.r_[close[0], close[:-1]]
+    high = np.maximum(open_, close) * (1 + np.abs(rng.normal(0, 2e-4, rows)))
+    low = np.minimum(open_, close) * (1 - np.abs(rng.normal(0, 2e-4, rows)))
+    return np.column_stack([open_, close, high, low])
+
+
+def measure(func, repeat: int = 5, number: int = 1):
+    """
+    Лучшее и медианное время одного вызова func, секунды.
+    """
+    func()
+    timings = []
+    for _ in range(repeat):
+        start = t.perf_counter()
+        for _ in range(number):
+            func()
+        timings.append((t.perf_counter() - start) / number)
+    return {"min": min(timings), "median": float(np.median(timings))}
+
+
+@contextmanager
+def synthetic_market(workdir: str):
+    """
+    FakeServer с синтетическим рынком, часы остановлены на BENCH_TIME, свечи пишутся в workdir.
+    Результат не зависит от дня недели запуска и от локального data_candles.
+    """
+    from clock import set_clock
+    from candle_store import set_candle_store_root
+    from fake_tinkoff import FakeServer, SyntheticMarket, install_fake_client
+
+    now_ns = int(BENCH_TIME.timestamp()) * 10**9
+
+    with ExitStack() as stack:
+        set_clock(now_ns)
+        stack.callback(set_clock)
+        set_candle_store_root(os.path.join(workdir, 'data_candles'))
+        stack.callback(set_candle_store_root)
+
+        market = SyntheticMarket(seed=SEED, start_time_ns=now_ns - BENCH_HISTORY_MINUTES * 60 * 10**9)
+        yield install_fake_client(FakeServer(market=market, seed=SEED))
+
+
+def bench_predict_next_values(workdir: str):
+    from model_func import predict_next_values
+    from var_engine import fit_var_orders
+
+    data = get_synthetic_values(TRAINING_ROWS)
+    model = fit_var_orders(data, [35])[35]
+    window = data[-39:]
+
+    return measure(lambda: predict_next_values(model=model, data=window, steps=1), number=1000)
+
+
+def bench_test_data_errors(workdir: str):
+    from retraining_module import get_test_data, calc_local_error, calc_avg_local_error
+    from model_func import predict_next_values
+    from var_engine import fit_var_orders
+
+    data = get_synthetic_values(TRAINING_ROWS)
+    model = fit_var_orders(data, [35])[35]
+    data_for_test = get_synthetic_values(TEST_ROWS, seed=SEED + 1)
+
+    def run():
+        local_error = [calc_local_error(predict_data=predict_next_values(model=model, data=values, steps=1),
+                                        real_data=real)
+                       for values, real in get_test_data(data=data_for_test, num_values_in_array=39, num_predictions=1)]
+        calc_avg_local_error(local_error=local_error)
+
+    return measure(run, repeat=3)
+
+
+def bench_walk_forward_errors(workdir: str):
+    from retraining_module import calc_walk_forward_errors
+    from var_engine import fit_var_orders
+
+    data = get_synthetic_values(TRAINING_ROWS)
+    model = fit_var_orders(data, [35])[35]
+    data_for_test = get_synthetic_values(TEST_ROWS, seed=SEED + 1)
+
+    return measure(lambda: calc_walk_forward_errors(model=model, data=data_for_test,
+                                                    num_values_range=range(35, 60), max_num_predictions=1))
+
+
+def bench_fit_orders(workdir: str):
+    from model_func import fit_models
+
+    data = get_synthetic_values(TRAINING_ROWS)
+    return measure(lambda: fit_models(data=data, orders=range(28, 36)), repeat=3)
+
+
+def bench_trading_bot(workdir: str):
+    from trading_bot import trading_bot
+    from var_engine import fit_var_orders
+
+    model = fit_var_orders(get_synthetic_values(TRAINING_ROWS), [35])[35]
+    config_bot = json.loads(json.dumps(VTBR_CONFIG))
+
+    with synthetic_market(workdir):
+        return measure(lambda: trading_bot(model=model, token='BENCH', account_id='BENCH', config_bot=config_bot),
+                       repeat=5, number=5)
+
+
+def bench_retraining_model(workdir: str):
+    from retraining_module import retraining_model
+
+    parameters_model = dict(VTBR_CONFIG['parameters_model'])
+    parameters_model['path_model'] = os.path.join(workdir, 'bench_model.pkl')
+
+    with synthetic_market(workdir):
+        return measure(lambda: retraining_model(parameters_model), repeat=1)
+
+
+BENCHMARKS = {
+    "predict_next_values": bench_predict_next_values,
+    "get_test_data_calc_avg_local_error": bench_test_data_errors,
+    "calc_walk_forward_errors": bench_walk_forward_errors,
+    "fit_models_orders_28_35": bench_fit_orders,
+    "trading_bot_tick": bench_trading_bot,
+    "retraining_model_vtbr_grid": bench_retraining_model,
+}
+
+
+def run_benchmarks(names=None):
+    """
+    Каждый бенчмарк вызывается как bench(workdir) во временном каталоге, который удаляется после запуска.
+    Упавший бенчмарк попадает в результаты как {"error": текст ошибки}.
+    """
+    results = {}
+
+    with tempfile.TemporaryDirectory(prefix='bench_') as workdir:
+        for name, bench in BENCHMARKS.items():
+            if names and name not in names:
+                continue
+
+            try:
+                results[name] = bench(workdir)
+                print(f'{name}: min {results[name]["min"] * 1000:.3f} ms, median {results[name]["median"] * 1000:.3f} ms')
+            except Exception as e:
+                results[name] = {"error": str(e)}
+                print(f'Benchmark {name} failed. Error: {e}')
+
+    return results
+
+
+def compare_results(results, baseline, threshold: float = REGRESSION_THRESHOLD):
+    """
+    Сравнивает минимальные времена с базовыми. Возвращает список регрессий (больше чем на threshold)
+    и упавших бенчмарков.
+    """
+    regressions = []
+
+    for name, result in results.items():
+        if 'error' in result:
+            print(f'{name}: FAILED {result["error"]}')
+            regressions.append(name)
+            continue
+
+        if 'min' not in baseline.get(name, {}):
+            continue
+
+        ratio = result['min'] / baseline[name]['min']
+        status = 'REGRESSION' if ratio > 1 + threshold else 'ok'
+        print(f'{name}: {ratio:.2f}x baseline {status}')
+
+        if ratio > 1 + threshold:
+            regressions.append(name)
+
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Бенчмарки тика бота и переобучения')
+    parser.add_argument('--save', action='store_true', help='сохранить результаты как базовые')
+    parser.add_argument('--compare', action='store_true', help='сравнить с базовыми результатами')
+    parser.add_argument('--baseline', default=PATH_BASELINE)
+    parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD)
+    parser.add_argument('names', nargs='*', help='запустить только эти бенчмарки')
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.names)
+
+    if args.save:
+        with open(args.baseline, 'w') as file:
+            json.dump({name: result for name, result in results.items() if 'error' not in result}, file, indent=4)
+
+    if args.compare:
+        with open(args.baseline, 'r') as file:
+            baseline = json.load(file)
+
+        if compare_results(results, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
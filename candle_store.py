@@ -0,0 +1,244 @@
+import os
+import json
+import threading
+import time as t
+import numpy as np
+from numpy.lib.recfunctions import structured_to_unstructured
+
+import metrics
+
+
+PATH_CANDLE_STORE = 'data_candles'
+
+CANDLE_DTYPE = np.dtype([
+    ('time', 'i8'),
+    ('open', 'f8'),
+    ('close', 'f8'),
+    ('high', 'f8'),
+    ('low', 'f8'),
+    ('volume', 'i8')
+])
+
+PRICE_FIELDS = ('open', 'close', 'high', 'low')
+DAY_NS = 24 * 60 * 60 * 10**9
+
+INITIAL_CAPACITY = 4096
+FETCH_MAX_AGE = 5.0
+
+
+def read_only(candles):
+    """
+    Представление массива без права записи: одно окно свечей отдаётся нескольким ботам сразу.
+    """
+    candles = candles.view()
+    candles.flags.writeable = False
+    return candles
+
+
+def get_values(candles, selected_features=PRICE_FIELDS):
+    """
+    Матрица (n x len(selected_features)) float64. Поля open, close, high, low лежат в CANDLE_DTYPE подряд,
+    поэтому для них (и любого набора с равным шагом) возвращается представление без копирования.
+    """
+    return structured_to_unstructured(candles[list(selected_features)], dtype=np.float64)
+
+
+class CandleStore:
+    """
+    Хранилище свечей одного (figi, interval) на диске в виде memory-mapped NumPy массива.
+    Время свечи хранится в наносекундах UTC.
+
+    Отданные окна не меняются: на месте перезаписывается только последняя свеча (она могла быть
+    ещё не закрыта), поэтому окна без неё - срезы без копирования, а окна с ней копируются.
+    replace и перезапись более ранних свечей пишут новый файл и подменяют им старый,
+    уже отданные срезы остаются на прежнем отображении файла.
+    """
+
+    def __init__(self, figi: str, interval_time: str, root: str = PATH_CANDLE_STORE):
+        self.figi = figi
+        self.interval_time = interval_time
+        self.path = os.path.join(root, interval_time, figi)
+        self.path_data = os.path.join(self.path, 'candles.npy')
+        self.path_meta = os.path.join(self.path, 'meta.json')
+        self.lock = threading.RLock()
+        self.fetch_lock = threading.Lock()
+        self.count = 0
+        self.covered_from = None
+        self._fetched_at = None
+        self._data = None
+
+        os.makedirs(self.path, exist_ok=True)
+        self._open()
+
+    def _open(self):
+        if os.path.exists(self.path_data) and os.path.exists(self.path_meta):
+            try:
+                with open(self.path_meta, 'r') as file:
+                    meta = json.load(file)
+                self.count = meta['count']
+                self.covered_from = meta.get('covered_from')
+                self._data = np.load(self.path_data, mmap_mode='r+')
+                return
+            except Exception as e:
+                print(f'Candle store {self.path} not load. Error: {e}')
+
+        self.count = 0
+        self._data = np.lib.format.open_memmap(self.path_data, mode='w+', dtype=CANDLE_DTYPE,
+                                               shape=(INITIAL_CAPACITY,))
+        self._save_meta()
+
+    def _save_meta(self):
+        path_tmp = self.path_meta + '.tmp'
+        with open(path_tmp, 'w') as file:
+            json.dump({'count': self.count,
+                       'covered_from': self.covered_from,
+                       'figi': self.figi,
+                       'interval_time': self.interval_time}, file)
+        os.replace(path_tmp, self.path_meta)
+
+    def _rewrite(self, keep_rows: int, candles, capacity: int):
+        """
+        Новый файл из первых keep_rows сохранённых свечей и candles вместо старого.
+        """
+        path_tmp = self.path_data + '.tmp'
+        count = keep_rows + len(candles)
+
+        data = np.lib.format.open_memmap(path_tmp, mode='w+', dtype=CANDLE_DTYPE, shape=(max(capacity, count),))
+        data[:keep_rows] = self._data[:keep_rows]
+        data[keep_rows:count] = candles
+        data.flush()
+        del data
+
+        os.replace(path_tmp, self.path_data)
+        self._data = np.load(self.path_data, mmap_mode='r+')
+        self.count = count
+        self._save_meta()
+
+    def _grow(self, min_capacity: int):
+        self._rewrite(self.count, self._data[:0], max(len(self._data) * 2, min_capacity))
+
+    def last_time(self):
+        with self.lock:
+            return int(self._data[self.count - 1]['time']) if self.count else None
+
+    def append(self, candles):
+        """
+        Добавляет свечи, отсортированные по времени. Свечи, время которых уже есть в хранилище,
+        перезаписываются (последняя свеча могла быть ещё не закрыта), а более поздние сохранённые
+        свечи отбрасываются: новая пачка заменяет всё начиная со своей первой свечи.
+        На месте перезаписывается только последняя свеча, при более ранней первой свече пишется новый файл.
+        """
+        if len(candles) == 0:
+            return
+
+        with self.lock:
+            start = int(np.searchsorted(self._data['time'][:self.count], candles['time'][0]))
+            end = start + len(candles)
+
+            if start < self.count - 1:
+                self._rewrite(start, candles, len(self._data))
+                return
+
+            if end > len(self._data):
+                self._grow(end)
+
+            self._data[start:end] = candles
+            self.count = end
+            self._data.flush()
+            self._save_meta()
+
+    def replace(self, candles, covered_from: int):
+        with self.lock:
+            self.covered_from = covered_from
+            self._rewrite(0, candles, len(self._data))
+
+    def restore(self, candles):
+        """
+        Дописывает свечи из снимка состояния, которых нет на диске (хранилище пустое или отстаёт без разрыва).
+        """
+        if len(candles) == 0:
+            return
+
+        with self.lock:
+            last_time = self.last_time()
+            if last_time is None:
+                self.replace(candles, covered_from=int(candles['time'][0]))
+            elif int(candles['time'][0]) <= last_time < int(candles['time'][-1]):
+                self.append(candles[candles['time'] >= last_time])
+
+    def _slice(self, start: int, end: int):
+        """
+        Свечи [start, end): срез без копирования или копия, если в неё входит последняя (перезаписываемая) свеча.
+        """
+        if end < self.count:
+            return read_only(self._data[start:end])
+        return read_only(self._data[start:end].copy())
+
+    def window(self, count_rows: int):
+        with self.lock:
+            return self._slice(max(self.count - count_rows, 0), self.count)
+
+    def since(self, from_time_ns: int):
+        with self.lock:
+            start = int(np.searchsorted(self._data['time'][:self.count], from_time_ns))
+            return self._slice(start, self.count)
+
+    def until(self, end_time_ns: int):
+        """
+        Вся сохранённая история до свечи со временем end_time_ns включительно.
+        """
+        with self.lock:
+            end = int(np.searchsorted(self._data['time'][:self.count], end_time_ns, side='right'))
+            return self._slice(0, end)
+
+    def is_fresh(self, from_time_ns: int, max_age: float) -> bool:
+        return (self._fetched_at is not None and t.monotonic() - self._fetched_at < max_age and
+                self.covered_from is not None and self.count > 0 and from_time_ns >= self.covered_from)
+
+    def update(self, fetch_candles, from_time_ns: int, max_age: float = FETCH_MAX_AGE):
+        """
+        Догружает свечи начиная с последней сохранённой. Если запрошена история глубже
+        уже загруженной, хранилище заполняется заново с from_time_ns.
+        fetch_candles(from_time_ns) должна возвращать массив CANDLE_DTYPE.
+
+        Одновременные запросы одного (figi, interval) выполняются одним вызовом API: пока идёт загрузка,
+        остальные ждут на fetch_lock и, если данные моложе max_age секунд и покрывают их окно,
+        используют уже загруженные свечи.
+        """
+        with self.fetch_lock:
+            if self.is_fresh(from_time_ns, max_age):
+                metrics.inc('candle_fetch_coalesced_total', figi=self.figi, interval=self.interval_time)
+                return
+
+            if self.covered_from is None or self.count == 0 or from_time_ns < self.covered_from:
+                self.replace(fetch_candles(from_time_ns), covered_from=from_time_ns)
+            else:
+                self.append(fetch_candles(self.last_time()))
+
+            self._fetched_at = t.monotonic()
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+_root = PATH_CANDLE_STORE
+
+
+def get_candle_store(figi: str, interval_time: str, root: str = None) -> CandleStore:
+    with _stores_lock:
+        key = (root or _root, figi, interval_time)
+        if key not in _stores:
+            _stores[key] = CandleStore(figi=figi, interval_time=interval_time, root=key[0])
+        return _stores[key]
+
+
+def set_candle_store_root(root: str = PATH_CANDLE_STORE):
+    """
+    Каталог хранилищ для get_candle_store без явного root (например, временный каталог нагрузочного теста).
+    Открытые хранилища других каталогов забываются.
+    """
+    global _root
+
+    with _stores_lock:
+        _root = root
+        for key in [key for key in _stores if key[0] != root]:
+            del _stores[key]
@@ -0,0 +1,297 @@
+import asyncio
+import threading
+import time as t
+from contextlib import asynccontextmanager, contextmanager
+
+from grpc import StatusCode
+from tinkoff.invest import AsyncClient, Client
+
+
+HEALTH_CHECK_INTERVAL = 60
+
+RECONNECT_STATUS_CODES = (StatusCode.UNAVAILABLE, StatusCode.UNAUTHENTICATED, StatusCode.INTERNAL)
+
+
+class Connection:
+    """
+    Открытый клиент и число запросов, которые сейчас идут через его канал.
+    """
+
+    def __init__(self, client, services):
+        self.client = client
+        self.services = services
+        self.in_flight = 0
+        self.retired = False
+
+    def close(self):
+        try:
+            self.client.__exit__(None, None, None)
+        except Exception as e:
+            print(f'ERROR: client session not close. Error: {e}')
+
+    async def aclose(self):
+        try:
+            await self.client.__aexit__(None, None, None)
+        except Exception as e:
+            print(f'ERROR: async client session not close. Error: {e}')
+
+
+class ClientSession:
+    """
+    Долгоживущее подключение к Tinkoff Invest API. Один gRPC канал используется всеми потоками ботов,
+    канал периодически проверяется и пересоздаётся при обрыве соединения. Старый канал закрывается
+    только после того, как через него завершатся все начатые запросы.
+    """
+
+    def __init__(self, token: str, health_check_interval: int = HEALTH_CHECK_INTERVAL, client_factory=Client):
+        self.token = token
+        self.health_check_interval = health_check_interval
+        self.client_factory = client_factory
+        self.lock = threading.Lock()
+        self._connection = None
+        self._last_check = 0
+
+    def _connect(self) -> Connection:
+        """
+        Текущее подключение (создаётся при необходимости). Вызывается под self.lock.
+        """
+        if self._connection is None:
+            client = self.client_factory(self.token)
+            self._connection = Connection(client, client.__enter__())
+            self._last_check = t.monotonic()
+        return self._connection
+
+    def _acquire(self):
+        """
+        Подключение для запроса и флаг, что пора проверить канал (проверку получает только один поток).
+        """
+        with self.lock:
+            connection = self._connect()
+            connection.in_flight += 1
+
+            check = t.monotonic() - self._last_check > self.health_check_interval
+            if check:
+                self._last_check = t.monotonic()
+            return connection, check
+
+    def _release(self, connection: Connection):
+        with self.lock:
+            connection.in_flight -= 1
+            close = connection.retired and connection.in_flight == 0
+
+        if close:
+            connection.close()
+
+    def _retire(self, connection: Connection):
+        """
+        Убирает подключение из сессии, если оно ещё текущее. Канал закрывается сразу, если запросов
+        через него нет, иначе - последним завершившимся запросом в _release.
+        """
+        with self.lock:
+            if self._connection is not connection:
+                return
+            self._connection = None
+            connection.retired = True
+            close = connection.in_flight == 0
+
+        if close:
+            connection.close()
+
+    def close(self):
+        with self.lock:
+            connection, self._connection = self._connection, None
+
+        if connection is not None:
+            connection.retired = True
+            connection.close()
+
+    def check_health(self, services) -> bool:
+        try:
+            services.users.get_accounts()
+            return True
+        except Exception as e:
+            print(f'ERROR: client session health check failed. Error: {e}')
+            return False
+
+    @contextmanager
+    def client(self):
+        connection, check = self._acquire()
+        if check and not self.check_health(connection.services):
+            self._retire(connection)
+            self._release(connection)
+            connection, _ = self._acquire()
+
+        try:
+            yield connection.services
+        except Exception as error:
+            if is_connection_error(error):
+                print(f'Client session reconnect. Error: {error}')
+                self._retire(connection)
+            raise
+        finally:
+            self._release(connection)
+
+
+class AsyncClientSession:
+    """
+    Вариант ClientSession для asyncio на AsyncClient: один канал на все корутины ботов процесса, с той же
+    проверкой канала и тем же отложенным закрытием старого канала. Сессия используется из одного event loop.
+    """
+
+    def __init__(self, token: str, health_check_interval: int = HEALTH_CHECK_INTERVAL, client_factory=AsyncClient):
+        self.token = token
+        self.health_check_interval = health_check_interval
+        self.client_factory = client_factory
+        self.lock = asyncio.Lock()
+        self._connection = None
+        self._last_check = 0
+
+    async def _acquire(self):
+        """
+        Подключение для запроса и флаг, что пора проверить канал. Lock нужен только на время открытия
+        канала: между await остальной код корутин не перемежается.
+        """
+        async with self.lock:
+            if self._connection is None:
+                client = self.client_factory(self.token)
+                self._connection = Connection(client, await client.__aenter__())
+                self._last_check = t.monotonic()
+            connection = self._connection
+
+        connection.in_flight += 1
+        check = t.monotonic() - self._last_check > self.health_check_interval
+        if check:
+            self._last_check = t.monotonic()
+        return connection, check
+
+    async def _release(self, connection: Connection):
+        connection.in_flight -= 1
+        if connection.retired and connection.in_flight == 0:
+            await connection.aclose()
+
+    async def _retire(self, connection: Connection):
+        if self._connection is not connection:
+            return
+        self._connection = None
+        connection.retired = True
+        if connection.in_flight == 0:
+            await connection.aclose()
+
+    async def close(self):
+        connection, self._connection = self._connection, None
+
+        if connection is not None:
+            connection.retired = True
+            await connection.aclose()
+
+    async def check_health(self, services) -> bool:
+        try:
+            await services.users.get_accounts()
+            return True
+        except Exception as e:
+            print(f'ERROR: async client session health check failed. Error: {e}')
+            return False
+
+    @asynccontextmanager
+    async def client(self):
+        connection, check = await self._acquire()
+        if check and not await self.check_health(connection.services):
+            await self._retire(connection)
+            await self._release(connection)
+            connection, _ = await self._acquire()
+
+        try:
+            yield connection.services
+        except Exception as error:
+            if is_connection_error(error):
+                print(f'Async client session reconnect. Error: {error}')
+                await self._retire(connection)
+            raise
+        finally:
+            await self._release(connection)
+
+
+def get_error_code(error):
+    """
+    StatusCode ошибки gRPC/RequestError (code может быть атрибутом или методом) или None.
+    """
+    code = getattr(error, 'code', None)
+
+    if callable(code):
+        try:
+            code = code()
+        except Exception:
+            return None
+
+    return code
+
+
+def is_connection_error(error) -> bool:
+    return get_error_code(error) in RECONNECT_STATUS_CODES
+
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+_client_factory = Client
+_async_sessions = {}
+_async_client_factory = AsyncClient
+
+
+def get_client_session(token: str) -> ClientSession:
+    with _sessions_lock:
+        if token not in _sessions:
+            _sessions[token] = ClientSession(token, client_factory=_client_factory)
+        return _sessions[token]
+
+
+def get_async_client_session(token: str) -> AsyncClientSession:
+    with _sessions_lock:
+        if token not in _async_sessions:
+            _async_sessions[token] = AsyncClientSession(token, client_factory=_async_client_factory)
+        return _async_sessions[token]
+
+
+def set_client_factory(client_factory=Client, async_client_factory=AsyncClient):
+    """
+    Подменяет классы клиентов для всех новых сессий (например, на fake_tinkoff.FakeClient) и закрывает текущие
+    синхронные. Асинхронные сессии забываются: их закрывает close_async_client_sessions в своём event loop.
+    """
+    global _client_factory, _async_client_factory
+
+    close_client_sessions()
+    with _sessions_lock:
+        _async_sessions.clear()
+    _client_factory = client_factory
+    _async_client_factory = async_client_factory
+
+
+def api_client(token: str):
+    """
+    Замена `with Client(token) as client` без создания нового канала на каждый запрос.
+    """
+    return get_client_session(token).client()
+
+
+def async_api_client(token: str):
+    """
+    Замена `async with AsyncClient(token) as client` для ботов на asyncio.
+    """
+    return get_async_client_session(token).client()
+
+
+def close_client_sessions():
+    with _sessions_lock:
+        sessions = list(_sessions.values())
+        _sessions.clear()
+
+    for session in sessions:
+        session.close()
+
+
+async def close_async_client_sessions():
+    with _sessions_lock:
+        sessions = list(_async_sessions.values())
+        _async_sessions.clear()
+
+    for session in sessions:
+        await session.close()
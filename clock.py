@@ -0,0 +1,25 @@
+import time as t
+from datetime import datetime, timezone
+
+
+_fixed_time_ns = None
+
+
+def now_ns() -> int:
+    """
+    Текущее время UTC в наносекундах. Все модули, которым нужны «сейчас» для свечей и торговых сессий,
+    берут его отсюда, поэтому set_clock останавливает часы для всего процесса.
+    """
+    return t.time_ns() if _fixed_time_ns is None else _fixed_time_ns
+
+
+def now() -> datetime:
+    return datetime.fromtimestamp(now_ns() / 10**9, tz=timezone.utc)
+
+
+def set_clock(time_ns: int = None):
+    """
+    Останавливает часы на time_ns (бенчмарки с синтетическим рынком), None возвращает системное время.
+    """
+    global _fixed_time_ns
+    _fixed_time_ns = time_ns
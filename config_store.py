@@ -0,0 +1,254 @@
+import os
+import copy
+import json
+import threading
+
+
+PATH_TO_CONFIG_BOTS = 'path_to_config_bots.json'
+STATE_FIELDS = ('current_count_money', 'current_count_lot')
+WATCH_INTERVAL = 1.0
+WRITE_DELAY = 0.5
+
+
+def write_json_atomic(path: str, data):
+    path_tmp = path + '.tmp'
+    with open(path_tmp, 'w') as file:
+        json.dump(data, file, indent=4)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(path_tmp, path)
+
+
+def get_state_path(path_to_config: str) -> str:
+    """
+    Файл состояния бота рядом с его конфигом: configs/bot.json -> configs/bot.state.json.
+    """
+    return os.path.splitext(path_to_config)[0] + '.state.json'
+
+
+def get_legacy_state_path(path_to_config: str) -> str:
+    return os.path.join(os.path.dirname(path_to_config), 'state.json')
+
+
+def get_mtime(path: str):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+class ConfigStore:
+    """
+    Конфигурации всех ботов в памяти. Файлы перечитываются только если оператор их изменил (по mtime),
+    изменяемое состояние (поля STATE_FIELDS из limitations_cash) хранится отдельно в <конфиг>.state.json
+    вместе со значениями этих полей в конфиге на момент записи. Если при запуске они не совпадают с конфигом,
+    оператор менял limitations_cash, пока процесс был остановлен, и берутся значения конфига.
+    Все изменения идут под блокировкой и сохраняются атомарно с задержкой WRITE_DELAY,
+    чтобы несколько изменений подряд давали одну запись. Если файл перечитывается до записи, ещё
+    не сохранённые изменения применяются заново поверх прочитанного.
+    """
+
+    def __init__(self, path_to_config_bots: str = PATH_TO_CONFIG_BOTS, watch_interval: float = WATCH_INTERVAL,
+                 write_delay: float = WRITE_DELAY, bot_names=None):
+        """
+        :param bot_names: загружать только этих ботов (шард процесса), None - всех из path_to_config_bots
+        """
+        self.path_to_config_bots = path_to_config_bots
+        self.watch_interval = watch_interval
+        self.write_delay = write_delay
+        self.bot_names = set(bot_names) if bot_names is not None else None
+
+        self.lock = threading.RLock()
+        self._configs = {}
+        self._states = {}
+        self._file_states = {}
+        self._mtimes = {}
+        self._config_paths = {}
+        self._dirty_configs = set()
+        self._dirty_states = set()
+        self._pending_updates = {}
+        self._write_timer = None
+        self._stop = threading.Event()
+        self._watcher = None
+
+        self.reload()
+
+    def _read_config(self, bot_name: str, config_path: str):
+        with open(config_path, 'r') as file:
+            bot_config = json.load(file)
+
+        file_state = {field: bot_config['limitations_cash'][field] for field in STATE_FIELDS}
+
+        if bot_name not in self._states:
+            self._states[bot_name] = self._load_state(bot_name, config_path, file_state)
+        elif file_state != self._file_states.get(bot_name):
+            print(f'Config {config_path}: limitations_cash changed by operator')
+            self._states[bot_name] = dict(file_state)
+            self._dirty_states.add(bot_name)
+            for kind, update in self._pending_updates.get(bot_name, []):
+                if kind == 'state':
+                    update(self._states[bot_name])
+
+        for kind, update in self._pending_updates.get(bot_name, []):
+            if kind == 'config':
+                update(bot_config)
+
+        self._configs[bot_name] = bot_config
+        self._file_states[bot_name] = file_state
+        self._mtimes[config_path] = get_mtime(config_path)
+
+    def _load_state(self, bot_name: str, config_path: str, file_state):
+        """
+        Состояние бота при запуске: из файла состояния, если limitations_cash в конфиге не менялся после его записи.
+        """
+        state_path = get_state_path(config_path)
+        if not os.path.exists(state_path) and self._is_legacy_state(config_path):
+            state_path = get_legacy_state_path(config_path)
+            print(f'Config {config_path}: state is read from {state_path}')
+
+        try:
+            with open(state_path, 'r') as file:
+                saved = json.load(file)
+        except (OSError, ValueError):
+            return dict(file_state)
+
+        if 'state' not in saved:
+            return saved
+
+        if saved.get('config') != file_state:
+            print(f'Config {config_path}: limitations_cash changed while the bot was stopped, '
+                  f'{state_path} is ignored')
+            self._dirty_states.add(bot_name)
+            return dict(file_state)
+        return saved['state']
+
+    def _is_legacy_state(self, config_path: str) -> bool:
+        """
+        Старый общий state.json каталога можно прочитать, только если в каталоге один конфиг бота.
+        """
+        directory = os.path.dirname(os.path.abspath(config_path))
+        return (os.path.exists(get_legacy_state_path(config_path)) and
+                sum(os.path.dirname(os.path.abspath(path)) == directory for path in self._config_paths.values()) == 1)
+
+    def reload(self):
+        with self.lock:
+            with open(self.path_to_config_bots, 'r') as file:
+                self._config_paths = json.load(file)
+            if self.bot_names is not None:
+                self._config_paths = {bot_name: config_path for bot_name, config_path in self._config_paths.items()
+                                      if bot_name in self.bot_names}
+            self._mtimes[self.path_to_config_bots] = get_mtime(self.path_to_config_bots)
+
+            for bot_name in list(self._configs):
+                if bot_name not in self._config_paths:
+                    del self._configs[bot_name]
+                    self._states.pop(bot_name, None)
+                    self._file_states.pop(bot_name, None)
+                    self._pending_updates.pop(bot_name, None)
+
+            for bot_name, config_path in self._config_paths.items():
+                try:
+                    self._read_config(bot_name, config_path)
+                except Exception as e:
+                    print(f'Config {config_path} not load. Error: {e}')
+
+    def check_changes(self):
+        with self.lock:
+            if get_mtime(self.path_to_config_bots) != self._mtimes.get(self.path_to_config_bots):
+                self.reload()
+                return
+
+            for bot_name, config_path in self._config_paths.items():
+                if get_mtime(config_path) != self._mtimes.get(config_path):
+                    try:
+                        self._read_config(bot_name, config_path)
+                    except Exception as e:
+                        print(f'Config {config_path} not load. Error: {e}')
+
+    def _merged(self, bot_name: str):
+        bot_config = copy.deepcopy(self._configs[bot_name])
+        bot_config['limitations_cash'].update(self._states[bot_name])
+        return bot_config
+
+    def get_config_bots(self):
+        with self.lock:
+            return {bot_name: self._merged(bot_name) for bot_name in self._configs}
+
+    def get_config(self, bot_name: str):
+        with self.lock:
+            return self._merged(bot_name)
+
+    def update_state(self, bot_name: str, update):
+        """
+        update(state) меняет словарь состояния бота на месте. Возвращает копию нового конфига.
+        """
+        with self.lock:
+            update(self._states[bot_name])
+            self._dirty_states.add(bot_name)
+            self._pending_updates.setdefault(bot_name, []).append(('state', update))
+            self._schedule_write()
+            return self._merged(bot_name)
+
+    def update_config(self, bot_name: str, update):
+        """
+        update(bot_config) меняет статические параметры бота на месте (состояние в нём не сохраняется).
+        """
+        with self.lock:
+            update(self._configs[bot_name])
+            self._dirty_configs.add(bot_name)
+            self._pending_updates.setdefault(bot_name, []).append(('config', update))
+            self._schedule_write()
+            return self._merged(bot_name)
+
+    def _schedule_write(self):
+        if self._write_timer is None:
+            self._write_timer = threading.Timer(self.write_delay, self.flush)
+            self._write_timer.daemon = True
+            self._write_timer.start()
+
+    def flush(self):
+        with self.lock:
+            self._write_timer = None
+
+            for bot_name in self._dirty_configs:
+                config_path = self._config_paths.get(bot_name)
+                if config_path is not None:
+                    try:
+                        bot_config = self._configs[bot_name]
+                        bot_config['limitations_cash'].update(self._states[bot_name])
+                        write_json_atomic(config_path, bot_config)
+                        self._file_states[bot_name] = {field: bot_config['limitations_cash'][field]
+                                                       for field in STATE_FIELDS}
+                        self._mtimes[config_path] = get_mtime(config_path)
+                        self._dirty_states.add(bot_name)
+                    except Exception as e:
+                        print(f'Новый конфиг не сохранён: {e}')
+
+            for bot_name in self._dirty_states:
+                config_path = self._config_paths.get(bot_name)
+                if config_path is not None:
+                    try:
+                        write_json_atomic(get_state_path(config_path), {'state': self._states[bot_name],
+                                                                        'config': self._file_states.get(bot_name)})
+                    except Exception as e:
+                        print(f'Состояние {bot_name} не сохранено: {e}')
+
+            self._dirty_states.clear()
+            self._dirty_configs.clear()
+            self._pending_updates.clear()
+
+    def start_watching(self):
+        if self._watcher is None:
+            self._watcher = threading.Thread(target=self._watch, daemon=True)
+            self._watcher.start()
+
+    def stop(self):
+        self._stop.set()
+        self.flush()
+
+    def _watch(self):
+        while not self._stop.wait(self.watch_interval):
+            try:
+                self.check_changes()
+            except Exception as e:
+                print(f'ERROR: config watcher. Error: {e}')
@@ -1,194 +1,359 @@
-import json
-from trading_bot import trading_bot, get_interval_minutes
+from trading_bot import trading_bot, get_interval_minutes, get_delta_day
 from retraining_module import retraining_model
-from datetime import datetime, time
-import time as t
-from model_func import load_model
+from parallel_search import SEARCH_WORKERS
+from datetime import datetime
+from model_registry import get_model, model_registry
 from my_client_config import TOKEN, account_id
-from tinkoff_api_request import check_status_order, cansel_order
-import threading
+from tinkoff_api_request import get_trading_data
+from order_tracker import OrderTracker
+from order_journal import close_order_journals, get_order_journal
+from config_store import ConfigStore, PATH_TO_CONFIG_BOTS
+from market_stream import MarketDataStreamer
+from scheduler import BotScheduler, is_trading_day, is_trading_time, next_session_start
+from retraining_queue import RetrainingQueue, DEADLINE_MARGIN, get_checkpoint_path, has_checkpoints
 from concurrent.futures import ThreadPoolExecutor
-import os
+from candle_store import get_candle_store
+import clock
+from feature_engine import get_bot_features, get_feature_values, get_pipeline
+from online_var import OnlineModels, WARM_UP_ROWS
+from warm_start import WarmStartSnapshots, PATH_WARM_START
+import metrics
+import threading
+import time as t
+import numpy as np
+
+
+STREAMING_MODE = False
+STREAM_BUFFER_SIZE = 1024
+
+ONLINE_UPDATES = False
+
+SEARCH_STRATEGY = 'grid'
+RETRAINING_BUDGET_SECONDS = None
+
+METRICS_ENABLED = False
+METRICS_PORT = metrics.METRICS_PORT
+METRICS_TRACE_PATH = None
+
+# Снимок состояния для быстрого перезапуска (свечи, модели, живые заявки, позиция планировщика).
+WARM_START = False
+WARM_START_PATH = PATH_WARM_START
+WARM_START_CANDLES = STREAM_BUFFER_SIZE
+
+# Число процессов с ботами (0 - все боты в текущем процессе), см. shard_runtime.
+SHARDS = 0
+PIN_CORES = False
+# Стрим сделок и опрос get_orders счёта ведёт этот процесс (False в шардах: их ведёт супервизор).
+ORDER_EVENTS = True
 
 
 def main():
-    while True:
-        while is_weekday():
-            while exchange_open():
-                start_bots(datetime.now().time())
+    global warm_start_snapshots, config_store
+
+    if config_store is None:
+        config_store = ConfigStore()
+
+    if METRICS_ENABLED:
+        metrics.enable(port=METRICS_PORT, trace_path=METRICS_TRACE_PATH)
+
+    config_store.start_watching()
+    warm_start_snapshots = WarmStartSnapshots(WARM_START_PATH) if WARM_START else None
+    position = restore_warm_start(warm_start_snapshots) if WARM_START else None
+    order_tracker.start(own_events=ORDER_EVENTS)
+    streamer = start_streaming() if STREAMING_MODE else None
+
+    if has_checkpoints() and not exchange_open():
+        print('Resume interrupted retraining')
+        threading.Thread(target=retraining_models, daemon=True).start()
+
+    scheduler = BotScheduler(get_configs=get_config_bots,
+                             run_bot=start_bot,
+                             run_retraining=retraining_models,
+                             get_interval_minutes=get_interval_minutes,
+                             trigger_bots=streamer is None,
+                             position=position)
+    if WARM_START:
+        warm_start_snapshots.start(lambda: collect_warm_start(scheduler))
+    try:
+        scheduler.run()
+    finally:
+        close_order_journals()
+
+
+def collect_warm_start(scheduler):
+    candles = {}
+    for bot_config in get_config_bots().values():
+        key = (bot_config['parameters_model']['figi'], bot_config['parameters_model']['interval_time'])
+        if key not in candles:
+            candles[key] = np.array(get_candle_store(figi=key[0], interval_time=key[1]).window(WARM_START_CANDLES))
+
+    return {'candles': candles,
+            'models': model_registry.snapshot(),
+            'orders': order_tracker.snapshot(),
+            'scheduler': scheduler.get_position()}
+
+
+def restore_warm_start(snapshots):
+    """
+    Восстанавливает свечи, модели и живые заявки из снимка и возвращает позицию планировщика.
+    """
+    start_time = t.monotonic()
+    state = snapshots.load()
+    if state is None:
+        return None
+
+    for (figi, interval_time), candles in state['candles'].items():
+        try:
+            get_candle_store(figi=figi, interval_time=interval_time).restore(candles)
+        except Exception as e:
+            print(f'Candles {figi} {interval_time} not restored. Error: {e}')
+
+    count_models = model_registry.restore(state['models'])
 
-            if now_night():
-                retraining_models()
+    orders = [order for order in state['orders'] if not is_order_processed(order['bot_name'], order['order_id'])]
+    order_tracker.restore(orders)
 
+    print(f'Warm start: candles {len(state["candles"])}, models {count_models}, '
+          f'orders {len(orders)} restored in {t.monotonic() - start_time:.3f} s')
+    return state['scheduler']
 
-def start_bots(current_time):
-    bots_to_start = []
+
+def is_order_processed(bot_name, order_id):
+    """
+    Итог заявки уже записан в журнал бота (заявка завершилась после последнего снимка).
+    """
+    try:
+        bot_config = config_store.get_config(bot_name)
+    except KeyError:
+        print(f'Order {order_id} of unknown bot {bot_name} not restored')
+        return True
+
+    try:
+        return get_order_journal(bot_config['path_order_dump']).get(order_id) is not None
+    except Exception as e:
+        print(f'Order {order_id} not checked in journal. Error: {e}')
+        return False
+
+
+def start_streaming():
     config_bots = get_config_bots()
+    executor = ThreadPoolExecutor()
 
-    def error_handler(exception, bot_name):
-        print(f"An error occurred in thread for bot {bot_name}: {exception}")
+    subscriptions = []
+    for bot_name in config_bots:
+        parameters_model = config_bots[bot_name]["parameters_model"]
+        subscriptions.append((parameters_model["figi"],
+                              parameters_model["interval_time"],
+                              get_interval_minutes(parameters_model["interval_time"])))
 
-    with ThreadPoolExecutor() as executor:
-        for bot_name in config_bots:
-            bot_config = config_bots[bot_name]
-            parameters_model = bot_config["parameters_model"]
+        get_trading_data(token=TOKEN,
+                         figi=parameters_model["figi"],
+                         delta_day=get_delta_day(STREAM_BUFFER_SIZE, parameters_model["interval_time"]),
+                         interval_time=parameters_model["interval_time"])
+
+    def on_candle_close(figi, interval_time, candle_time):
+        if not is_weekday() or not exchange_open():
+            return
 
-            interval_minutes = get_interval_minutes(parameters_model["interval_time"])
-            if current_time.minute % interval_minutes == 0 and current_time.second == 4:
-                bots_to_start.append(bot_name)
+        all_configs = get_config_bots()
+        buffer = streamer.get_buffer(figi, interval_time)
+        lag = (clock.now_ns() - candle_time) / 10**9 - 60 * get_interval_minutes(interval_time)
 
-        t.sleep(1)
+        for bot_name in all_configs:
+            parameters_model = all_configs[bot_name]["parameters_model"]
+            if parameters_model["figi"] == figi and parameters_model["interval_time"] == interval_time:
+                num_values_for_predict = all_configs[bot_name]['limitations_technical']['num_values_for_predict']
+                warm_up = get_pipeline(get_bot_features(parameters_model)).warm_up
+                candles = buffer.window(num_values_for_predict + warm_up, end_time=candle_time)
+                if ONLINE_UPDATES:
+                    get_candle_store(figi=figi, interval_time=interval_time).append(candles[-1:])
+                metrics.observe(metrics.SCHEDULER_LAG, lag, bot=bot_name)
 
-        if bots_to_start:
-            futures = []
-            for bot_name in bots_to_start:
-                future = executor.submit(start_bot, bot_name, config_bots)
-                future.add_done_callback(lambda f: error_handler(f.exception(), bot_name))
-                futures.append(future)
+                future = executor.submit(start_bot, bot_name, all_configs, candles)
+                future.add_done_callback(lambda f, name=bot_name: f.exception() and
+                                         print(f"An error occurred in thread for bot {name}: {f.exception()}"))
 
-            # Wait for all futures to complete
-            for future in futures:
-                future.result()
+    streamer = MarketDataStreamer(token=TOKEN,
+                                  subscriptions=subscriptions,
+                                  capacity=STREAM_BUFFER_SIZE,
+                                  on_candle_close=on_candle_close)
+    streamer.start()
 
+    return streamer
 
-def start_bot(bot_name, all_configs):
+
+def start_bot(bot_name, all_configs, candles=None):
+    with metrics.bot_context(bot_name), metrics.stage('tick'):
+        run_bot(bot_name, all_configs, candles)
+
+
+def run_bot(bot_name, all_configs, candles=None):
     bot_config = all_configs[bot_name]
-    start_config = bot_config
 
     print(f'Start config bot: {bot_config["parameters_model"]["name_model"]}\n'
           f'{bot_config}')
 
-    model = load_model(bot_config['parameters_model']['path_model'])
+    base_model = get_model(bot_config['parameters_model']['path_model'])
+    model = online_models.get(bot_name, base_model) if ONLINE_UPDATES and base_model else base_model
 
     order_data = trading_bot(model=model,
                              token=TOKEN,
                              account_id=account_id,
-                             config_bot=bot_config)
+                             config_bot=bot_config,
+                             candles=candles)
 
-    if order_data != "NOT ORDER":
-        if not os.path.exists(bot_config['path_order_dump']):
-            with open(bot_config['path_order_dump'], 'w') as file:
-                json.dump({}, file)
-
-        try:
-            with open(bot_config['path_order_dump'], 'r') as file:
-                existing_data = json.load(file)
-        except Exception as e:
-            print(f"An error occurred while loading JSON: {e}")
-            existing_data = {}
+    if ONLINE_UPDATES and base_model:
+        update_online_model(bot_name, bot_config, base_model)
 
-        t.sleep(60 * get_interval_minutes(bot_config['parameters_model']['interval_time']) - 15)
+    if order_data != "NOT ORDER":
+        ttl_seconds = 60 * get_interval_minutes(bot_config['parameters_model']['interval_time']) - 15
 
         for order_id in order_data:
-            order_info = order_data[order_id]
-
-            status = check_status_order(token=TOKEN, account_id=account_id, order_id=order_id)
-
-            if status == "FILL":
-                if order_info['buy_or_sell'] == "BUY":
-                    bot_config['limitations_cash']['current_count_money'] -= order_info['price']
-                    bot_config['limitations_cash']['current_count_lot'] += bot_config['limitations_cash']['quantity']
-                    print(f'Исполнена покупка {order_id}')
-
-                if order_info['buy_or_sell'] == "SELL":
-                    bot_config['limitations_cash']['current_count_money'] += order_info['price']
-                    bot_config['limitations_cash']['current_count_lot'] -= bot_config['limitations_cash']['quantity']
-                    print(f'Исполнена продажа {order_id}')
-
-            else:
-                cansel_order(token=TOKEN, account_id=account_id, order_id=order_id)
-                print(f'Отменена заявка {order_id}')
-                status = "CANCELLED"
-
-            order_info['status'] = status
+            order_tracker.track(bot_name=bot_name,
+                                order_id=order_id,
+                                order_info=order_data[order_id],
+                                ttl_seconds=ttl_seconds)
+
+        if warm_start_snapshots is not None:
+            warm_start_snapshots.request()
+
+
+def update_online_model(bot_name, bot_config, base_model):
+    """
+    Дообучение модели бота на свечах, закрывшихся после прошлого тика.
+    """
+    parameters_model = bot_config['parameters_model']
+    interval_ns = 60 * get_interval_minutes(parameters_model['interval_time']) * 10**9
+
+    candles = get_candle_store(figi=parameters_model['figi'],
+                               interval_time=parameters_model['interval_time']).window(WARM_UP_ROWS)
+    candles = candles[candles['time'] + interval_ns <= clock.now_ns()]
+    features = get_bot_features(parameters_model)
+    warm_up = get_pipeline(features).warm_up
+
+    try:
+        with metrics.stage('online_update'):
+            data = get_feature_values(candles=candles,
+                                      features=features,
+                                      figi=parameters_model['figi'],
+                                      interval_time=parameters_model['interval_time'])
+            online_models.update(bot_name=bot_name,
+                                 path_model=parameters_model['path_model'],
+                                 base_model=base_model,
+                                 times=candles['time'][warm_up:],
+                                 data=data[warm_up:])
+    except Exception as e:
+        print(f'Online model {bot_name} not update. Error: {e}')
+
+
+def on_order_done(bot_name, order_id, order_info, status):
+    start_config = config_store.get_config(bot_name)
+
+    def apply_fill(state):
+        quantity = start_config['limitations_cash']['quantity']
+
+        if order_info['buy_or_sell'] == "BUY":
+            state['current_count_money'] -= order_info['price']
+            state['current_count_lot'] += quantity
+            print(f'Исполнена покупка {order_id}')
+
+        if order_info['buy_or_sell'] == "SELL":
+            state['current_count_money'] += order_info['price']
+            state['current_count_lot'] -= quantity
+            print(f'Исполнена продажа {order_id}')
+
+    try:
+        get_order_journal(start_config['path_order_dump']).append(order_id, order_info)
+    except Exception as e:
+        print(f'Новые ордера не добавлены: {e}')
+
+    if status == "FILL":
+        new_config = config_store.update_state(bot_name, apply_fill)
 
-            try:
-                existing_data[order_id] = order_info
-            except Exception as e:
-                print(f'Error occurred while adding order: {e}')
+        print(f'start_config: {start_config}')
+        print(f'new_config: {new_config}')
 
-        try:
-            with open(bot_config['path_order_dump'], 'w') as file:
-                json.dump(existing_data, file, indent=4)
-        except Exception as e:
-            print(f'Новые ордера не добавлены: {e}')
 
-        print(f'start_config: {start_config}')
-        print(f'new_config: {bot_config}')
+order_tracker = OrderTracker(token=TOKEN, account_id=account_id, on_order_done=on_order_done)
+config_store = None
+online_models = OnlineModels()
+warm_start_snapshots = None
+retraining_lock = threading.Lock()
 
-        try:
-            with open(bot_config['path_to_config'], 'w') as config_file:
-                json.dump(bot_config, config_file, indent=4)
-        except Exception as e:
-            print(f'Новый конфиг не сохранён: {e}')
 
 def get_config_bots():
-    with open('path_to_config_bots.json', 'r') as file:
-        config_paths = json.load(file)
+    return config_store.get_config_bots()
 
-    config_bots = {}
 
-    for bot_name, config_path in config_paths.items():
-        with open(config_path, 'r') as file:
-            bot_config = json.load(file)
-            config_bots[bot_name] = bot_config
+def is_weekday():
+    return is_trading_day(datetime.now())
 
-    return config_bots
 
+def exchange_open():
+    return is_trading_time(datetime.now())
 
-def is_weekday():
-    today = datetime.now().weekday()
-    return today < 5
 
+def retraining_models():
+    if not retraining_lock.acquire(blocking=False):
+        print('Retraining is still running, skip')
+        return
 
-def exchange_open():
-    current_time = datetime.now().time()
+    try:
+        config_bots = get_config_bots()
+        queue = RetrainingQueue(run_job=retraining_one_model, workers=SEARCH_WORKERS)
 
-    if time(10, 10) <= current_time < time(14):
-        return True
-    elif time(14, 10) <= current_time < time(18, 45):
-        return True
-    elif time(19, 10) <= current_time < time(23, 50):
-        return True
+        for bot_name in config_bots:
+            queue.put(bot_name, config_bots[bot_name])
 
-    return False
+        queue.run(deadline=next_session_start(datetime.now()) - DEADLINE_MARGIN)
+    finally:
+        retraining_lock.release()
 
 
-def now_night():
-    current_time = datetime.now().time()
+def retraining_one_model(bot_name, bot_config, budget_seconds=None):
+    parameters_model = bot_config["parameters_model"]
 
-    if time(23, 59) == current_time:
-        return True
+    if RETRAINING_BUDGET_SECONDS is not None:
+        budget_seconds = min(budget_seconds, RETRAINING_BUDGET_SECONDS) if budget_seconds is not None \
+            else RETRAINING_BUDGET_SECONDS
 
-    return False
+    new_parameters_model = retraining_model(parameters_model,
+                                            workers=SEARCH_WORKERS,
+                                            strategy=SEARCH_STRATEGY,
+                                            budget_seconds=budget_seconds,
+                                            checkpoint_path=get_checkpoint_path(bot_name),
+                                            validate=True)
+    if new_parameters_model is None:
+        return
 
+    bot_config['parameters_model'] = new_parameters_model
 
-def retraining_models():
-    config_bots = get_config_bots()
+    def apply_retraining(config):
+        config['parameters_model'] = bot_config['parameters_model']
 
-    with ThreadPoolExecutor() as executor:
-        model_args = [(bot_name, config_bots[bot_name]) for bot_name in config_bots]
-        executor.map(retraining_one_model, model_args)
+        config['limitations_technical']['model_accuracy']         = bot_config['parameters_model']['mean_relative_error']
+        config['limitations_technical']['num_values_for_predict'] = bot_config['parameters_model']['num_values_for_predict']
+        config['limitations_technical']['num_predictions']        = bot_config['parameters_model']['num_predictions']
 
+    config_store.update_config(bot_name, apply_retraining)
 
-def retraining_one_model(args):
-    bot_name, bot_config = args
-    parameters_model = bot_config["parameters_model"]
 
-    bot_config['parameters_model'] = retraining_model(parameters_model)
+def run_shards():
+    from shard_runtime import ShardSupervisor
 
-    bot_config['limitations_technical']['model_accuracy']         = bot_config['parameters_model']['mean_relative_error']
-    bot_config['limitations_technical']['num_values_for_predict'] = bot_config['parameters_model']['num_values_for_predict']
-    bot_config['limitations_technical']['num_predictions']        = bot_config['parameters_model']['num_predictions']
+    if METRICS_ENABLED:
+        metrics.enable(port=METRICS_PORT)
 
-    with open(bot_config['path_to_config'], 'w') as config_file:
-        json.dump(bot_config, config_file, indent=4)
+    ShardSupervisor(PATH_TO_CONFIG_BOTS, count_shards=SHARDS, pin_cores=PIN_CORES).run()
 
 
 if __name__ == "__main__":
 
 
-    main()
+    if SHARDS > 1:
+        run_shards()
+    else:
+        main()
     # t.sleep(3)
     # config_bots = get_config_bots()
     #
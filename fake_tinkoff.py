@@ -0,0 +1,494 @@
+import zlib
+import random
+import threading
+import itertools
+import tempfile
+import time as t
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+from grpc import StatusCode
+
+from candle_store import CANDLE_DTYPE, set_candle_store_root
+import clock
+
+
+MINUTE_NS = 60 * 10**9
+
+
+class FakeRequestError(Exception):
+    def __init__(self, code, details: str = ''):
+        super().__init__(f'{code}: {details}')
+        self.code = code
+        self.details = details
+
+
+class FakeStatus:
+    """
+    Статус заявки, str() которого выглядит как у OrderExecutionReportStatus (check_status_order берёт часть после '_').
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __str__(self):
+        return f'OrderExecutionReportStatus.EXECUTION_REPORT_STATUS_{self.name}'
+
+
+def to_quotation(value: float):
+    units = int(np.floor(value))
+    return SimpleNamespace(units=units, nano=int(round((value - units) * 10**9)))
+
+
+def from_quotation(quotation) -> float:
+    if isinstance(quotation, (int, float)):
+        return float(quotation)
+    return quotation.units + quotation.nano / 10**9
+
+
+def to_datetime(time_ns: int):
+    return datetime.fromtimestamp(time_ns / 10**9, tz=timezone.utc)
+
+
+def to_ns(date) -> int:
+    return int(date.timestamp()) * 10**9
+
+
+def interval_to_minutes(interval) -> int:
+    name = str(interval).split('.')[-1]
+    minutes = {'1_MIN': 1, '2_MIN': 2, '3_MIN': 3, '5_MIN': 5, '10_MIN': 10, '15_MIN': 15, '30_MIN': 30,
+               'HOUR': 60, '2_HOUR': 120, '4_HOUR': 240, 'DAY': 1440}
+    for suffix, value in minutes.items():
+        if name.endswith(suffix):
+            return value
+    raise ValueError(f'Unknown interval {interval}')
+
+
+def aggregate_candles(candles, interval_minutes: int):
+    if interval_minutes == 1 or len(candles) == 0:
+        return candles
+
+    buckets = candles['time'] - candles['time'] % (interval_minutes * MINUTE_NS)
+    starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+
+    result = np.zeros(len(starts), dtype=CANDLE_DTYPE)
+    result['time'] = buckets[starts]
+    result['open'] = candles['open'][starts]
+    result['close'] = candles['close'][np.r_[starts[1:] - 1, len(candles) - 1]]
+    result['high'] = np.maximum.reduceat(candles['high'], starts)
+    result['low'] = np.minimum.reduceat(candles['low'], starts)
+    result['volume'] = np.add.reduceat(candles['volume'], starts)
+    return result
+
+
+class SyntheticMarket:
+    """
+    Детерминированные минутные свечи: случайное блуждание цены по каждому figi от seed.
+    """
+
+    def __init__(self, seed: int = 0, start_price: float = 0.0225, volatility: float = 2e-4,
+                 start_time_ns: int = None, history_minutes: int = 60 * 24 * 30):
+        self.seed = seed
+        self.start_price = start_price
+        self.volatility = volatility
+        now_ns = clock.now_ns()
+        self.start_time_ns = start_time_ns or (now_ns - now_ns % MINUTE_NS - history_minutes * MINUTE_NS)
+        self.lock = threading.Lock()
+        self._candles = {}
+
+    def _generate(self, figi: str, count: int):
+        rng = np.random.default_rng([self.seed, zlib.crc32(figi.encode())])
+        returns = rng.normal(0, self.volatility, (count, 4))
+        close = self.start_price * np.exp(np.cumsum(returns[:, 0]))
+        open_ = np.r_[self.start_price, close[:-1]]
+
+        candles = np.zeros(count, dtype=CANDLE_DTYPE)
+        candles['time'] = self.start_time_ns + np.arange(count) * MINUTE_NS
+        candles['open'] = open_
+        candles['close'] = close
+        candles['high'] = np.maximum(open_, close) * (1 + np.abs(returns[:, 1]))
+        candles['low'] = np.minimum(open_, close) * (1 - np.abs(returns[:, 2]))
+        candles['volume'] = (np.abs(returns[:, 3]) / self.volatility * 1000).astype(np.int64) + 1
+        return candles
+
+    def minute_candles(self, figi: str, until_ns: int = None):
+        until_ns = until_ns or clock.now_ns()
+        count = max(int((until_ns - self.start_time_ns) // MINUTE_NS) + 1, 1)
+
+        with self.lock:
+            candles = self._candles.get(figi)
+            if candles is None or len(candles) < count:
+                candles = self._generate(figi, max(count, 2 * len(candles) if candles is not None else count))
+                self._candles[figi] = candles
+
+        return candles[:count]
+
+    def get_candles(self, figi: str, from_ns: int, to_ns: int, interval_minutes: int):
+        candles = self.minute_candles(figi, to_ns)
+        candles = candles[candles['time'] >= from_ns - from_ns % (interval_minutes * MINUTE_NS)]
+        return aggregate_candles(candles, interval_minutes)
+
+
+class RecordedMarket:
+    """
+    Свечи из записанных массивов CANDLE_DTYPE (например, из CandleStore), по ключу figi.
+    """
+
+    def __init__(self, candles_by_figi, interval_minutes: int = 1):
+        self.candles_by_figi = candles_by_figi
+        self.interval_minutes = interval_minutes
+
+    def minute_candles(self, figi: str, until_ns: int = None):
+        candles = self.candles_by_figi[figi]
+        return candles[candles['time'] <= (until_ns or clock.now_ns())]
+
+    def get_candles(self, figi: str, from_ns: int, to_ns: int, interval_minutes: int):
+        candles = self.minute_candles(figi, to_ns)
+        candles = candles[candles['time'] >= from_ns]
+        return aggregate_candles(candles, max(interval_minutes // self.interval_minutes, 1))
+
+
+class TokenBucket:
+    def __init__(self, rate_per_minute: float):
+        self.rate = rate_per_minute / 60
+        self.capacity = max(rate_per_minute, 1)
+        self.tokens = self.capacity
+        self.updated = t.monotonic()
+        self.lock = threading.Lock()
+
+    def take(self) -> bool:
+        with self.lock:
+            now = t.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            return False
+
+
+class FakeServer:
+    """
+    Локальная замена брокера: свечи из market, заявки с моделью исполнения по пересечению цены,
+    искусственные задержка, лимиты запросов и ошибки.
+
+    :param latency: средняя задержка ответа, секунды
+    :param latency_jitter: случайная добавка к задержке, секунды
+    :param rate_limits: {имя метода: запросов в минуту}
+    :param error_rate: вероятность ответа UNAVAILABLE
+    :param fill_probability: вероятность исполнения заявки, если цена её пересекла
+    """
+
+    def __init__(self, market=None, latency: float = 0.0, latency_jitter: float = 0.0, rate_limits=None,
+                 error_rate: float = 0.0, fill_probability: float = 1.0, seed: int = 0):
+        self.market = market or SyntheticMarket(seed=seed)
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.rate_limits = {name: TokenBucket(rate) for name, rate in (rate_limits or {}).items()}
+        self.error_rate = error_rate
+        self.fill_probability = fill_probability
+
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.orders = {}
+        self.order_ids = itertools.count(1)
+        self.calls = {}
+        self.trade_listeners = []
+
+    def call(self, method: str):
+        with self.lock:
+            self.calls[method] = self.calls.get(method, 0) + 1
+            delay = self.latency + self.random.random() * self.latency_jitter
+            failed = self.random.random() < self.error_rate
+
+        if delay:
+            t.sleep(delay)
+
+        bucket = self.rate_limits.get(method)
+        if bucket is not None and not bucket.take():
+            raise FakeRequestError(StatusCode.RESOURCE_EXHAUSTED, f'{method} rate limit')
+        if failed:
+            raise FakeRequestError(StatusCode.UNAVAILABLE, f'{method} injected error')
+
+    def _update_order(self, order):
+        if order['status'] != 'NEW':
+            return
+
+        candles = self.market.minute_candles(order['figi'])
+        candles = candles[candles['time'] >= order['time_ns']]
+        if len(candles) == 0:
+            return
+
+        if order['direction'] == 'BUY':
+            crossed = bool(np.any(candles['low'] <= order['price']))
+        else:
+            crossed = bool(np.any(candles['high'] >= order['price']))
+
+        if crossed and order['fill_roll'] < self.fill_probability:
+            order['status'] = 'FILL'
+            for listener in list(self.trade_listeners):
+                listener(order['order_id'])
+
+    def post_order(self, figi: str, quantity: int, price, direction, account_id: str, order_type):
+        now_ns = clock.now_ns()
+
+        with self.lock:
+            order_id = str(next(self.order_ids))
+            self.orders[order_id] = {
+                'order_id': order_id,
+                'account_id': account_id,
+                'figi': figi,
+                'quantity': quantity,
+                'price': from_quotation(price),
+                'direction': 'BUY' if 'BUY' in str(direction) else 'SELL',
+                'order_type': str(order_type),
+                'time_ns': now_ns - now_ns % MINUTE_NS,
+                'status': 'NEW',
+                'fill_roll': self.random.random()
+            }
+        return order_id
+
+    def order_state(self, account_id: str, order_id: str):
+        with self.lock:
+            order = self.orders.get(order_id)
+            if order is None or order['account_id'] != account_id:
+                raise FakeRequestError(StatusCode.NOT_FOUND, f'order {order_id} not found')
+            self._update_order(order)
+            return order['status']
+
+    def cancel_order(self, account_id: str, order_id: str):
+        with self.lock:
+            order = self.orders.get(order_id)
+            if order is None or order['account_id'] != account_id:
+                raise FakeRequestError(StatusCode.NOT_FOUND, f'order {order_id} not found')
+            self._update_order(order)
+            if order['status'] != 'NEW':
+                raise FakeRequestError(StatusCode.FAILED_PRECONDITION, f'order {order_id} is {order["status"]}')
+            order['status'] = 'CANCELLED'
+
+    def active_orders(self, account_id: str):
+        with self.lock:
+            active = []
+            for order in self.orders.values():
+                if order['account_id'] == account_id:
+                    self._update_order(order)
+                    if order['status'] == 'NEW':
+                        active.append(order['order_id'])
+            return active
+
+
+class _FakeMarketDataStream:
+    def __init__(self, server: FakeServer, poll_interval: float):
+        self.server = server
+        self.poll_interval = poll_interval
+        self.candle_figis = set()
+        self.last_price_figis = set()
+        self._stop = threading.Event()
+        self.candles = SimpleNamespace(subscribe=lambda instruments: self.candle_figis.update(
+            instrument.figi for instrument in instruments))
+        self.last_price = SimpleNamespace(subscribe=lambda instruments: self.last_price_figis.update(
+            instrument.figi for instrument in instruments))
+
+    def stop(self):
+        self._stop.set()
+
+    def __iter__(self):
+        while not self._stop.is_set():
+            now_ns = clock.now_ns()
+            for figi in sorted(self.candle_figis | self.last_price_figis):
+                candle = self.server.market.minute_candles(figi, now_ns)[-1]
+
+                if figi in self.candle_figis:
+                    yield SimpleNamespace(candle=SimpleNamespace(figi=figi,
+                                                                 time=to_datetime(int(candle['time'])),
+                                                                 open=to_quotation(candle['open']),
+                                                                 close=to_quotation(candle['close']),
+                                                                 high=to_quotation(candle['high']),
+                                                                 low=to_quotation(candle['low']),
+                                                                 volume=int(candle['volume'])),
+                                          last_price=None)
+
+                if figi in self.last_price_figis:
+                    yield SimpleNamespace(candle=None,
+                                          last_price=SimpleNamespace(figi=figi, price=to_quotation(candle['close'])))
+
+            self._stop.wait(self.poll_interval)
+
+
+class FakeServices:
+    """
+    Подмножество tinkoff.invest.Services, которое использует бот.
+    """
+
+    def __init__(self, server: FakeServer, stream_poll_interval: float = 1.0):
+        self.server = server
+        self.stream_poll_interval = stream_poll_interval
+
+        self.users = SimpleNamespace(get_accounts=self._get_accounts)
+        self.orders = SimpleNamespace(post_order=self._post_order,
+                                      get_order_state=self._get_order_state,
+                                      cancel_order=self._cancel_order,
+                                      get_orders=self._get_orders)
+        self.market_data = SimpleNamespace(get_candles=self._get_candles)
+        self.orders_stream = SimpleNamespace(trades_stream=self._trades_stream)
+
+    def _get_accounts(self):
+        self.server.call('get_accounts')
+        return SimpleNamespace(accounts=[])
+
+    def _candles_response(self, figi, from_, to, interval):
+        candles = self.server.market.get_candles(figi=figi,
+                                                 from_ns=to_ns(from_),
+                                                 to_ns=to_ns(to) if to else clock.now_ns(),
+                                                 interval_minutes=interval_to_minutes(interval))
+        return [SimpleNamespace(time=to_datetime(int(candle['time'])),
+                                open=to_quotation(candle['open']),
+                                close=to_quotation(candle['close']),
+                                high=to_quotation(candle['high']),
+                                low=to_quotation(candle['low']),
+                                volume=int(candle['volume']),
+                                is_complete=True) for candle in candles]
+
+    def get_all_candles(self, figi: str, from_, interval, to=None, **kwargs):
+        self.server.call('get_candles')
+        yield from self._candles_response(figi, from_, to, interval)
+
+    def _get_candles(self, figi: str, from_, to, interval, **kwargs):
+        self.server.call('get_candles')
+        return SimpleNamespace(candles=self._candles_response(figi, from_, to, interval))
+
+    def _post_order(self, figi: str, quantity: int, price, direction, account_id: str, order_type, **kwargs):
+        self.server.call('post_order')
+        return SimpleNamespace(order_id=self.server.post_order(figi=figi, quantity=quantity, price=price,
+                                                               direction=direction, account_id=account_id,
+                                                               order_type=order_type))
+
+    def _get_order_state(self, account_id: str, order_id: str):
+        self.server.call('get_order_state')
+        status = self.server.order_state(account_id=account_id, order_id=order_id)
+        return SimpleNamespace(order_id=order_id, execution_report_status=FakeStatus(status))
+
+    def _cancel_order(self, account_id: str, order_id: str):
+        self.server.call('cancel_order')
+        self.server.cancel_order(account_id=account_id, order_id=order_id)
+        return SimpleNamespace(time=datetime.now(timezone.utc))
+
+    def _get_orders(self, account_id: str):
+        self.server.call('get_orders')
+        return SimpleNamespace(orders=[SimpleNamespace(order_id=order_id)
+                                       for order_id in self.server.active_orders(account_id)])
+
+    def create_market_data_stream(self):
+        return _FakeMarketDataStream(self.server, self.stream_poll_interval)
+
+    def _trades_stream(self, accounts):
+        events = []
+        event = threading.Event()
+
+        def listener(order_id):
+            events.append(order_id)
+            event.set()
+
+        self.server.trade_listeners.append(listener)
+        try:
+            while True:
+                event.wait(self.stream_poll_interval)
+                event.clear()
+                with self.server.lock:
+                    for order in self.server.orders.values():
+                        if order['account_id'] in accounts:
+                            self.server._update_order(order)
+                while events:
+                    yield SimpleNamespace(order_trades=SimpleNamespace(order_id=events.pop(0)), ping=None)
+        finally:
+            self.server.trade_listeners.remove(listener)
+
+
+class FakeClient:
+    """
+    Замена tinkoff.invest.Client: `with FakeClient(token) as client` отдаёт FakeServices общего FakeServer.
+    """
+
+    server = None
+
+    def __init__(self, token: str, **kwargs):
+        self.token = token
+
+    def __enter__(self):
+        if FakeClient.server is None:
+            FakeClient.server = FakeServer()
+        return FakeServices(FakeClient.server)
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return False
+
+
+def install_fake_client(server: FakeServer = None) -> FakeServer:
+    """
+    Направляет все запросы tinkoff_api_request (через client_pool) в FakeServer.
+    """
+    from client_pool import set_client_factory
+
+    FakeClient.server = server or FakeServer()
+    set_client_factory(FakeClient)
+    return FakeClient.server
+
+
+def run_load_test(num_bots: int = 100, ticks: int = 3, latency: float = 0.02, error_rate: float = 0.0,
+                  rate_limits=None, workers: int = None):
+    """
+    Нагрузочный тест: num_bots ботов (копии первого конфига на своих figi) делают ticks тиков
+    через control_module.start_bot против FakeServer. Свечи пишутся во временный каталог,
+    а не в data_candles. Возвращает перцентили времени тика.
+    """
+    import copy
+    import control_module
+    from config_store import ConfigStore
+
+    server = install_fake_client(FakeServer(latency=latency, latency_jitter=latency, error_rate=error_rate,
+                                            rate_limits=rate_limits))
+
+    base_config = next(iter(ConfigStore().get_config_bots().values()))
+    config_bots = {}
+    for n in range(num_bots):
+        bot_config = copy.deepcopy(base_config)
+        bot_config['parameters_model']['figi'] = f'FAKE{n:06d}'
+        config_bots[f'fake_bot_{n}'] = bot_config
+
+    latencies = []
+    lock = threading.Lock()
+
+    def run_tick(bot_name):
+        start = t.perf_counter()
+        try:
+            control_module.start_bot(bot_name, config_bots)
+        except Exception as e:
+            print(f'An error occurred in thread for bot {bot_name}: {e}')
+        with lock:
+            latencies.append(t.perf_counter() - start)
+
+    with tempfile.TemporaryDirectory() as root:
+        set_candle_store_root(root)
+        try:
+            with ThreadPoolExecutor(max_workers=workers or num_bots) as executor:
+                for _ in range(ticks):
+                    list(executor.map(run_tick, config_bots))
+        finally:
+            set_candle_store_root()
+
+    latencies = np.array(latencies)
+    return {
+        "bots": num_bots,
+        "ticks": ticks,
+        "p50": float(np.percentile(latencies, 50)),
+        "p95": float(np.percentile(latencies, 95)),
+        "p99": float(np.percentile(latencies, 99)),
+        "max": float(latencies.max()),
+        "calls": dict(server.calls)
+    }
+
+
+if __name__ == "__main__":
+    print(run_load_test())
@@ -0,0 +1,532 @@
+import abc
+import math
+import threading
+from collections import deque
+from functools import lru_cache
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from candle_store import PRICE_FIELDS, get_candle_store, get_values
+
+
+DEFAULT_FEATURES = PRICE_FIELDS
+CANDLE_FIELDS = PRICE_FIELDS + ('volume',)
+
+CACHE_CAPACITY = 4096
+MAX_INCREMENTAL_ROWS = 256
+# Доля начального значения, которая остаётся в сглаженном признаке после warm_up свечей.
+WARM_UP_RESIDUAL = 0.01
+# Наибольший множитель (1 - alpha)^-n внутри одного блока smooth.
+SMOOTH_BLOCK_SCALE = 1e100
+
+
+class Feature(abc.ABC):
+    """
+    Признак модели. compute считает значения векторно по истории свечей (массив CANDLE_DTYPE или DataFrame),
+    get_state строит по ней состояние, update / peek считают значение на новой свече за O(1)
+    (update сохраняет свечу в состоянии, peek - нет: последняя свеча может быть ещё не закрыта).
+    Первые warm_up значений неустоявшиеся (NaN или зависят от начала истории) и в модель не идут.
+    """
+
+    name = ''
+    warm_up = 0
+
+    @abc.abstractmethod
+    def compute(self, candles):
+        pass
+
+    @abc.abstractmethod
+    def get_state(self, candles, values):
+        pass
+
+    @abc.abstractmethod
+    def update(self, state, candle) -> float:
+        pass
+
+    @abc.abstractmethod
+    def peek(self, state, candle) -> float:
+        pass
+
+
+def get_field(candles, field: str):
+    return np.asarray(candles[field], dtype=np.float64)
+
+
+def get_log_returns(close):
+    returns = np.full(len(close), np.nan)
+    returns[1:] = np.log(close[1:] / close[:-1])
+    return returns
+
+
+def get_true_range(candles):
+    high, low, close = get_field(candles, 'high'), get_field(candles, 'low'), get_field(candles, 'close')
+    true_range = high - low
+    true_range[1:] = np.maximum.reduce([true_range[1:], np.abs(high[1:] - close[:-1]), np.abs(low[1:] - close[:-1])])
+    return true_range
+
+
+def get_smoothing_warm_up(alpha: float) -> int:
+    """
+    Число свечей, после которого вес начального значения в smooth меньше WARM_UP_RESIDUAL.
+    """
+    if alpha >= 1:
+        return 0
+    return math.ceil(math.log(WARM_UP_RESIDUAL) / math.log(1 - alpha))
+
+
+def smooth(values, alpha: float):
+    """
+    Экспоненциальное сглаживание y[t] = alpha * x[t] + (1 - alpha) * y[t - 1], y[0] = x[0].
+    Внутри блока рекурсия раскрывается в накопленную сумму: z[t] = y[t] / (1 - alpha)^(t + 1)
+    растёт на alpha * x[t] / (1 - alpha)^(t + 1). Длина блока ограничена SMOOTH_BLOCK_SCALE.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    if len(values) == 0 or alpha >= 1:
+        return values.copy()
+
+    decay = 1 - alpha
+    block = min(max(int(math.log(SMOOTH_BLOCK_SCALE) / -math.log(decay)), 1), len(values))
+    scale = decay ** -np.arange(1, block + 1, dtype=np.float64)
+
+    result = np.empty(len(values))
+    previous = values[0]
+    for start in range(0, len(values), block):
+        chunk = values[start:start + block]
+        chunk_scale = scale[:len(chunk)]
+        result[start:start + len(chunk)] = (previous + alpha * np.cumsum(chunk * chunk_scale)) / chunk_scale
+        previous = result[start + len(chunk) - 1]
+    return result
+
+
+class RollingWindow:
+    """
+    Последние size значений с суммой и суммой квадратов для среднего и стандартного отклонения за O(1).
+    """
+
+    def __init__(self, size: int, values=()):
+        self.values = deque(maxlen=size)
+        self.sum = 0.0
+        self.sum_squares = 0.0
+        for value in values:
+            self.push(value)
+
+    def _shifted(self, value):
+        total, total_squares, count = self.sum + value, self.sum_squares + value**2, len(self.values) + 1
+        if len(self.values) == self.values.maxlen:
+            total -= self.values[0]
+            total_squares -= self.values[0]**2
+            count -= 1
+        return total, total_squares, count
+
+    def push(self, value: float):
+        self.sum, self.sum_squares, _ = self._shifted(value)
+        self.values.append(value)
+
+    def stats(self, value: float):
+        """
+        (число значений, среднее, стандартное отклонение) окна, если добавить value.
+        """
+        total, total_squares, count = self._shifted(value)
+        mean = total / count
+        return count, mean, math.sqrt(max(total_squares / count - mean**2, 0.0))
+
+
+class Price(Feature):
+    def __init__(self, field: str):
+        self.field = field
+        self.name = field
+
+    def compute(self, candles):
+        return get_field(candles, self.field)
+
+    def get_state(self, candles, values):
+        return None
+
+    def update(self, state, candle) -> float:
+        return float(candle[self.field])
+
+    def peek(self, state, candle) -> float:
+        return float(candle[self.field])
+
+
+class LogReturn(Feature):
+    name = 'log_return'
+    warm_up = 1
+
+    def compute(self, candles):
+        return get_log_returns(get_field(candles, 'close'))
+
+    def get_state(self, candles, values):
+        return {'close': float(candles['close'][-1]) if len(candles) else None}
+
+    def peek(self, state, candle) -> float:
+        return math.log(candle['close'] / state['close']) if state['close'] else np.nan
+
+    def update(self, state, candle) -> float:
+        value = self.peek(state, candle)
+        state['close'] = float(candle['close'])
+        return value
+
+
+class EMA(Feature):
+    def __init__(self, span: int):
+        self.alpha = 2 / (span + 1)
+        self.name = f'ema_{span}'
+        self.warm_up = get_smoothing_warm_up(self.alpha)
+
+    def compute(self, candles):
+        return smooth(get_field(candles, 'close'), self.alpha)
+
+    def get_state(self, candles, values):
+        return {'value': float(values[-1]) if len(values) else None}
+
+    def peek(self, state, candle) -> float:
+        if state['value'] is None:
+            return float(candle['close'])
+        return self.alpha * candle['close'] + (1 - self.alpha) * state['value']
+
+    def update(self, state, candle) -> float:
+        state['value'] = self.peek(state, candle)
+        return state['value']
+
+
+class ATR(Feature):
+    """
+    Average true range со сглаживанием Уайлдера (alpha = 1 / period).
+    """
+
+    def __init__(self, period: int):
+        self.alpha = 1 / period
+        self.name = f'atr_{period}'
+        self.warm_up = get_smoothing_warm_up(self.alpha)
+
+    def compute(self, candles):
+        return smooth(get_true_range(candles), self.alpha)
+
+    def get_state(self, candles, values):
+        if not len(candles):
+            return {'value': None, 'close': None}
+        return {'value': float(values[-1]), 'close': float(candles['close'][-1])}
+
+    def peek(self, state, candle) -> float:
+        true_range = candle['high'] - candle['low']
+        if state['close'] is None:
+            return float(true_range)
+
+        true_range = max(true_range, abs(candle['high'] - state['close']), abs(candle['low'] - state['close']))
+        return self.alpha * true_range + (1 - self.alpha) * state['value']
+
+    def update(self, state, candle) -> float:
+        state['value'] = self.peek(state, candle)
+        state['close'] = float(candle['close'])
+        return state['value']
+
+
+class RollingVolatility(Feature):
+    """
+    Стандартное отклонение логарифмических доходностей close за window последних свечей.
+    """
+
+    def __init__(self, window: int):
+        self.window = window
+        self.name = f'volatility_{window}'
+        self.warm_up = window
+
+    def compute(self, candles):
+        returns = get_log_returns(get_field(candles, 'close'))
+        values = np.full(len(returns), np.nan)
+        if len(returns) > self.window:
+            values[self.window:] = sliding_window_view(returns[1:], self.window).std(axis=1)
+        return values
+
+    def get_state(self, candles, values):
+        returns = get_log_returns(get_field(candles[-self.window - 1:], 'close'))[1:]
+        return {'close': float(candles['close'][-1]) if len(candles) else None,
+                'returns': RollingWindow(self.window, returns)}
+
+    def _return(self, state, candle):
+        return math.log(candle['close'] / state['close']) if state['close'] else None
+
+    def peek(self, state, candle) -> float:
+        value = self._return(state, candle)
+        if value is None:
+            return np.nan
+        count, _, std = state['returns'].stats(value)
+        return std if count == self.window else np.nan
+
+    def update(self, state, candle) -> float:
+        result = self.peek(state, candle)
+        value = self._return(state, candle)
+        if value is not None:
+            state['returns'].push(value)
+        state['close'] = float(candle['close'])
+        return result
+
+
+class VolumeZScore(Feature):
+    """
+    Отклонение объёма свечи от среднего за window свечей (включая текущую) в стандартных отклонениях.
+    """
+
+    def __init__(self, window: int):
+        self.window = window
+        self.name = f'volume_zscore_{window}'
+        self.warm_up = window - 1
+
+    def compute(self, candles):
+        volume = get_field(candles, 'volume')
+        values = np.full(len(volume), np.nan)
+        if len(volume) >= self.window:
+            windows = sliding_window_view(volume, self.window)
+            mean, std = windows.mean(axis=1), windows.std(axis=1)
+            deviation = volume[self.window - 1:] - mean
+            values[self.window - 1:] = np.divide(deviation, std, out=np.zeros_like(deviation), where=std > 0)
+        return values
+
+    def get_state(self, candles, values):
+        return {'volume': RollingWindow(self.window, get_field(candles[-(self.window - 1):], 'volume')
+                                        if self.window > 1 else ())}
+
+    def peek(self, state, candle) -> float:
+        count, mean, std = state['volume'].stats(float(candle['volume']))
+        if count < self.window:
+            return np.nan
+        return (candle['volume'] - mean) / std if std > 0 else 0.0
+
+    def update(self, state, candle) -> float:
+        value = self.peek(state, candle)
+        state['volume'].push(float(candle['volume']))
+        return value
+
+
+FEATURES = {
+    'log_return': LogReturn,
+    'ema': EMA,
+    'atr': ATR,
+    'volatility': RollingVolatility,
+    'volume_zscore': VolumeZScore,
+}
+
+
+def register_feature(name: str, feature_class):
+    """
+    Добавляет тип признака: в конфиге он задаётся как name или name_<параметр>.
+    """
+    FEATURES[name] = feature_class
+
+
+def parse_feature(spec: str) -> Feature:
+    """
+    'close' -> Price('close'), 'log_return' -> LogReturn(), 'ema_20' -> EMA(20), 'volume_zscore_50' -> VolumeZScore(50).
+    """
+    if spec in CANDLE_FIELDS:
+        return Price(spec)
+    if spec in FEATURES:
+        return FEATURES[spec]()
+
+    name, _, parameter = spec.rpartition('_')
+    if name in FEATURES and parameter.isdigit():
+        return FEATURES[name](int(parameter))
+
+    raise ValueError(f'Unknown feature {spec}')
+
+
+class FeaturePipeline:
+    """
+    Набор признаков модели в порядке столбцов. price_columns - столбцы цен (open, close, high, low):
+    по их прогнозу выставляются заявки и считается ошибка модели.
+    """
+
+    def __init__(self, features):
+        self.features = [parse_feature(feature) if isinstance(feature, str) else feature for feature in features]
+        self.names = tuple(feature.name for feature in self.features)
+        self.warm_up = max((feature.warm_up for feature in self.features), default=0)
+        self.is_raw = all(isinstance(feature, Price) for feature in self.features)
+        self.price_columns = [number for number, feature in enumerate(self.features)
+                              if isinstance(feature, Price) and feature.field in PRICE_FIELDS]
+        self.error_columns = self.price_columns or list(range(len(self.features)))
+
+    def compute(self, candles):
+        """
+        Векторный расчёт всех признаков по истории (n x k). Для одних полей свечи - get_values без копирования.
+        """
+        if self.is_raw and isinstance(candles, np.ndarray) and candles.dtype.names:
+            return get_values(candles, self.names)
+
+        return np.column_stack([feature.compute(candles) for feature in self.features]).reshape(len(candles),
+                                                                                               len(self.features))
+
+
+@lru_cache(maxsize=None)
+def get_pipeline(features=DEFAULT_FEATURES) -> FeaturePipeline:
+    return FeaturePipeline(tuple(features))
+
+
+def get_bot_features(parameters_model):
+    return tuple(parameters_model.get('features', DEFAULT_FEATURES))
+
+
+class FeatureColumn:
+    """
+    Значения одного признака по закрытым свечам одного (figi, interval): время и значения последних
+    capacity свечей и состояние для пересчёта. Новые свечи добавляются через update за O(1);
+    если окно запроса не продолжает кэш, признак пересчитывается векторно - по всей истории
+    history(end_time) (хранилище свечей), как при переобучении, а если её нет или она не совпадает
+    с окном, то по самому окну.
+    """
+
+    def __init__(self, feature: Feature, capacity: int = CACHE_CAPACITY, history=None):
+        self.feature = feature
+        self.capacity = capacity
+        self.history = history
+        self.lock = threading.Lock()
+        self.times = np.empty(2 * capacity, dtype=np.int64)
+        self.values = np.empty(2 * capacity, dtype=np.float64)
+        self.count = 0
+        self.state = None
+
+    def _get_history(self, candles):
+        """
+        История инструмента, заканчивающаяся свечами candles, или сами candles.
+        """
+        if self.history is None or len(candles) == 0:
+            return candles
+
+        try:
+            history = self.history(int(candles['time'][-1]))
+        except Exception as e:
+            print(f'Feature {self.feature.name}: history not load. Error: {e}')
+            return candles
+
+        if len(history) < len(candles) or not np.array_equal(history['time'][-len(candles):], candles['time']):
+            return candles
+        return history
+
+    def _reset(self, candles):
+        candles = self._get_history(candles)
+        values = self.feature.compute(candles)
+        self.state = self.feature.get_state(candles, values)
+        self.count = min(len(candles), self.capacity)
+        self.times[:self.count] = candles['time'][len(candles) - self.count:]
+        self.values[:self.count] = values[len(values) - self.count:]
+
+    def _append(self, time: int, value: float):
+        if self.count == len(self.times):
+            self.times[:self.capacity] = self.times[self.count - self.capacity:self.count]
+            self.values[:self.capacity] = self.values[self.count - self.capacity:self.count]
+            self.count = self.capacity
+        self.times[self.count] = time
+        self.values[self.count] = value
+        self.count += 1
+
+    def _extend(self, candles, times) -> bool:
+        """
+        Добавляет закрытые свечи (все, кроме последней) новее кэша. False, если окно не продолжает кэш.
+        """
+        if self.count == 0 or times[0] < self.times[0] or times[0] > self.times[self.count - 1]:
+            return False
+
+        start = int(np.searchsorted(times, self.times[self.count - 1], side='right'))
+        if len(candles) - 1 - start > MAX_INCREMENTAL_ROWS:
+            return False
+
+        for row in range(start, len(candles) - 1):
+            self._append(int(times[row]), self.feature.update(self.state, candles[row]))
+        return True
+
+    def _find(self, times):
+        """
+        (начало в кэше, число свечей окна в кэше) или None, если кэш не совпадает с началом окна.
+        """
+        count_cached = int(np.searchsorted(times, self.times[self.count - 1], side='right')) if self.count else 0
+        if count_cached == 0:
+            return None
+
+        first = int(np.searchsorted(self.times[:self.count], times[0]))
+        if (first + count_cached > self.count or self.times[first] != times[0] or
+                self.times[first + count_cached - 1] != times[count_cached - 1]):
+            return None
+        return first, count_cached
+
+    def get(self, candles, count_rows: int):
+        """
+        Значения признака для последних count_rows свечей окна candles. Последняя свеча окна в кэш не попадает.
+        """
+        if len(candles) > self.capacity:
+            return self.feature.compute(candles)[-count_rows:]
+
+        times = candles['time']
+
+        with self.lock:
+            position = self._find(times) if self._extend(candles, times) else None
+            if position is None:
+                self._reset(candles[:-1])
+                position = self._find(times) or (self.count - (len(candles) - 1), len(candles) - 1)
+
+            first, count_cached = position
+            values = np.empty(len(candles))
+            values[:count_cached] = self.values[first:first + count_cached]
+            if count_cached < len(candles):
+                values[-1] = self.feature.peek(self.state, candles[-1])
+
+        return values[-count_rows:]
+
+
+class FeatureCache:
+    """
+    Признаки одного (figi, interval), общие для всех ботов инструмента: каждый признак считается один раз.
+    """
+
+    def __init__(self, capacity: int = CACHE_CAPACITY, history=None):
+        self.capacity = capacity
+        self.history = history
+        self.lock = threading.Lock()
+        self._columns = {}
+
+    def _get_column(self, feature: Feature) -> FeatureColumn:
+        with self.lock:
+            column = self._columns.get(feature.name)
+            if column is None:
+                column = self._columns[feature.name] = FeatureColumn(feature, self.capacity, self.history)
+            return column
+
+    def get(self, candles, pipeline: FeaturePipeline, count_rows: int = 0):
+        count_rows = count_rows if count_rows > 0 else len(candles)
+        if pipeline.is_raw or len(candles) == 0:
+            return pipeline.compute(candles[-count_rows:] if len(candles) else candles)
+
+        columns = []
+        for feature in pipeline.features:
+            if isinstance(feature, Price):
+                columns.append(feature.compute(candles[-count_rows:]))
+            else:
+                columns.append(self._get_column(feature).get(candles, count_rows))
+        return np.column_stack(columns)
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_feature_cache(figi: str, interval_time: str) -> FeatureCache:
+    key = (figi, interval_time)
+
+    with _caches_lock:
+        if key not in _caches:
+            _caches[key] = FeatureCache(history=lambda end_time: get_candle_store(figi, interval_time).until(end_time))
+        return _caches[key]
+
+
+def get_feature_values(candles, features=DEFAULT_FEATURES, figi: str = None, interval_time: str = None,
+                       count_rows: int = 0):
+    """
+    Матрица признаков features для последних count_rows свечей (0 - всех). С figi и interval_time значения
+    берутся из общего кэша инструмента, иначе считаются векторно по candles.
+    """
+    pipeline = get_pipeline(tuple(features))
+
+    if figi is None or interval_time is None:
+        values = pipeline.compute(candles)
+        return values[-count_rows:] if count_rows > 0 else values
+
+    return get_feature_cache(figi, interval_time).get(candles, pipeline, count_rows)
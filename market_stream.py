@@ -0,0 +1,235 @@
+import threading
+import numpy as np
+
+from tinkoff.invest import (
+    CandleInstrument,
+    LastPriceInstrument,
+    SubscriptionInterval
+)
+
+from candle_store import CANDLE_DTYPE, get_candle_store, read_only
+import clock
+from client_pool import api_client
+from tinkoff_api_request import datetime_to_ns, money_to_decimal
+
+
+RECONNECT_DELAY = 5
+CLOSE_CHECK_INTERVAL = 1
+CLOSE_GRACE_SECONDS = 2
+
+
+class CandleRingBuffer:
+    """
+    Кольцевой буфер свечей фиксированного размера. Каждая свеча пишется дважды (i и i + capacity),
+    поэтому последние N свечей всегда лежат подряд: view - срез без копирования, window - одно копирование
+    этого среза без склейки двух частей кольца.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.lock = threading.RLock()
+        self._data = np.zeros(2 * capacity, dtype=CANDLE_DTYPE)
+        self._next = 0
+        self.count = 0
+
+    def _write(self, index: int, candle):
+        self._data[index] = candle
+        self._data[index + self.capacity] = candle
+
+    def push(self, candle):
+        with self.lock:
+            self._write(self._next, candle)
+            self._next = (self._next + 1) % self.capacity
+            self.count = min(self.count + 1, self.capacity)
+
+    def extend(self, candles):
+        for candle in candles[-self.capacity:]:
+            self.push(candle)
+
+    def update_last(self, candle):
+        with self.lock:
+            if self.count == 0:
+                self.push(candle)
+            else:
+                self._write((self._next - 1) % self.capacity, candle)
+
+    def last(self):
+        with self.lock:
+            return self._data[(self._next - 1) % self.capacity].copy() if self.count else None
+
+    def view(self):
+        """
+        Срез буфера без копирования. Следующие push перезаписывают его начало, поэтому он годится только
+        для чтения под self.lock.
+        """
+        with self.lock:
+            end = self._next + self.capacity
+            return self._data[end - self.count:end]
+
+    def window(self, count_rows: int, end_time: int = None):
+        """
+        Последние count_rows свечей; если задан end_time, то заканчивающиеся свечой с этим временем.
+        Окно - копия: срез кольца перезаписали бы следующие push (через capacity - count + start свечей)
+        и update_last, а окно читается потоком бота без блокировки буфера.
+        """
+        with self.lock:
+            data = self.view()
+
+            stop = len(data) if end_time is None else int(np.searchsorted(data['time'], end_time, side='right'))
+            start = max(stop - count_rows, 0)
+            return read_only(data[start:stop].copy())
+
+
+class CandleAggregator:
+    """
+    Собирает свечи интервала interval_minutes из минутных свечей стрима и сообщает о закрытии свечи.
+    """
+
+    def __init__(self, figi: str, interval_time: str, interval_minutes: int, buffer: CandleRingBuffer, on_close):
+        self.figi = figi
+        self.interval_time = interval_time
+        self.interval_ns = interval_minutes * 60 * 10**9
+        self.buffer = buffer
+        self.on_close = on_close
+        self.lock = threading.Lock()
+        self._minute_volume = {}
+        self._closed_time = None
+
+        last = buffer.last()
+        if last is not None:
+            self._closed_time = int(last['time']) if self._is_closed(int(last['time']), clock.now_ns()) else None
+
+    def _is_closed(self, bucket_time: int, now_ns: int) -> bool:
+        return now_ns >= bucket_time + self.interval_ns + CLOSE_GRACE_SECONDS * 10**9
+
+    def _close(self, bucket_time: int):
+        if self._closed_time is not None and bucket_time <= self._closed_time:
+            return
+        self._closed_time = bucket_time
+        self.on_close(self.figi, self.interval_time, bucket_time)
+
+    def add_minute_candle(self, time_ns: int, open_, close, high, low, volume):
+        bucket_time = time_ns - time_ns % self.interval_ns
+
+        with self.lock:
+            last = self.buffer.last()
+
+            if last is not None and int(last['time']) == bucket_time:
+                self._minute_volume[time_ns] = volume
+                candle = (bucket_time,
+                          last['open'],
+                          close,
+                          max(last['high'], high),
+                          min(last['low'], low),
+                          sum(self._minute_volume.values()))
+                self.buffer.update_last(np.array(candle, dtype=CANDLE_DTYPE))
+                return
+
+            if last is not None and int(last['time']) > bucket_time:
+                return
+
+            if last is not None:
+                self._close(int(last['time']))
+
+            self._minute_volume = {time_ns: volume}
+            self.buffer.push(np.array((bucket_time, open_, close, high, low, volume), dtype=CANDLE_DTYPE))
+
+    def check_closed(self, now_ns: int):
+        with self.lock:
+            last = self.buffer.last()
+            if last is not None and self._is_closed(int(last['time']), now_ns):
+                self._close(int(last['time']))
+
+
+class MarketDataStreamer:
+    """
+    Подписка на минутные свечи и последние цены всех инструментов ботов.
+    Свечи складываются в CandleRingBuffer по (figi, interval_time), о закрытии свечи сообщает on_candle_close.
+    """
+
+    def __init__(self, token: str, subscriptions, capacity: int, on_candle_close):
+        """
+        :param subscriptions: список (figi, interval_time, interval_minutes)
+        :param on_candle_close: функция (figi, interval_time, candle_time_ns)
+        """
+        self.token = token
+        self.on_candle_close = on_candle_close
+        self.buffers = {}
+        self.aggregators = {}
+        self.last_prices = {}
+        self._stop = threading.Event()
+        self._threads = []
+
+        for figi, interval_time, interval_minutes in subscriptions:
+            key = (figi, interval_time)
+            if key in self.buffers:
+                continue
+
+            buffer = CandleRingBuffer(capacity)
+            buffer.extend(get_candle_store(figi=figi, interval_time=interval_time).window(capacity))
+
+            self.buffers[key] = buffer
+            self.aggregators[key] = CandleAggregator(figi=figi,
+                                                     interval_time=interval_time,
+                                                     interval_minutes=interval_minutes,
+                                                     buffer=buffer,
+                                                     on_close=on_candle_close)
+
+    def get_buffer(self, figi: str, interval_time: str) -> CandleRingBuffer:
+        return self.buffers[(figi, interval_time)]
+
+    def figis(self):
+        return sorted({figi for figi, _ in self.buffers})
+
+    def start(self):
+        for target in (self._run_stream, self._run_close_checker):
+            thread = threading.Thread(target=target, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        self._stop.set()
+
+    def _run_close_checker(self):
+        while not self._stop.wait(CLOSE_CHECK_INTERVAL):
+            now_ns = clock.now_ns()
+            for aggregator in self.aggregators.values():
+                aggregator.check_closed(now_ns)
+
+    def _run_stream(self):
+        while not self._stop.is_set():
+            try:
+                with api_client(self.token) as client:
+                    market_data_stream = client.create_market_data_stream()
+                    market_data_stream.candles.subscribe([
+                        CandleInstrument(figi=figi, interval=SubscriptionInterval.SUBSCRIPTION_INTERVAL_ONE_MINUTE)
+                        for figi in self.figis()
+                    ])
+                    market_data_stream.last_price.subscribe([
+                        LastPriceInstrument(figi=figi) for figi in self.figis()
+                    ])
+
+                    for market_data in market_data_stream:
+                        if self._stop.is_set():
+                            market_data_stream.stop()
+                            break
+                        self.on_market_data(market_data)
+            except Exception as e:
+                print(f'ERROR: market data stream. Error: {e}')
+
+            self._stop.wait(RECONNECT_DELAY)
+
+    def on_market_data(self, market_data):
+        if market_data.candle:
+            candle = market_data.candle
+            for (figi, _), aggregator in self.aggregators.items():
+                if figi == candle.figi:
+                    aggregator.add_minute_candle(time_ns=datetime_to_ns(candle.time),
+                                                 open_=money_to_decimal(candle.open),
+                                                 close=money_to_decimal(candle.close),
+                                                 high=money_to_decimal(candle.high),
+                                                 low=money_to_decimal(candle.low),
+                                                 volume=candle.volume)
+
+        if market_data.last_price:
+            self.last_prices[market_data.last_price.figi] = money_to_decimal(market_data.last_price.price)
@@ -0,0 +1,359 @@
+import os
+import csv
+import json
+import bisect
+import threading
+import time as t
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from client_pool import get_error_code
+
+
+METRICS_PORT = 9108
+TRACE_MAX_BYTES = 16 * 1024 * 1024
+TRACE_BACKUPS = 3
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+STAGE_SECONDS = 'bot_stage_seconds'
+API_ERRORS = 'api_errors_total'
+SCHEDULER_LAG = 'scheduler_lag_seconds'
+
+enabled = False
+
+_local = threading.local()
+
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+        self.max = max(self.max, value)
+
+
+class MetricsRegistry:
+    """
+    Счётчики и гистограммы с метками в памяти процесса. Ключ метрики - (имя, отсортированные метки).
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+
+    def inc(self, name: str, value: float = 1, labels=()):
+        key = (name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, labels=()):
+        key = (name, labels)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def clear(self):
+        with self.lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+    def snapshot(self):
+        """
+        Копия всех метрик, которую можно передать в другой процесс.
+        """
+        with self.lock:
+            return {'counters': dict(self.counters),
+                    'histograms': {key: (histogram.buckets, list(histogram.counts), histogram.sum,
+                                         histogram.count, histogram.max)
+                                   for key, histogram in self.histograms.items()}}
+
+    def load(self, snapshot, labels=()):
+        """
+        Добавляет метрики из snapshot, дописывая к их меткам labels.
+        """
+        with self.lock:
+            for (name, metric_labels), value in snapshot['counters'].items():
+                key = (name, tuple(sorted(metric_labels + labels)))
+                self.counters[key] = self.counters.get(key, 0) + value
+
+            for (name, metric_labels), (buckets, counts, total, count, maximum) in snapshot['histograms'].items():
+                key = (name, tuple(sorted(metric_labels + labels)))
+                histogram = self.histograms.get(key)
+                if histogram is None:
+                    histogram = self.histograms[key] = Histogram(buckets)
+                histogram.counts = [a + b for a, b in zip(histogram.counts, counts)]
+                histogram.sum += total
+                histogram.count += count
+                histogram.max = max(histogram.max, maximum)
+
+    def render(self) -> str:
+        """
+        Текстовый формат Prometheus.
+        """
+        lines = []
+        with self.lock:
+            for name in sorted({name for name, _ in self.counters}):
+                lines.append(f'# TYPE {name} counter')
+                for (counter_name, labels), value in sorted(self.counters.items()):
+                    if counter_name == name:
+                        lines.append(f'{name}{format_labels(labels)} {value}')
+
+            for name in sorted({name for name, _ in self.histograms}):
+                lines.append(f'# TYPE {name} histogram')
+                for (histogram_name, labels), histogram in sorted(self.histograms.items(), key=lambda x: x[0]):
+                    if histogram_name != name:
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets, histogram.counts):
+                        cumulative += count
+                        lines.append(f'{name}_bucket{format_labels(labels + (("le", str(bound)),))} {cumulative}')
+                    lines.append(f'{name}_bucket{format_labels(labels + (("le", "+Inf"),))} {histogram.count}')
+                    lines.append(f'{name}_sum{format_labels(labels)} {histogram.sum}')
+                    lines.append(f'{name}_count{format_labels(labels)} {histogram.count}')
+
+        return '\n'.join(lines) + '\n'
+
+
+def format_labels(labels) -> str:
+    if not labels:
+        return ''
+    values = ','.join('{}="{}"'.format(key, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+                      for key, value in labels)
+    return '{' + values + '}'
+
+
+class TraceWriter:
+    """
+    Трасса событий в файл CSV или JSON lines (по расширению path). При превышении max_bytes файл
+    переименовывается в path.1 (path.1 -> path.2 ...), хранится не больше backups старых файлов.
+    """
+
+    FIELDS = ('time', 'metric', 'bot', 'stage', 'value')
+
+    def __init__(self, path: str, max_bytes: int = TRACE_MAX_BYTES, backups: int = TRACE_BACKUPS):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.json_format = path.endswith('.json') or path.endswith('.jsonl')
+        self.lock = threading.Lock()
+        self._file = None
+        self._writer = None
+        self._open()
+
+    def _open(self):
+        new_file = not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+        self._file = open(self.path, 'a', newline='')
+        if not self.json_format:
+            self._writer = csv.writer(self._file)
+            if new_file:
+                self._writer.writerow(self.FIELDS)
+
+    def _rotate(self):
+        self._file.close()
+        for number in range(self.backups - 1, 0, -1):
+            if os.path.exists(f'{self.path}.{number}'):
+                os.replace(f'{self.path}.{number}', f'{self.path}.{number + 1}')
+        if self.backups:
+            os.replace(self.path, f'{self.path}.1')
+        else:
+            os.remove(self.path)
+        self._open()
+
+    def write(self, metric: str, value: float, labels):
+        labels = dict(labels)
+        row = (datetime.now(timezone.utc).isoformat(), metric, labels.pop('bot', ''), labels.pop('stage', ''), value)
+
+        with self.lock:
+            if self._file is None:
+                return
+            if self.json_format:
+                record = dict(zip(self.FIELDS, row))
+                record.update(labels)
+                self._file.write(json.dumps(record) + '\n')
+            else:
+                self._writer.writerow(row)
+            self._file.flush()
+
+            if self._file.tell() > self.max_bytes:
+                self._rotate()
+
+    def close(self):
+        with self.lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+
+        body = render().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+registry = MetricsRegistry()
+_trace = None
+_server = None
+_sources = {}
+_sources_lock = threading.Lock()
+
+
+def set_source(source: str, snapshot):
+    """
+    Последний снимок метрик другого процесса (например, шарда ботов), отдаётся с меткой shard=source.
+    """
+    with _sources_lock:
+        _sources[source] = snapshot
+
+
+def render() -> str:
+    with _sources_lock:
+        sources = dict(_sources)
+
+    if not sources:
+        return registry.render()
+
+    combined = MetricsRegistry()
+    combined.load(registry.snapshot())
+    for source, snapshot in sources.items():
+        combined.load(snapshot, labels=(('shard', source),))
+    return combined.render()
+
+
+def enable(port: int = METRICS_PORT, trace_path: str = None):
+    """
+    Включает сбор метрик. port - порт HTTP эндпоинта /metrics на localhost (None - без сервера),
+    trace_path - файл трассы (.csv или .jsonl, None - без трассы).
+    """
+    global enabled, _trace, _server
+
+    if trace_path and _trace is None:
+        _trace = TraceWriter(trace_path)
+
+    if port is not None and _server is None:
+        _server = ThreadingHTTPServer(('127.0.0.1', port), MetricsHandler)
+        threading.Thread(target=_server.serve_forever, daemon=True).start()
+
+    enabled = True
+
+
+def disable():
+    global enabled, _trace, _server
+
+    enabled = False
+
+    if _server is not None:
+        _server.shutdown()
+        _server.server_close()
+        _server = None
+
+    if _trace is not None:
+        _trace.close()
+        _trace = None
+
+
+def get_labels(bot: str = None, **labels):
+    if bot is None:
+        bot = getattr(_local, 'bot', '')
+    labels['bot'] = bot
+    return tuple(sorted(labels.items()))
+
+
+def inc(name: str, value: float = 1, bot: str = None, **labels):
+    if not enabled:
+        return
+    labels = get_labels(bot, **labels)
+    registry.inc(name, value, labels)
+    if _trace is not None:
+        _trace.write(name, value, labels)
+
+
+def observe(name: str, value: float, bot: str = None, **labels):
+    if not enabled:
+        return
+    labels = get_labels(bot, **labels)
+    registry.observe(name, value, labels)
+    if _trace is not None:
+        _trace.write(name, value, labels)
+
+
+class _StageTimer:
+    __slots__ = ('stage', 'bot', 'start')
+
+    def __init__(self, stage: str, bot: str):
+        self.stage = stage
+        self.bot = bot
+
+    def __enter__(self):
+        self.start = t.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        observe(STAGE_SECONDS, t.perf_counter() - self.start, bot=self.bot, stage=self.stage)
+        return False
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+def stage(name: str, bot: str = None):
+    """
+    with stage('forecast'): ... - время этапа тика в гистограмму bot_stage_seconds.
+    Если метрики выключены, возвращается общий пустой контекст без вызовов perf_counter.
+    """
+    if not enabled:
+        return _NULL_TIMER
+    return _StageTimer(name, bot)
+
+
+def api_error(method: str, error, bot: str = None):
+    if not enabled:
+        return
+    code = get_error_code(error)
+    code = getattr(code, 'name', code) or type(error).__name__
+    inc(API_ERRORS, bot=bot, method=method, code=code)
+
+
+@contextmanager
+def bot_context(bot_name: str):
+    """
+    Метрики внутри блока по умолчанию получают метку bot=bot_name (для кода, которому имя бота не передаётся).
+    """
+    previous = getattr(_local, 'bot', '')
+    _local.bot = bot_name
+    try:
+        yield
+    finally:
+        _local.bot = previous
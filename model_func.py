@@ -1,5 +1,6 @@
 import joblib
 from statsmodels.tsa.vector_ar.var_model import VAR
+from var_engine import fit_var_orders
 
 
 def load_model(path_model: str):
@@ -10,11 +11,13 @@ def load_model(path_model: str):
         return 0
 
 
-def save_model(model: any, file_path: str):
+def save_model(model: any, file_path: str) -> bool:
     try:
         joblib.dump(model, file_path)
+        return True
     except Exception as e:
         print(f'Model {model} not save. Error: {e}')
+        return False
 
 
 def fit_model(data, order: int = 1, include_const=True):
@@ -25,6 +28,15 @@ def fit_model(data, order: int = 1, include_const=True):
         print(f"Model not fit. Error: {e}")
 
 
+def fit_models(data, orders, include_const=True):
+    try:
+        trend_value = 'c' if include_const else 'ct'
+        return fit_var_orders(data=data, orders=orders, trend=trend_value)
+    except Exception as e:
+        print(f"Models not fit. Error: {e}")
+        return {}
+
+
 def predict_next_values(model, data, steps: int = 1):
     try:
         return model.forecast(data, steps=steps)
@@ -32,10 +44,3 @@ def predict_next_values(model, data, steps: int = 1):
         print(f'ERROR : model {model} not predict. Error: {e}')
         return ''
 
-
-def preprocess_data_for_predict(data, selected_features, count_rows: int = 0):
-    if count_rows > 0:
-        data = data.tail(count_rows)
-        return data[selected_features].values
-    else:
-        return data[selected_features].values
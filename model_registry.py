@@ -0,0 +1,100 @@
+import os
+import threading
+
+from var_engine import get_compact_model_path, load_compact_model, save_compact_model, to_var_coefficients
+
+
+class ModelRegistry:
+    """
+    Модели ботов, постоянно находящиеся в памяти. Файл модели перечитывается только если изменились
+    его mtime или размер. Предпочитается компактный .npz; если есть только .pkl, он загружается один раз
+    и сразу конвертируется в .npz.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self._models = {}
+
+    def get(self, path_model: str):
+        path_compact = get_compact_model_path(path_model)
+        path = path_compact if os.path.exists(path_compact) else path_model
+
+        try:
+            stat = os.stat(path)
+        except OSError as e:
+            print(f'Model {path_model} not load. Error: {e}')
+            return 0
+
+        version = (path, stat.st_mtime_ns, stat.st_size)
+
+        with self.lock:
+            entry = self._models.get(path_model)
+            if entry is not None and entry[0] == version:
+                return entry[1]
+
+        model = self._load(path_model, path_compact, path)
+        if model:
+            with self.lock:
+                self._models[path_model] = (version, model)
+
+        return model
+
+    def _load(self, path_model: str, path_compact: str, path: str):
+        try:
+            if path == path_compact:
+                return load_compact_model(path_compact)
+
+            from model_func import load_model
+
+            model = load_model(path_model)
+            if not model:
+                return 0
+
+            model = to_var_coefficients(model)
+            save_compact_model(model, path_compact)
+            return model
+        except Exception as e:
+            print(f'Model {path} not load. Error: {e}')
+            return 0
+
+    def snapshot(self):
+        """
+        Модели в памяти вместе с версиями их файлов для снимка состояния.
+        """
+        with self.lock:
+            return {path_model: entry for path_model, entry in self._models.items()}
+
+    def restore(self, models):
+        """
+        Загружает модели из снимка без чтения файлов. Модель берётся, только если файл с тех пор не менялся.
+        """
+        count = 0
+        for path_model, (version, model) in models.items():
+            path = version[0]
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+
+            if (path, stat.st_mtime_ns, stat.st_size) != version:
+                continue
+
+            with self.lock:
+                self._models.setdefault(path_model, (version, model))
+            count += 1
+
+        return count
+
+    def invalidate(self, path_model: str = None):
+        with self.lock:
+            if path_model is None:
+                self._models.clear()
+            else:
+                self._models.pop(path_model, None)
+
+
+model_registry = ModelRegistry()
+
+
+def get_model(path_model: str):
+    return model_registry.get(path_model)
@@ -0,0 +1,239 @@
+import os
+import threading
+import time as t
+from collections import deque
+import numpy as np
+
+from var_engine import VARCoefficients, get_compact_model_path, get_design_rows, get_trend_columns, to_var_coefficients
+
+
+FORGETTING_FACTOR = 0.999
+WARM_UP_ROWS = 2000
+ERROR_WINDOW = 500
+SNAPSHOT_INTERVAL = 600
+INITIAL_COVARIANCE = 1e3
+ONLINE_MODEL_VERSION = 1
+
+
+def get_online_model_path(path_model: str) -> str:
+    return os.path.splitext(path_model)[0] + '_online.npz'
+
+
+class OnlineVAR:
+    """
+    Дообучение VAR на каждой новой закрытой свече рекурсивным МНК (RLS) с коэффициентом забывания.
+    Параметры хранятся одной матрицей theta ((k_trend + k * p) x k), обновление стоит O(m^2),
+    где m - число регрессоров. Перед обновлением считается ошибка прогноза на один шаг,
+    по последним error_window свечам ведётся скользящая mean_relative_error.
+    """
+
+    def __init__(self, model, forgetting_factor: float = FORGETTING_FACTOR, error_window: int = ERROR_WINDOW):
+        model = to_var_coefficients(model)
+        k = model.coefs.shape[1]
+
+        self.forgetting_factor = forgetting_factor
+        self.trend = model.trend
+        self.k_ar = model.k_ar
+        self.k = k
+        self.k_trend = model.coefs_exog.shape[1]
+        self.n_totobs = model.n_totobs
+
+        self.theta = np.vstack([model.coefs_exog.T, model.coefs.swapaxes(1, 2).reshape(self.k_ar * k, k)])
+        self.covariance = np.eye(len(self.theta)) * INITIAL_COVARIANCE
+        self.count_updates = 0
+        self.last_time = None
+        self.errors = deque(maxlen=error_window)
+        self.model = self._to_model()
+
+    def _to_model(self) -> VARCoefficients:
+        return VARCoefficients(coefs=self.theta[self.k_trend:].reshape(self.k_ar, self.k, self.k).swapaxes(1, 2),
+                               coefs_exog=self.theta[:self.k_trend].T,
+                               trend=self.trend,
+                               n_totobs=self.n_totobs)
+
+    def warm_up(self, data):
+        """
+        Начальная ковариация (X'X)^-1 по истории data, чтобы первые обновления не сбивали коэффициенты.
+        """
+        data = np.asarray(data, dtype=float)
+        if len(data) <= self.k_ar + len(self.theta):
+            return
+
+        rows = np.arange(self.k_ar, len(data))
+        design = get_design_rows(data, rows, self.k_ar, self.trend)[:, :len(self.theta)]
+        inverse_r = np.linalg.pinv(np.linalg.qr(design, mode='r'), rcond=1e-15)
+        self.covariance = inverse_r @ inverse_r.T
+
+    def get_regressors(self, history):
+        lags = history[::-1][:self.k_ar].reshape(-1)
+        trend = get_trend_columns(self.trend, np.array([self.n_totobs]))[0]
+        return np.concatenate([trend, lags])
+
+    def update(self, history, values):
+        """
+        :param history: последние k_ar значений перед новой свечой (k_ar x k)
+        :param values: значения новой свечи (k)
+        """
+        x = self.get_regressors(np.asarray(history, dtype=float))
+        values = np.asarray(values, dtype=float)
+
+        error = values - x @ self.theta
+        if not np.all(np.isfinite(error)):
+            return
+
+        self.errors.append(float(np.mean(np.abs(error) / np.abs(values))))
+
+        px = self.covariance @ x
+        gain = px / (self.forgetting_factor + x @ px)
+        self.theta += np.outer(gain, error)
+        self.covariance = (self.covariance - np.outer(gain, px)) / self.forgetting_factor
+        self.covariance = (self.covariance + self.covariance.T) / 2
+
+        self.n_totobs += 1
+        self.count_updates += 1
+        self.model = self._to_model()
+
+    def update_candles(self, times, data):
+        """
+        Обновление по всем свечам data (T x k), которые новее last_time. times - время свечей в ns.
+        """
+        start = self.k_ar
+        if self.last_time is not None:
+            start = max(start, int(np.searchsorted(times, self.last_time, side='right')))
+
+        for row in range(start, len(data)):
+            self.update(data[row - self.k_ar:row], data[row])
+
+        if len(times):
+            self.last_time = int(times[-1]) if self.last_time is None else max(self.last_time, int(times[-1]))
+
+    @property
+    def mean_relative_error(self):
+        return float(np.mean(self.errors)) if self.errors else None
+
+    def save(self, file_path: str, base_version=None):
+        path_tmp = file_path + '.tmp.npz'
+        np.savez(path_tmp,
+                 version=ONLINE_MODEL_VERSION,
+                 base_version=np.array(base_version if base_version is not None else (), dtype=np.int64),
+                 theta=self.theta,
+                 covariance=self.covariance,
+                 n_totobs=self.n_totobs,
+                 count_updates=self.count_updates,
+                 last_time=self.last_time if self.last_time is not None else -1,
+                 errors=np.array(self.errors))
+        os.replace(path_tmp, file_path)
+
+    def load(self, file_path: str, base_version=None) -> bool:
+        """
+        Восстанавливает состояние из снимка, если он сделан для той же базовой модели. Возвращает успех.
+        """
+        with np.load(file_path) as data:
+            if int(data['version']) != ONLINE_MODEL_VERSION or data['theta'].shape != self.theta.shape:
+                return False
+            if base_version is not None and tuple(data['base_version']) != tuple(base_version):
+                return False
+
+            self.theta = data['theta'].copy()
+            self.covariance = data['covariance'].copy()
+            self.n_totobs = int(data['n_totobs'])
+            self.count_updates = int(data['count_updates'])
+            self.last_time = int(data['last_time']) if int(data['last_time']) >= 0 else None
+            self.errors.clear()
+            self.errors.extend(data['errors'].tolist())
+
+        self.model = self._to_model()
+        return True
+
+
+class OnlineModels:
+    """
+    Онлайн модели ботов поверх моделей из ModelRegistry. Если базовая модель сменилась (ночное
+    переобучение), онлайн состояние начинается заново. Снимки сохраняются не чаще snapshot_interval секунд.
+    """
+
+    def __init__(self, forgetting_factor: float = FORGETTING_FACTOR, snapshot_interval: float = SNAPSHOT_INTERVAL):
+        self.forgetting_factor = forgetting_factor
+        self.snapshot_interval = snapshot_interval
+        self.lock = threading.Lock()
+        self._models = {}
+
+    def _create(self, path_model: str, base_model, base_version, history):
+        online = OnlineVAR(base_model, forgetting_factor=self.forgetting_factor)
+        path_online = get_online_model_path(path_model)
+
+        try:
+            if os.path.exists(path_online) and online.load(path_online, base_version):
+                return online
+        except Exception as e:
+            print(f'Online model {path_online} not load. Error: {e}')
+
+        if history is not None:
+            online.warm_up(history)
+        return online
+
+    def get(self, bot_name: str, base_model):
+        """
+        Текущая онлайн модель бота или base_model, если для этой базовой модели обновлений ещё не было.
+        """
+        with self.lock:
+            entry = self._models.get(bot_name)
+
+        if entry is None or entry['base'] is not base_model:
+            return base_model
+        return entry['online'].model
+
+    def update(self, bot_name: str, path_model: str, base_model, times, data):
+        """
+        Дообучает модель бота на закрытых свечах data (T x k) со временем times (ns). При первом вызове
+        для базовой модели состояние берётся из снимка или строится по data без обновлений
+        (базовая модель уже обучена на этих свечах).
+        """
+        base_version = get_base_version(path_model)
+
+        with self.lock:
+            entry = self._models.get(bot_name)
+
+            if entry is None or entry['base'] is not base_model:
+                online = self._create(path_model, base_model, base_version, data)
+                if online.last_time is None and len(times):
+                    online.last_time = int(times[-1])
+                entry = self._models[bot_name] = {'base': base_model,
+                                                  'online': online,
+                                                  'path_model': path_model,
+                                                  'base_version': base_version,
+                                                  'saved_at': t.monotonic()}
+
+        online = entry['online']
+        online.update_candles(times, data)
+
+        if t.monotonic() - entry['saved_at'] > self.snapshot_interval:
+            self._save(bot_name, entry)
+
+        return online
+
+    def _save(self, bot_name: str, entry):
+        entry['saved_at'] = t.monotonic()
+        online = entry['online']
+
+        try:
+            online.save(get_online_model_path(entry['path_model']), entry['base_version'])
+            print(f'Online model {bot_name}: updates {online.count_updates}, '
+                  f'mean_relative_error {online.mean_relative_error}')
+        except Exception as e:
+            print(f'Online model {bot_name} not save. Error: {e}')
+
+    def save_all(self):
+        with self.lock:
+            entries = list(self._models.items())
+
+        for bot_name, entry in entries:
+            self._save(bot_name, entry)
+
+
+def get_base_version(path_model: str):
+    try:
+        stat = os.stat(get_compact_model_path(path_model))
+        return stat.st_mtime_ns, stat.st_size
+    except OSError:
+        return None
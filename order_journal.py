@@ -0,0 +1,280 @@
+import os
+import json
+import bisect
+import threading
+import time as t
+
+
+SEGMENT_MAX_BYTES = 4 * 1024 * 1024
+MAX_SEGMENTS = 16
+FSYNC_EVERY = 16
+FSYNC_INTERVAL = 1.0
+COMPACT_LIVE_FRACTION = 0.5
+ARCHIVE_DIR = 'archive'
+
+
+class OrderJournal:
+    """
+    Журнал заявок только на дозапись: JSONL сегменты segment_<номер>.jsonl в каталоге журнала.
+    Запись стоит O(1) независимо от истории, fsync делается пачками: после fsync_every записей или
+    не позже fsync_interval секунд после записи (по таймеру, даже если новых записей нет). В памяти держатся индексы
+    по order_id (сегмент, смещение) и по времени заявки. Когда сегментов становится больше
+    max_segments, журнал компактируется (см. compact): старые сегменты переносятся в архив,
+    поэтому размер журнала и стоимость компактирования не растут с историей.
+    """
+
+    def __init__(self, path: str, segment_max_bytes: int = SEGMENT_MAX_BYTES, max_segments: int = MAX_SEGMENTS,
+                 fsync_every: int = FSYNC_EVERY, fsync_interval: float = FSYNC_INTERVAL):
+        self.path = path
+        self.segment_max_bytes = segment_max_bytes
+        self.max_segments = max_segments
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+
+        self.lock = threading.RLock()
+        self.index = {}
+        self.time_index = []
+        self.segment_records = {}
+        self.segment_live = {}
+        self._file = None
+        self._segment = 0
+        self._pending = 0
+        self._last_fsync = t.monotonic()
+        self._fsync_timer = None
+
+        os.makedirs(self.path, exist_ok=True)
+        self._load_index()
+        self._open_segment(max(self.segments(), default=1))
+
+    def _segment_path(self, segment: int) -> str:
+        return os.path.join(self.path, f'segment_{segment:06d}.jsonl')
+
+    def segments(self):
+        return sorted(int(name[8:14]) for name in os.listdir(self.path)
+                      if name.startswith('segment_') and name.endswith('.jsonl'))
+
+    def _open_segment(self, segment: int):
+        if self._file is not None:
+            self._fsync()
+            self._file.close()
+
+        self._segment = segment
+        self._file = open(self._segment_path(segment), 'ab')
+
+    def _index_record(self, record, segment: int, offset: int):
+        order_id = record['order_id']
+        previous = self.index.get(order_id)
+        self.index[order_id] = (segment, offset, record['data'].get('time', ''))
+        self.segment_records[segment] = self.segment_records.get(segment, 0) + 1
+        self.segment_live[segment] = self.segment_live.get(segment, 0) + 1
+
+        if previous is not None:
+            self.segment_live[previous[0]] -= 1
+            position = bisect.bisect_left(self.time_index, (previous[2], order_id))
+            if position < len(self.time_index) and self.time_index[position] == (previous[2], order_id):
+                del self.time_index[position]
+
+        bisect.insort(self.time_index, (record['data'].get('time', ''), order_id))
+
+    def _load_index(self):
+        for segment in self.segments():
+            offset = 0
+            with open(self._segment_path(segment), 'rb') as file:
+                for line in file:
+                    try:
+                        self._index_record(json.loads(line), segment, offset)
+                    except Exception as e:
+                        print(f'Journal {self.path}: broken record in segment {segment} at {offset}. Error: {e}')
+                    offset += len(line)
+
+    def _fsync(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._pending = 0
+        self._last_fsync = t.monotonic()
+
+    def _schedule_fsync(self):
+        if self._fsync_timer is None:
+            delay = max(self.fsync_interval - (t.monotonic() - self._last_fsync), 0)
+            self._fsync_timer = threading.Timer(delay, self.sync)
+            self._fsync_timer.daemon = True
+            self._fsync_timer.start()
+
+    def sync(self):
+        """
+        fsync ещё не сброшенных записей.
+        """
+        with self.lock:
+            self._fsync_timer = None
+            if self._file is not None and self._pending:
+                try:
+                    self._fsync()
+                except Exception as e:
+                    print(f'Journal {self.path} not synced. Error: {e}')
+
+    def append(self, order_id: str, data):
+        record = {'order_id': str(order_id), 'data': data}
+        line = (json.dumps(record, ensure_ascii=False) + '\n').encode('utf-8')
+
+        with self.lock:
+            if self._file.tell() + len(line) > self.segment_max_bytes and self._file.tell() > 0:
+                self._open_segment(self._segment + 1)
+                if len(self.segments()) > self.max_segments:
+                    self.compact()
+
+            offset = self._file.tell()
+            self._file.write(line)
+            self._index_record(record, self._segment, offset)
+
+            self._pending += 1
+            if self._pending >= self.fsync_every or t.monotonic() - self._last_fsync >= self.fsync_interval:
+                self._fsync()
+            else:
+                self._file.flush()
+                self._schedule_fsync()
+
+    def get(self, order_id: str):
+        with self.lock:
+            entry = self.index.get(str(order_id))
+            if entry is None:
+                return None
+
+            segment, offset, _ = entry
+            if segment == self._segment:
+                self._file.flush()
+
+            with open(self._segment_path(segment), 'rb') as file:
+                file.seek(offset)
+                return json.loads(file.readline())['data']
+
+    def orders_between(self, start_time: str, end_time: str):
+        """
+        Заявки со временем в [start_time, end_time] (формат времени как в order_info['time']).
+        """
+        with self.lock:
+            first = bisect.bisect_left(self.time_index, (start_time, ''))
+            last = bisect.bisect_right(self.time_index, (end_time, '\uffff'))
+            order_ids = [order_id for _, order_id in self.time_index[first:last]]
+
+        return {order_id: self.get(order_id) for order_id in order_ids}
+
+    def compact(self):
+        """
+        Закрытые сегменты, в которых не меньше половины записей заменены более поздними записями
+        тех же заявок, переписываются без них. Затем самые старые сегменты сверх max_segments
+        переносятся в каталог archive/: заявки из архива больше не ищутся get и orders_between.
+        """
+        with self.lock:
+            for segment in self.segments():
+                records = self.segment_records.get(segment, 0)
+                if segment != self._segment and records and \
+                        self.segment_live.get(segment, 0) <= records * COMPACT_LIVE_FRACTION:
+                    self._rewrite_segment(segment)
+
+            closed_segments = [segment for segment in self.segments() if segment != self._segment]
+            for segment in closed_segments[:max(len(closed_segments) + 1 - self.max_segments, 0)]:
+                self._archive_segment(segment)
+
+    def _rewrite_segment(self, segment: int):
+        """
+        Оставляет в сегменте только актуальные записи. Строки копируются за один проход без разбора JSON:
+        актуальные смещения известны из индекса.
+        """
+        live = {offset: order_id for order_id, (entry_segment, offset, _) in self.index.items()
+                if entry_segment == segment}
+        path = self._segment_path(segment)
+
+        if not live:
+            os.remove(path)
+            self.segment_records.pop(segment, None)
+            self.segment_live.pop(segment, None)
+            return
+
+        moved = {}
+        path_tmp = path + '.tmp'
+        with open(path, 'rb') as source, open(path_tmp, 'wb') as target:
+            offset = 0
+            for line in source:
+                if offset in live:
+                    moved[live[offset]] = target.tell()
+                    target.write(line)
+                offset += len(line)
+            target.flush()
+            os.fsync(target.fileno())
+        os.replace(path_tmp, path)
+
+        for order_id, offset in moved.items():
+            self.index[order_id] = (segment, offset, self.index[order_id][2])
+        self.segment_records[segment] = self.segment_live[segment] = len(moved)
+
+    def _archive_segment(self, segment: int):
+        path_archive = os.path.join(self.path, ARCHIVE_DIR)
+        os.makedirs(path_archive, exist_ok=True)
+        os.replace(self._segment_path(segment), os.path.join(path_archive, os.path.basename(self._segment_path(segment))))
+
+        self.index = {order_id: entry for order_id, entry in self.index.items() if entry[0] != segment}
+        self.time_index = [entry for entry in self.time_index if entry[1] in self.index]
+        self.segment_records.pop(segment, None)
+        self.segment_live.pop(segment, None)
+
+    def close(self):
+        with self.lock:
+            if self._fsync_timer is not None:
+                self._fsync_timer.cancel()
+                self._fsync_timer = None
+            if self._file is not None:
+                self._fsync()
+                self._file.close()
+                self._file = None
+
+
+def import_orders_dump(journal: OrderJournal, path_order_dump: str):
+    """
+    Переносит старый orders.json в журнал, в том числе записи, вложенные на лишний уровень.
+    """
+    try:
+        with open(path_order_dump, 'r') as file:
+            existing_data = json.load(file)
+    except Exception as e:
+        print(f"An error occurred while loading JSON: {e}")
+        return
+
+    for order_id, order_info in existing_data.items():
+        if 'buy_or_sell' in order_info:
+            journal.append(order_id, order_info)
+        else:
+            for nested_order_id, nested_order_info in order_info.items():
+                if nested_order_id not in journal.index:
+                    journal.append(nested_order_id, nested_order_info)
+
+
+def get_journal_path(path_order_dump: str) -> str:
+    return os.path.splitext(path_order_dump)[0] + '_journal'
+
+
+_journals = {}
+_journals_lock = threading.Lock()
+
+
+def get_order_journal(path_order_dump: str) -> OrderJournal:
+    with _journals_lock:
+        if path_order_dump not in _journals:
+            path = get_journal_path(path_order_dump)
+            is_new = not os.path.exists(path)
+
+            journal = OrderJournal(path)
+            if is_new and os.path.exists(path_order_dump):
+                import_orders_dump(journal, path_order_dump)
+
+            _journals[path_order_dump] = journal
+        return _journals[path_order_dump]
+
+
+def close_order_journals():
+    """
+    Сбрасывает на диск и закрывает все открытые журналы (при остановке процесса).
+    """
+    with _journals_lock:
+        for journal in _journals.values():
+            journal.close()
+        _journals.clear()
@@ -0,0 +1,290 @@
+import threading
+import time as t
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+from client_pool import api_client
+from tinkoff_api_request import get_active_orders, check_status_order, cansel_order
+
+
+POLL_INTERVAL = 5
+RECONNECT_DELAY = 5
+FINAL_STATUSES = ("FILL", "REJECTED", "CANCELLED")
+
+
+class TimerWheel:
+    """
+    Хэшированное колесо таймеров с шагом tick секунд: добавление и отмена таймера O(1),
+    на каждом шаге просматривается только один слот.
+    """
+
+    def __init__(self, tick: float = 1.0, slots: int = 512):
+        self.tick = tick
+        self.slots = [dict() for _ in range(slots)]
+        self.lock = threading.Lock()
+        self._timers = {}
+        self._current_tick = int(t.monotonic() / tick)
+
+    def schedule(self, key, delay: float):
+        with self.lock:
+            self._cancel(key)
+            expire_tick = max(int((t.monotonic() + delay) / self.tick), self._current_tick + 1)
+            slot = expire_tick % len(self.slots)
+            self.slots[slot][key] = expire_tick
+            self._timers[key] = slot
+
+    def _cancel(self, key):
+        slot = self._timers.pop(key, None)
+        if slot is not None:
+            self.slots[slot].pop(key, None)
+
+    def cancel(self, key):
+        with self.lock:
+            self._cancel(key)
+
+    def advance(self, now: float = None):
+        """
+        Продвигает колесо до now и возвращает ключи истёкших таймеров.
+        """
+        now_tick = int((t.monotonic() if now is None else now) / self.tick)
+        expired = []
+
+        with self.lock:
+            while self._current_tick < now_tick:
+                self._current_tick += 1
+                slot = self.slots[self._current_tick % len(self.slots)]
+                for key in [key for key, expire_tick in slot.items() if expire_tick <= self._current_tick]:
+                    del slot[key]
+                    del self._timers[key]
+                    expired.append(key)
+
+        return expired
+
+
+class OrderEvents:
+    """
+    События счёта: стрим сделок (trades_stream) и раз в poll_interval один запрос get_orders.
+    Вызывает on_trade(order_id) на каждую сделку и on_active_orders(active_orders) после опроса.
+    На счёт нужен один такой объект: при запуске по шардам его держит супервизор (см. shard_runtime).
+
+    :param need_poll: опрашивать get_orders, только если need_poll() истинно (None - всегда)
+    """
+
+    def __init__(self, token: str, account_id: str, on_trade, on_active_orders, use_stream: bool = True,
+                 poll_interval: float = POLL_INTERVAL, need_poll=None):
+        self.token = token
+        self.account_id = account_id
+        self.on_trade = on_trade
+        self.on_active_orders = on_active_orders
+        self.use_stream = use_stream
+        self.poll_interval = poll_interval
+        self.need_poll = need_poll
+        self._stop = threading.Event()
+        self._threads = []
+
+    def start(self):
+        targets = [self._run_poll]
+        if self.use_stream:
+            targets.append(self._run_stream)
+
+        for target in targets:
+            thread = threading.Thread(target=target, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        self._stop.set()
+
+    def poll(self):
+        active_orders = get_active_orders(token=self.token, account_id=self.account_id)
+        if active_orders is not None:
+            self.on_active_orders(active_orders)
+
+    def _run_poll(self):
+        while not self._stop.wait(self.poll_interval):
+            if self.need_poll is None or self.need_poll():
+                self.poll()
+
+    def _run_stream(self):
+        while not self._stop.is_set():
+            try:
+                with api_client(self.token) as client:
+                    for response in client.orders_stream.trades_stream(accounts=[self.account_id]):
+                        if self._stop.is_set():
+                            break
+                        if response.order_trades:
+                            self.on_trade(response.order_trades.order_id)
+            except Exception as e:
+                metrics.api_error('trades_stream', e)
+                print(f'ERROR: trades stream. Error: {e}')
+
+            self._stop.wait(RECONNECT_DELAY)
+
+
+class OrderTracker:
+    """
+    Владеет всеми живыми заявками ботов. Об исполнении узнаёт из стрима сделок (trades_stream),
+    в качестве запасного варианта раз в POLL_INTERVAL делает один запрос get_orders на счёт
+    (см. OrderEvents). Заявки, не исполненные за ttl, снимаются по таймеру. Итог заявки передаётся в
+    on_order_done(bot_name, order_id, order_info, status) ровно один раз.
+    """
+
+    def __init__(self, token: str, account_id: str, on_order_done, use_stream: bool = True,
+                 poll_interval: float = POLL_INTERVAL):
+        self.token = token
+        self.account_id = account_id
+        self.on_order_done = on_order_done
+        self.use_stream = use_stream
+        self.poll_interval = poll_interval
+
+        self.lock = threading.Lock()
+        self.orders = {}
+        self.expire_at = {}
+        self.wheel = TimerWheel()
+        self.executor = ThreadPoolExecutor(max_workers=4)
+        self.events = None
+        self._stop = threading.Event()
+        self._threads = []
+
+    def track(self, bot_name: str, order_id: str, order_info, ttl_seconds: float):
+        with self.lock:
+            self.orders[order_id] = (bot_name, order_info)
+            self.expire_at[order_id] = t.time() + ttl_seconds
+        self.wheel.schedule(order_id, ttl_seconds)
+
+    def live_orders(self):
+        with self.lock:
+            return dict(self.orders)
+
+    def snapshot(self):
+        """
+        Живые заявки со временем снятия (unix time) для снимка состояния.
+        """
+        with self.lock:
+            return [{'order_id': order_id,
+                     'bot_name': bot_name,
+                     'order_info': order_info,
+                     'expire_at': self.expire_at.get(order_id)}
+                    for order_id, (bot_name, order_info) in self.orders.items()]
+
+    def restore(self, orders):
+        """
+        Снова отслеживает заявки из снимка с оставшимся сроком и сверяет их с брокером:
+        заявки, которых уже нет среди активных, проверяются сразу.
+        """
+        now = t.time()
+        for order in orders:
+            if order['order_id'] in self.orders:
+                continue
+            self.track(bot_name=order['bot_name'],
+                       order_id=order['order_id'],
+                       order_info=order['order_info'],
+                       ttl_seconds=max((order['expire_at'] or now) - now, 0))
+
+        if orders:
+            print(f'Restored orders: {[order["order_id"] for order in orders]}')
+            self.reconcile()
+
+    def has_orders(self) -> bool:
+        with self.lock:
+            return bool(self.orders)
+
+    def reconcile(self):
+        """
+        Один запрос get_orders: отслеживаемые заявки, которых нет среди активных, проверяются по статусу.
+        """
+        if not self.has_orders():
+            return
+
+        active_orders = get_active_orders(token=self.token, account_id=self.account_id)
+        if active_orders is not None:
+            self.apply_active_orders(active_orders)
+
+    def apply_active_orders(self, active_orders):
+        """
+        Отслеживаемые заявки, которых нет среди активных заявок счёта, проверяются по статусу.
+        """
+        with self.lock:
+            tracked = list(self.orders)
+
+        for order_id in tracked:
+            if order_id not in active_orders:
+                self.executor.submit(self.check_order, order_id)
+
+    def on_trade(self, order_id: str):
+        with self.lock:
+            if order_id not in self.orders:
+                return
+        self.executor.submit(self.check_order, order_id)
+
+    def start(self, own_events: bool = True):
+        """
+        :param own_events: самому вести стрим сделок и опрос get_orders; False - события счёта
+            передаются извне в on_trade и apply_active_orders (процесс шарда)
+        """
+        if own_events:
+            self.events = OrderEvents(token=self.token,
+                                      account_id=self.account_id,
+                                      on_trade=self.on_trade,
+                                      on_active_orders=self.apply_active_orders,
+                                      use_stream=self.use_stream,
+                                      poll_interval=self.poll_interval,
+                                      need_poll=self.has_orders)
+            self.events.start()
+
+        thread = threading.Thread(target=self._run_timer, daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+    def stop(self):
+        self._stop.set()
+        if self.events is not None:
+            self.events.stop()
+        self.executor.shutdown(wait=False)
+
+    def _finish(self, order_id: str, status: str):
+        with self.lock:
+            entry = self.orders.pop(order_id, None)
+            self.expire_at.pop(order_id, None)
+        if entry is None:
+            return
+
+        self.wheel.cancel(order_id)
+        bot_name, order_info = entry
+        order_info['status'] = status
+
+        try:
+            self.on_order_done(bot_name, order_id, order_info, status)
+        except Exception as e:
+            print(f'ERROR: order {order_id} not processed. Error: {e}')
+
+    def _bot_name(self, order_id: str) -> str:
+        with self.lock:
+            return self.orders.get(order_id, ('',))[0]
+
+    def check_order(self, order_id: str):
+        with metrics.bot_context(self._bot_name(order_id)):
+            status = check_status_order(token=self.token, account_id=self.account_id, order_id=order_id)
+        if status in FINAL_STATUSES:
+            self._finish(order_id, status)
+
+    def expire_order(self, order_id: str):
+        with self.lock:
+            if order_id not in self.orders:
+                return
+            bot_name = self.orders[order_id][0]
+
+        with metrics.bot_context(bot_name):
+            status = check_status_order(token=self.token, account_id=self.account_id, order_id=order_id)
+
+            if status != "FILL":
+                cansel_order(token=self.token, account_id=self.account_id, order_id=order_id)
+                print(f'Отменена заявка {order_id}')
+                status = "CANCELLED"
+
+        self._finish(order_id, status)
+
+    def _run_timer(self):
+        while not self._stop.wait(self.wheel.tick):
+            for order_id in self.wheel.advance():
+                self.executor.submit(self.expire_order, order_id)
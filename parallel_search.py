@@ -0,0 +1,91 @@
+import os
+import threading
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np
+
+
+SEARCH_WORKERS = os.cpu_count() or 1
+ATTACHED_ARRAYS_LIMIT = 16
+
+
+class SharedArray:
+    """
+    Копия numpy массива в shared memory. В задачи пула передаётся только spec (имя, форма, тип),
+    процессы подключаются к памяти по имени без копирования и сериализации данных.
+    """
+
+    def __init__(self, array):
+        array = np.ascontiguousarray(array)
+        self.shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        self.array = np.ndarray(array.shape, dtype=array.dtype, buffer=self.shm.buf)
+        self.array[...] = array
+        self.spec = (self.shm.name, array.shape, array.dtype.str)
+
+    def close(self):
+        del self.array
+        self.shm.close()
+        try:
+            self.shm.unlink()
+        except FileNotFoundError:
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+_attached = OrderedDict()
+
+
+def attach_shared_array(spec):
+    """
+    Массив из shared memory по spec внутри процесса пула. Подключения кэшируются, старые закрываются.
+    """
+    name, shape, dtype = spec
+
+    if name not in _attached:
+        shm = shared_memory.SharedMemory(name=name)
+        _attached[name] = (shm, np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf))
+
+        while len(_attached) > ATTACHED_ARRAYS_LIMIT:
+            _, (old_shm, _) = _attached.popitem(last=False)
+            old_shm.close()
+
+    _attached.move_to_end(name)
+    return _attached[name][1]
+
+
+_pool = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+
+
+def get_search_pool(workers: int = SEARCH_WORKERS) -> ProcessPoolExecutor:
+    """
+    Общий для всех ботов пул процессов перебора параметров. Процессы запускаются через spawn:
+    fork процесса с открытыми gRPC каналами и потоками ботов может зависнуть в дочернем процессе.
+    """
+    global _pool, _pool_workers
+
+    with _pool_lock:
+        if _pool is None or _pool_workers != workers:
+            if _pool is not None:
+                _pool.shutdown(wait=True)
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+            _pool_workers = workers
+        return _pool
+
+
+def shutdown_search_pool():
+    global _pool
+
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=True)
+        _pool = None
+
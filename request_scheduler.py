@@ -0,0 +1,293 @@
+import heapq
+import random
+import threading
+import itertools
+import time as t
+from concurrent.futures import Future
+
+from grpc import StatusCode
+
+import metrics
+from client_pool import get_error_code
+
+
+# Лимиты запросов в минуту по группам методов (тариф по умолчанию, см. лимиты Tinkoff Invest API).
+RATE_LIMITS = {
+    'market_data': 300,
+    'orders': 300,
+    'orders_state': 200,
+    'users': 100,
+}
+
+METHOD_BUCKETS = {
+    'get_candles': 'market_data',
+    'post_order': 'orders',
+    'cancel_order': 'orders',
+    'get_order_state': 'orders_state',
+    'get_orders': 'orders_state',
+    'get_accounts': 'users',
+}
+
+PRIORITY_ORDERS = 0
+PRIORITY_STATUS = 1
+PRIORITY_MARKET_DATA = 2
+PRIORITY_OTHER = 3
+
+METHOD_PRIORITIES = {
+    'post_order': PRIORITY_ORDERS,
+    'cancel_order': PRIORITY_ORDERS,
+    'get_order_state': PRIORITY_STATUS,
+    'get_orders': PRIORITY_STATUS,
+    'get_candles': PRIORITY_MARKET_DATA,
+}
+
+MAX_IN_FLIGHT = 8
+MAX_ATTEMPTS = 5
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 30.0
+WAIT_STEP = 0.05
+
+
+class TokenBucket:
+    """
+    Ведро токенов на rate_per_minute запросов в минуту. Ёмкость - burst запросов подряд.
+    clock - монотонные часы в секундах (в тестах подменяются).
+    """
+
+    def __init__(self, rate_per_minute: float, burst: float = None, clock=t.monotonic):
+        self.rate = rate_per_minute / 60
+        self.capacity = burst if burst is not None else max(rate_per_minute / 4, 1)
+        self.clock = clock
+        self.tokens = self.capacity
+        self.updated = clock()
+        self.blocked_until = 0
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, cost: float = 1) -> float:
+        """
+        Через сколько секунд в ведре будет cost токенов (0 - уже есть).
+        """
+        now = self.clock()
+        self._refill(now)
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        cost = min(cost, self.capacity)
+        return 0.0 if self.tokens >= cost else (cost - self.tokens) / self.rate
+
+    def take(self, cost: float = 1):
+        self.tokens -= min(cost, self.capacity)
+
+    def block(self, seconds: float):
+        """
+        Брокер ответил RESOURCE_EXHAUSTED: ведро пустое до сброса лимита.
+        """
+        self.tokens = 0
+        self.blocked_until = max(self.blocked_until, self.clock() + seconds)
+
+
+def is_throttled(error) -> bool:
+    return get_error_code(error) == StatusCode.RESOURCE_EXHAUSTED
+
+
+def get_ratelimit_reset(error):
+    """
+    Секунды до сброса лимита из метаданных ответа (x-ratelimit-reset), если они есть.
+    """
+    reset = getattr(getattr(error, 'metadata', None), 'ratelimit_reset', None)
+    try:
+        return float(reset) if reset else None
+    except (TypeError, ValueError):
+        return None
+
+
+def get_backoff(attempt: int) -> float:
+    return min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt) * random.uniform(0.5, 1.5)
+
+
+class Ticket:
+    """
+    Ожидающий запрос. event будит только этот поток: когда запросу выдан токен (granted)
+    или когда ему поручено проснуться в wake_at и проверить ведро заново.
+    """
+
+    __slots__ = ('priority', 'seq', 'bucket', 'cost', 'event', 'granted', 'wake_at')
+
+    def __init__(self, priority: int, seq: int, bucket, cost: float):
+        self.priority = priority
+        self.seq = seq
+        self.bucket = bucket
+        self.cost = cost
+        self.event = threading.Event()
+        self.granted = False
+        self.wake_at = None
+
+
+class RequestScheduler:
+    """
+    Общая очередь запросов к API для всех потоков ботов. Запрос ждёт токен в ведре своей группы методов
+    и свободное место среди max_in_flight одновременных запросов; среди готовых первым идёт запрос
+    с меньшим приоритетом (заявки, затем статусы, затем свечи). На RESOURCE_EXHAUSTED группа
+    блокируется до сброса лимита, запрос повторяется с backoff со случайной добавкой.
+    Одинаковые одновременные запросы с ключом key выполняются один раз.
+
+    Ожидающие запросы лежат в куче по (приоритет, порядок) для каждого ведра. Токены раздаёт _dispatch
+    при новом запросе, завершении запроса и пополнении ведра; будится только поток, получивший токен,
+    а пополнения ведра ждёт один поток (с ближайшим временем готовности).
+    """
+
+    def __init__(self, rate_limits=None, max_in_flight: int = MAX_IN_FLIGHT, max_attempts: int = MAX_ATTEMPTS,
+                 clock=t.monotonic):
+        self.max_in_flight = max_in_flight
+        self.max_attempts = max_attempts
+        self.clock = clock
+        self.buckets = {name: TokenBucket(rate, clock=clock) for name, rate in (rate_limits or RATE_LIMITS).items()}
+
+        self.lock = threading.Lock()
+        self._queues = {}
+        self._counter = itertools.count()
+        self._in_flight = 0
+        self._timer = None
+        self._pending = {}
+
+    def _get_bucket(self, method: str):
+        return self.buckets.get(METHOD_BUCKETS.get(method, method))
+
+    def _dispatch(self):
+        """
+        Выдаёт токены готовым запросам и назначает поток, который проснётся к пополнению ведра. Под self.lock.
+        """
+        while self._in_flight < self.max_in_flight:
+            best = None
+            for queue in self._queues.values():
+                if queue:
+                    ticket = queue[0][2]
+                    if (ticket.bucket is None or ticket.bucket.wait_time(ticket.cost) == 0) and \
+                            (best is None or queue[0][:2] < best[0][:2]):
+                        best = queue
+            if best is None:
+                break
+
+            ticket = heapq.heappop(best)[2]
+            if ticket.bucket is not None:
+                ticket.bucket.take(ticket.cost)
+            self._in_flight += 1
+            ticket.granted = True
+            ticket.event.set()
+
+        timer, wake_at = None, None
+        if self._in_flight < self.max_in_flight:
+            for queue in self._queues.values():
+                if queue and queue[0][2].bucket is not None:
+                    ticket = queue[0][2]
+                    ready_at = self.clock() + ticket.bucket.wait_time(ticket.cost)
+                    if wake_at is None or ready_at < wake_at:
+                        timer, wake_at = ticket, ready_at
+
+        if self._timer is not None and self._timer is not timer:
+            self._timer.wake_at = None
+        self._timer = timer
+        if timer is not None:
+            previous, timer.wake_at = timer.wake_at, wake_at
+            if previous is None or wake_at < previous:
+                timer.event.set()
+
+    def _acquire(self, method: str, priority: int, cost: float):
+        bucket = self._get_bucket(method)
+        ticket = Ticket(priority, next(self._counter), bucket, cost)
+
+        with self.lock:
+            heapq.heappush(self._queues.setdefault(bucket, []), (priority, ticket.seq, ticket))
+            self._dispatch()
+
+        while True:
+            with self.lock:
+                if ticket.granted:
+                    return bucket
+                ticket.event.clear()
+                if ticket.wake_at is not None and self.clock() >= ticket.wake_at:
+                    ticket.wake_at = None
+                    self._dispatch()
+                    if ticket.granted:
+                        return bucket
+                timeout = None if ticket.wake_at is None else max(ticket.wake_at - self.clock(), WAIT_STEP)
+
+            ticket.event.wait(timeout)
+
+    def _release(self):
+        with self.lock:
+            self._in_flight -= 1
+            self._dispatch()
+
+    def call(self, method: str, request, priority: int = None, cost: float = 1, key=None):
+        """
+        Выполняет request() с учётом лимитов. key - ключ для объединения одинаковых одновременных запросов.
+        """
+        if key is None:
+            return self._call(method, request, priority, cost)
+
+        with self.lock:
+            future = self._pending.get(key)
+            owner = future is None
+            if owner:
+                future = self._pending[key] = Future()
+
+        if not owner:
+            metrics.inc('api_coalesced_total', method=method)
+            return future.result()
+
+        try:
+            result = self._call(method, request, priority, cost)
+            future.set_result(result)
+            return result
+        except Exception as error:
+            future.set_exception(error)
+            raise
+        finally:
+            with self.lock:
+                self._pending.pop(key, None)
+
+    def _call(self, method: str, request, priority: int, cost: float):
+        if priority is None:
+            priority = METHOD_PRIORITIES.get(method, PRIORITY_OTHER)
+
+        for attempt in range(self.max_attempts):
+            bucket = self._acquire(method, priority, cost)
+            try:
+                return request()
+            except Exception as error:
+                if not is_throttled(error) or attempt == self.max_attempts - 1:
+                    raise
+
+                metrics.inc('api_throttled_total', method=method)
+                backoff = get_backoff(attempt)
+                if bucket is not None:
+                    with self.lock:
+                        bucket.block(get_ratelimit_reset(error) or backoff)
+                print(f'Request {method} throttled, retry {attempt + 1} in {backoff:.2f} s')
+            finally:
+                self._release()
+
+            t.sleep(backoff)
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_request_scheduler() -> RequestScheduler:
+    global _scheduler
+
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = RequestScheduler()
+        return _scheduler
+
+
+def set_request_scheduler(scheduler: RequestScheduler):
+    global _scheduler
+
+    with _scheduler_lock:
+        _scheduler = scheduler
@@ -1,12 +1,28 @@
+import os
 import math
-import pandas as pd
+import time as t
 from model_func import *
+from var_engine import batch_forecast, get_trend_offset, save_compact_model, get_compact_model_path
+from parallel_search import SharedArray, attach_shared_array, get_search_pool
+from search_strategy import get_search_strategy
+from retraining_queue import SearchCheckpoint
+from model_registry import get_model
+from feature_engine import get_bot_features, get_pipeline
 from tinkoff_api_request import get_trading_data
 from my_client_config import TOKEN
 import numpy as np
 
 
-def retraining_model(config_bots):
+def retraining_model(config_bots, workers: int = 1, strategy='grid', budget_seconds: float = None,
+                     checkpoint_path: str = None, validate: bool = False):
+    """
+    :param strategy: 'grid', 'successive_halving' или объект с методом search (см. search_strategy)
+    :param budget_seconds: ограничение времени поиска для бота, None - без ограничения
+    :param checkpoint_path: файл для сохранения прогресса поиска; перезапуск продолжит с проверенных ячеек
+    :param validate: заменить модель, только если на тех же тестовых данных она не хуже текущей
+    :return: новые parameters_model или None, если текущая модель лучше
+    """
+    start_time = t.monotonic()
     path_model = config_bots['path_model']
     name_model = config_bots['name_model']
     figi = config_bots['figi']
@@ -18,6 +34,8 @@ def retraining_model(config_bots):
     spread_days_percent = config_bots['spread_days_percent']
     spread_order_percent = config_bots['spread_order_percent']
     spread_num_values_for_predict = config_bots['spread_num_values_for_predict']
+    features = get_bot_features(config_bots)
+    pipeline = get_pipeline(features)
 
     lower_day_limit = max(math.floor(last_day_for_training * (1 - spread_days_percent)), 1)
     upper_day_limit = math.ceil(last_day_for_training * (1 + spread_days_percent)) + 1
@@ -26,62 +44,95 @@ def retraining_model(config_bots):
     upper_order_limit = min(math.ceil(last_order * (1 + spread_order_percent)), 35) + 1
 
     data_for_test = get_trading_data(token=TOKEN, figi=figi, delta_day=14, interval_time=interval_time)
-    data_for_test = preprocess_data_for_predict(data=data_for_test, selected_features=['open', 'close', 'high', 'low'])
+    data_for_test = pipeline.compute(data_for_test)[pipeline.warm_up:]
     data_for_training = get_trading_data(token=TOKEN, figi=figi, delta_day=upper_day_limit + 4,
                                          interval_time=interval_time)
 
-    error = []
-
-    for day in range(lower_day_limit, upper_day_limit):
-        print(f'Model {name_model} training : day = {day}')
-
-        for order in range(lower_order_limit, upper_order_limit):
-            data = get_data_for_training(data=data_for_training, delta_day=day)
-
-            data = preprocess_data_for_predict(data=data, selected_features=['open', 'close', 'high', 'low'])
-            model = fit_model(data=data, order=order)
-
-            lower_num_values_for_predict = max(math.floor(last_num_values_for_predict * (1 - spread_num_values_for_predict)), 1)
-            upper_num_values_for_predict = math.ceil(last_num_values_for_predict * (1 + spread_num_values_for_predict)) + 1
-
-            if lower_num_values_for_predict <= order:
-                lower_num_values_for_predict = order
-
-            for num_values_for_predict in range(lower_num_values_for_predict, upper_num_values_for_predict):
-                for num_predictions in range(1, last_num_predictions + 1):
-                    test_data = get_test_data(data=data_for_test, num_values_in_array=num_values_for_predict, num_predictions=num_predictions)
-
-                    local_error = []
+    training_values = pipeline.compute(data_for_training)[pipeline.warm_up:]
+    training_times = get_time_values(data_for_training)[pipeline.warm_up:]
 
-                    for values_stock, real_future_values in test_data:
-                        predict_future_values = predict_next_values(model=model, data=values_stock, steps=num_predictions)
-                        if type(predict_future_values) != str:
-                            local_error.append(calc_local_error(predict_data=predict_future_values, real_data=real_future_values))
-
-                    avg_local_error = calc_avg_local_error(local_error=local_error)
-                    error.append({
-                        "day": day,
-                        "order": order,
-                        "num_values_for_predict": num_values_for_predict,
-                        "num_predictions": num_predictions,
-                        "absolute_error": avg_local_error['absolute_error'],
-                        "relative_error": avg_local_error['relative_error'],
-                        "mean_absolute_error": np.mean(avg_local_error['absolute_error']),
-                        "mean_relative_error": np.mean(avg_local_error['relative_error'])
-                    })
+    grid = {
+        "last_num_values_for_predict": last_num_values_for_predict,
+        "spread_num_values_for_predict": spread_num_values_for_predict,
+        "last_num_predictions": last_num_predictions,
+        "error_columns": tuple(pipeline.error_columns)
+    }
+    days = range(lower_day_limit, upper_day_limit)
+    if budget_seconds is not None:
+        days = sorted(days, key=lambda day: abs(day - last_day_for_training))
+    orders = range(lower_order_limit, upper_order_limit)
+    models_cache = {}
+
+    checkpoint = None
+    if checkpoint_path is not None:
+        checkpoint = SearchCheckpoint(checkpoint_path, key=(figi, interval_time, int(training_times[-1]),
+                                                            len(training_values), len(data_for_test),
+                                                            tuple(orders), tuple(sorted(grid.items()))))
+
+    def evaluate(cells, test_rows):
+        results = {}
+        missing = []
+        for day, cell_orders in cells:
+            cell = (day, tuple(cell_orders), test_rows)
+            cell_error = checkpoint.get(cell) if checkpoint is not None else None
+            if cell_error is None:
+                missing.append((day, tuple(cell_orders)))
+            else:
+                results[cell] = cell_error
+
+        def on_cell(day, cell_orders, cell_error):
+            cell = (day, tuple(cell_orders), test_rows)
+            results[cell] = cell_error
+            if checkpoint is not None:
+                checkpoint.put({cell: cell_error})
+
+        if missing:
+            print(f'Model {name_model} training : days = {[day for day, _ in missing]}, test rows = {test_rows}')
+            evaluate_cells(training_values=training_values,
+                           training_times=training_times,
+                           test_values=data_for_test[-test_rows:],
+                           cells=missing, grid=grid, workers=workers, models_cache=models_cache,
+                           on_cell=on_cell)
+
+        return [entry for day, cell_orders in cells for entry in results[(day, tuple(cell_orders), test_rows)]]
+
+    upper_num_values_for_predict = math.ceil(last_num_values_for_predict * (1 + spread_num_values_for_predict)) + 1
+    error = get_search_strategy(strategy).search(evaluate=evaluate,
+                                                 days=days,
+                                                 orders=orders,
+                                                 test_rows=len(data_for_test),
+                                                 min_test_rows=upper_num_values_for_predict + last_num_predictions,
+                                                 workers=workers,
+                                                 deadline=None if budget_seconds is None else start_time + budget_seconds)
 
     best_config = get_best_config_model(error=error)
 
-    data = get_data_for_training(data=data_for_training, delta_day=best_config['day'])
-
-    data = preprocess_data_for_predict(data=data, selected_features=['open', 'close', 'high', 'low'])
+    data = get_training_values(values=training_values, times=training_times, delta_day=best_config['day'])
     best_model = fit_model(data=data, order=best_config['order'])
 
-    save_model(best_model, path_model)
+    if validate:
+        current_error = get_current_error(path_model=path_model,
+                                          data=data_for_test,
+                                          num_values_for_predict=last_num_values_for_predict,
+                                          num_predictions=last_num_predictions,
+                                          error_columns=pipeline.error_columns)
+
+        if current_error is not None and current_error < best_config['mean_relative_error']:
+            print(f'Model {name_model} not promoted: new mean_relative_error {best_config["mean_relative_error"]} '
+                  f'> current {current_error}')
+            if checkpoint is not None:
+                checkpoint.remove()
+            return None
+
+    if not promote_model(best_model, path_model):
+        print(f'Model {name_model} not promoted: model not saved')
+        return None
+    if checkpoint is not None:
+        checkpoint.remove()
 
     print(f'Model {name_model} completed retraining')
 
-    return {
+    new_parameters_model = {
         "path_model": path_model,
         "name_model": name_model,
         "figi": figi,
@@ -96,8 +147,230 @@ def retraining_model(config_bots):
         "spread_order_percent": spread_order_percent,
         "spread_num_values_for_predict": spread_num_values_for_predict
     }
+    if 'features' in config_bots:
+        new_parameters_model['features'] = list(features)
+
+    return new_parameters_model
+
+
+def get_current_error(path_model: str, data, num_values_for_predict: int, num_predictions: int,
+                      error_columns=None):
+    """
+    mean_relative_error текущей модели бота на тех же тестовых данных, на которых выбиралась новая.
+    None, если модели нет или она обучена на других признаках.
+    """
+    model = get_model(path_model)
+    if not model or num_values_for_predict < model.k_ar or model.coefs.shape[1] != data.shape[1]:
+        return None
+
+    errors = calc_walk_forward_errors(model=model,
+                                      data=data,
+                                      num_values_range=[num_values_for_predict],
+                                      max_num_predictions=num_predictions)
+    relative_error = errors[(num_values_for_predict, num_predictions)]['relative_error']
+    return float(np.mean(relative_error if error_columns is None else relative_error[list(error_columns)]))
+
+
+def promote_model(model, path_model: str) -> bool:
+    """
+    Новая модель сначала пишется во временные .pkl и .npz, и только когда записаны оба файла,
+    они подменяют текущие (.npz последним: по нему модель читает реестр). Если запись не удалась,
+    текущая модель остаётся, возвращается False.
+    """
+    path_tmp = path_model + '.tmp'
+    path_compact = get_compact_model_path(path_model)
+    path_compact_tmp = path_compact + '.tmp'
+
+    if model is None or not save_model(model, path_tmp):
+        return False
+
+    try:
+        save_compact_model(model, path_compact_tmp)
+    except Exception as e:
+        print(f'Compact model {path_compact} not save. Error: {e}')
+        os.remove(path_tmp)
+        return False
+
+    os.replace(path_tmp, path_model)
+    os.replace(path_compact_tmp, path_compact)
+    return True
+
+
+def evaluate_grid(training_values, training_times, test_values, day, orders, grid, models_cache: dict = None):
+    """
+    Ошибки всех ячеек сетки (order, num_values_for_predict, num_predictions) для одного day.
+    models_cache - словарь {(day, order): модель}, чтобы не обучать модели заново в следующих раундах поиска.
+    """
+    last_num_values_for_predict = grid['last_num_values_for_predict']
+    spread_num_values_for_predict = grid['spread_num_values_for_predict']
+    last_num_predictions = grid['last_num_predictions']
+    error_columns = list(grid.get('error_columns', range(training_values.shape[1])))
 
+    error = []
 
+    if models_cache is None:
+        models_cache = {}
+
+    missing_orders = [order for order in orders if (day, order) not in models_cache]
+    if missing_orders:
+        data = get_training_values(values=training_values, times=training_times, delta_day=day)
+        models = fit_models(data=data, orders=missing_orders)
+        for order in missing_orders:
+            models_cache[(day, order)] = models.get(order)
+
+    for order in orders:
+        model = models_cache[(day, order)]
+        if model is None:
+            continue
+
+        lower_num_values_for_predict = max(math.floor(last_num_values_for_predict * (1 - spread_num_values_for_predict)), 1)
+        upper_num_values_for_predict = math.ceil(last_num_values_for_predict * (1 + spread_num_values_for_predict)) + 1
+
+        if lower_num_values_for_predict <= order:
+            lower_num_values_for_predict = order
+
+        num_values_range = range(lower_num_values_for_predict, upper_num_values_for_predict)
+        model_errors = calc_walk_forward_errors(model=model,
+                                                data=test_values,
+                                                num_values_range=num_values_range,
+                                                max_num_predictions=last_num_predictions)
+
+        for num_values_for_predict in num_values_range:
+            for num_predictions in range(1, last_num_predictions + 1):
+                avg_local_error = model_errors[(num_values_for_predict, num_predictions)]
+                error.append({
+                    "day": day,
+                    "order": order,
+                    "num_values_for_predict": num_values_for_predict,
+                    "num_predictions": num_predictions,
+                    "absolute_error": avg_local_error['absolute_error'],
+                    "relative_error": avg_local_error['relative_error'],
+                    "mean_absolute_error": np.mean(avg_local_error['absolute_error'][error_columns]),
+                    "mean_relative_error": np.mean(avg_local_error['relative_error'][error_columns])
+                })
+
+    return error
+
+
+def evaluate_grid_shared(task):
+    """
+    Задача пула: ошибки сетки одного day и модели всех его порядков (для models_cache основного процесса).
+    """
+    specs, day, orders, grid, models = task
+    training_values, training_times, test_values = (attach_shared_array(spec) for spec in specs)
+
+    models_cache = {(day, order): model for order, model in models.items()}
+    error = evaluate_grid(training_values=training_values,
+                          training_times=training_times,
+                          test_values=test_values,
+                          day=day, orders=orders, grid=grid, models_cache=models_cache)
+    return error, {order: models_cache[(day, order)] for order in orders}
+
+
+def evaluate_cells(training_values, training_times, test_values, cells, grid, workers: int = 1,
+                   models_cache: dict = None, on_cell=None):
+    """
+    Ошибки сетки для списка cells = [(day, orders), ...], последовательно или в пуле процессов.
+    on_cell(day, orders, error) вызывается сразу после проверки каждой ячейки (например, для checkpoint).
+    """
+    if workers > 1:
+        return search_cells_parallel(training_values=training_values,
+                                     training_times=training_times,
+                                     test_values=test_values,
+                                     cells=cells, grid=grid, workers=workers, models_cache=models_cache,
+                                     on_cell=on_cell)
+
+    error = []
+    for day, orders in cells:
+        cell_error = evaluate_grid(training_values=training_values,
+                                   training_times=training_times,
+                                   test_values=test_values,
+                                   day=day, orders=orders, grid=grid, models_cache=models_cache)
+        if on_cell is not None:
+            on_cell(day, orders, cell_error)
+        error += cell_error
+    return error
+
+
+def search_cells_parallel(training_values, training_times, test_values, cells, grid, workers: int,
+                          models_cache: dict = None, on_cell=None):
+    """
+    Перебор сетки в пуле процессов. Данные лежат в shared memory, задача = один day со всеми порядками:
+    общая для всех порядков дня QR-факторизация (fit_var_orders) считается один раз.
+    Уже обученные модели из models_cache передаются в задачи, новые возвращаются в models_cache.
+    Результаты собираются в порядке задач, поэтому список ошибок (и выбор лучшей конфигурации)
+    совпадает с последовательным перебором.
+    """
+    if models_cache is None:
+        models_cache = {}
+
+    with SharedArray(training_values) as shared_training_values, \
+            SharedArray(training_times) as shared_training_times, \
+            SharedArray(test_values) as shared_test_values:
+        specs = (shared_training_values.spec, shared_training_times.spec, shared_test_values.spec)
+        tasks = [(specs, day, orders, grid, {order: models_cache[(day, order)] for order in orders
+                                            if (day, order) in models_cache})
+                 for day, orders in cells]
+
+        error = []
+        for (day, orders), (task_error, models) in zip(cells, get_search_pool(workers).map(evaluate_grid_shared, tasks)):
+            error += task_error
+            models_cache.update({(day, order): model for order, model in models.items()})
+            if on_cell is not None:
+                on_cell(day, orders, task_error)
+
+    return error
+
+
+def calc_walk_forward_errors(model, data, num_values_range, max_num_predictions):
+    """
+    Средние ошибки прогноза по всем окнам get_test_data для каждой пары (num_values_for_predict, num_predictions)
+    за один проход: прогноз VAR зависит только от последних k_ar значений окна, а прогнозы на меньшее
+    число шагов являются префиксом прогноза на max_num_predictions шагов.
+    """
+    count_rows = len(data)
+    k_ar = model.coefs.shape[0]
+
+    ends = np.arange(k_ar, count_rows)
+    forecasts = batch_forecast(coefs=model.coefs,
+                               trend_offset=get_trend_offset(model, max_num_predictions),
+                               data=data,
+                               ends=ends,
+                               steps=max_num_predictions)
+
+    real_index = np.minimum(ends[:, None] + np.arange(max_num_predictions), count_rows - 1)
+    real = data[real_index]
+    absolute_error = np.abs(real - forecasts)
+    relative_error = absolute_error / np.abs(real)
+
+    horizons = np.arange(1, max_num_predictions + 1)[None, :, None]
+    window_absolute_error = np.cumsum(absolute_error, axis=1) / horizons
+    window_relative_error = np.cumsum(relative_error, axis=1) / horizons
+
+    zeros = np.zeros((1,) + window_absolute_error.shape[1:])
+    prefix_absolute_error = np.concatenate([zeros, np.cumsum(window_absolute_error, axis=0)])
+    prefix_relative_error = np.concatenate([zeros, np.cumsum(window_relative_error, axis=0)])
+
+    errors = {}
+    for num_values_for_predict in num_values_range:
+        for num_predictions in range(1, max_num_predictions + 1):
+            first = num_values_for_predict - k_ar
+            last = count_rows - num_predictions - k_ar
+            count_windows = last - first
+
+            if count_windows > 0:
+                absolute = (prefix_absolute_error[last, num_predictions - 1] - prefix_absolute_error[first, num_predictions - 1]) / count_windows
+                relative = (prefix_relative_error[last, num_predictions - 1] - prefix_relative_error[first, num_predictions - 1]) / count_windows
+            else:
+                absolute = relative = np.full(data.shape[1], np.nan)
+
+            errors[(num_values_for_predict, num_predictions)] = {'absolute_error': absolute, 'relative_error': relative}
+
+    return errors
+
+
+# Поштучная оценка по окнам: эталон для calc_walk_forward_errors (tests/test_walk_forward.py) и benchmark.py,
+# в переобучении не используется.
 def get_test_data(data, num_values_in_array, num_predictions):
     arrays = []
     for start_index in range(len(data) - (num_values_in_array + num_predictions)):
@@ -151,9 +424,10 @@ def get_best_config_model(error):
     return best_entry
 
 
-def get_data_for_training(data, delta_day):
-    time_col = data['time']
-    start_time = time_col.iloc[-1] - pd.Timedelta(days=delta_day)
+def get_time_values(data):
+    return data['time'].values.astype('datetime64[ns]').astype(np.int64)
+
 
-    selected_data = data[data['time'] >= start_time]
-    return selected_data
+def get_training_values(values, times, delta_day):
+    start_time = times[-1] - delta_day * 24 * 60 * 60 * 10**9
+    return values[np.searchsorted(times, start_time, side='left'):]
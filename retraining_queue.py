@@ -0,0 +1,161 @@
+import os
+import heapq
+import math
+import threading
+import itertools
+import time as t
+from datetime import datetime, timedelta
+
+import joblib
+
+
+PATH_CHECKPOINTS = 'data_retraining'
+MAX_JOBS = 2
+MEMORY_BUDGET_MB = 4096
+DEADLINE_MARGIN = timedelta(minutes=10)
+CANDLE_FEATURES = 4
+
+
+def get_checkpoint_path(bot_name: str, root: str = PATH_CHECKPOINTS) -> str:
+    return os.path.join(root, f'{bot_name}.pkl')
+
+
+def has_checkpoints(root: str = PATH_CHECKPOINTS) -> bool:
+    return os.path.isdir(root) and any(name.endswith('.pkl') for name in os.listdir(root))
+
+
+class SearchCheckpoint:
+    """
+    Результаты уже проверенных ячеек поиска одного бота на диске. Файл перезаписывается атомарно
+    после каждой проверенной ячейки; key описывает данные и сетку, при другом key старые результаты не используются.
+    """
+
+    def __init__(self, path: str, key):
+        self.path = path
+        self.key = key
+        self.results = {}
+
+        try:
+            if os.path.exists(path):
+                checkpoint = joblib.load(path)
+                if checkpoint['key'] == key:
+                    self.results = checkpoint['results']
+                    print(f'Checkpoint {path}: resumed {len(self.results)} cells')
+        except Exception as e:
+            print(f'Checkpoint {path} not load. Error: {e}')
+
+    def get(self, cell):
+        return self.results.get(cell)
+
+    def put(self, results):
+        self.results.update(results)
+
+        try:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            path_tmp = self.path + '.tmp'
+            joblib.dump({'key': self.key, 'results': self.results}, path_tmp)
+            os.replace(path_tmp, self.path)
+        except Exception as e:
+            print(f'Checkpoint {self.path} not save. Error: {e}')
+
+    def remove(self):
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+def estimate_job_memory_mb(parameters_model, workers: int = 1) -> float:
+    """
+    Грубая оценка памяти переобучения: матрица регрессоров для максимального порядка в каждом процессе поиска.
+    """
+    interval_minutes = int(parameters_model['interval_time'][:-1])
+    days = math.ceil(parameters_model['day_for_training'] * (1 + parameters_model['spread_days_percent'])) + 5
+    order = min(math.ceil(parameters_model['order'] * (1 + parameters_model['spread_order_percent'])), 35)
+
+    rows = days * 24 * 60 / interval_minutes
+    columns = 1 + CANDLE_FEATURES * (order + 1)
+
+    return rows * columns * 8 * 3 * max(workers, 1) / 2**20
+
+
+class RetrainingQueue:
+    """
+    Очередь ночного переобучения. Боты запускаются по убыванию retraining_priority из конфига,
+    одновременно не больше max_jobs и не больше memory_budget_mb по оценке памяти. Новые задачи не
+    стартуют после deadline, у запущенных поиск ограничен оставшимся до deadline временем.
+    """
+
+    def __init__(self, run_job, max_jobs: int = MAX_JOBS, memory_budget_mb: float = MEMORY_BUDGET_MB,
+                 workers: int = 1):
+        """
+        :param run_job: функция (bot_name, bot_config, budget_seconds)
+        """
+        self.run_job = run_job
+        self.max_jobs = max_jobs
+        self.memory_budget_mb = memory_budget_mb
+        self.workers = workers
+
+        self.lock = threading.Condition()
+        self._queue = []
+        self._counter = itertools.count()
+        self._running = {}
+
+    def put(self, bot_name: str, bot_config):
+        priority = bot_config.get('retraining_priority', 0)
+        memory = estimate_job_memory_mb(bot_config['parameters_model'], self.workers)
+
+        with self.lock:
+            heapq.heappush(self._queue, (-priority, next(self._counter), bot_name, bot_config, memory))
+
+    def _can_start(self, memory: float) -> bool:
+        if not self._running:
+            return True
+        return (len(self._running) < self.max_jobs and
+                sum(self._running.values()) + memory <= self.memory_budget_mb)
+
+    def run(self, deadline: datetime = None):
+        """
+        Выполняет очередь до конца или до deadline.
+        """
+        threads = []
+
+        while True:
+            with self.lock:
+                if not self._queue:
+                    break
+
+                _, _, bot_name, bot_config, memory = self._queue[0]
+
+                if deadline is not None and datetime.now() >= deadline:
+                    skipped = [entry[2] for entry in self._queue]
+                    print(f'Retraining deadline reached, not started: {skipped}')
+                    self._queue.clear()
+                    break
+
+                if not self._can_start(memory):
+                    self.lock.wait(1)
+                    continue
+
+                heapq.heappop(self._queue)
+                self._running[bot_name] = memory
+
+            budget_seconds = None if deadline is None else (deadline - datetime.now()).total_seconds()
+            thread = threading.Thread(target=self._run_job, args=(bot_name, bot_config, budget_seconds), daemon=True)
+            thread.start()
+            threads.append(thread)
+
+        for thread in threads:
+            thread.join()
+
+    def _run_job(self, bot_name: str, bot_config, budget_seconds):
+        start_time = t.monotonic()
+        try:
+            self.run_job(bot_name, bot_config, budget_seconds)
+        except Exception as e:
+            print(f'ERROR: retraining {bot_name}. Error: {e}')
+        finally:
+            print(f'Retraining {bot_name} finished in {t.monotonic() - start_time:.1f} s')
+            with self.lock:
+                self._running.pop(bot_name, None)
+                self.lock.notify_all()
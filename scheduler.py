@@ -0,0 +1,244 @@
+import heapq
+import itertools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, time, timedelta
+
+import metrics
+from trading_calendar import get_calendar
+
+
+RETRAINING_TIME = time(23, 59)
+START_DELAY_SECONDS = 4
+MAX_SEARCH_STEPS = 100
+CATCH_UP_FRACTION = 0.5
+CONFIG_SYNC_INTERVAL = 5
+
+
+def is_trading_day(date) -> bool:
+    return get_calendar().is_trading_day(date)
+
+
+def is_trading_time(date) -> bool:
+    return get_calendar().is_trading_time(date)
+
+
+def next_session_start(date):
+    """
+    Начало ближайшей торговой сессии не раньше date (по календарю trading_calendar).
+    """
+    return get_calendar().next_session_start(date)
+
+
+def next_fire_time(interval_minutes: int, after, start_delay: int = START_DELAY_SECONDS):
+    """
+    Ближайшая после after граница свечи интервала interval_minutes (+ start_delay секунд),
+    попадающая в торговую сессию.
+    """
+    interval = timedelta(minutes=interval_minutes)
+    delay = timedelta(seconds=start_delay)
+
+    candidate = after - delay
+    midnight = candidate.replace(hour=0, minute=0, second=0, microsecond=0)
+    candidate = midnight + ((candidate - midnight) // interval + 1) * interval
+
+    for _ in range(MAX_SEARCH_STEPS):
+        if is_trading_time(candidate):
+            return candidate + delay
+
+        session_start = next_session_start(candidate)
+        midnight = session_start.replace(hour=0, minute=0, second=0, microsecond=0)
+        candidate = midnight + -((midnight - session_start) // interval) * interval
+
+    return next_session_start(after) + delay
+
+
+def last_fire_time(interval_minutes: int, now, start_delay: int = START_DELAY_SECONDS):
+    """
+    Последнее срабатывание бота интервала interval_minutes не позже now или None, если оно было
+    раньше начала текущей свечи (например, now вне торговой сессии).
+    """
+    fire_time = next_fire_time(interval_minutes, now - timedelta(minutes=interval_minutes), start_delay)
+    return fire_time if fire_time <= now else None
+
+
+def next_retraining_time(after, retraining_time: time = RETRAINING_TIME):
+    day = after.replace(hour=0, minute=0, second=0, microsecond=0)
+
+    while True:
+        candidate = datetime.combine(day.date(), retraining_time)
+        if is_trading_day(candidate) and candidate > after:
+            return candidate
+        day += timedelta(days=1)
+
+
+class BotScheduler:
+    """
+    Планировщик запуска ботов: для каждого бота вычисляется время следующей свечи по его interval_time
+    и торговому расписанию, поток спит до ближайшего события и отправляет бота в долгоживущий пул потоков.
+    Переобучение запускается раз в торговый день в RETRAINING_TIME. Раз в sync_interval секунд
+    в расписание добавляются боты, появившиеся в конфигурации.
+    """
+
+    def __init__(self, get_configs, run_bot, run_retraining, get_interval_minutes,
+                 trigger_bots: bool = True, max_workers: int = None, position=None,
+                 sync_interval: float = CONFIG_SYNC_INTERVAL):
+        """
+        :param position: позиция планировщика из снимка прошлого процесса (get_position): боты, пропустившие
+        срабатывание текущей свечи во время перезапуска, запускаются сразу, если с него прошло
+        не больше CATCH_UP_FRACTION интервала
+        """
+        self.get_configs = get_configs
+        self.run_bot = run_bot
+        self.run_retraining = run_retraining
+        self.get_interval_minutes = get_interval_minutes
+        self.trigger_bots = trigger_bots
+        self.max_workers = max_workers
+        self.sync_interval = sync_interval
+
+        self.executor = None
+        self.lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._queue = []
+        self._counter = itertools.count()
+        self._scheduled_bots = {}
+        self._last_fired = dict(position or {})
+        self._catch_up = set(self._last_fired)
+        self._retraining_thread = None
+
+    def _push(self, fire_time, kind: str, name: str, interval_minutes: int = 0):
+        heapq.heappush(self._queue, (fire_time, next(self._counter), kind, name, interval_minutes))
+
+    def _interval_minutes(self, bot_config) -> int:
+        return self.get_interval_minutes(bot_config["parameters_model"]["interval_time"])
+
+    def sync_bots(self, config_bots, now=None):
+        """
+        Добавляет в расписание новых ботов; боты, удалённые из конфигурации, выпадают при следующем срабатывании.
+        """
+        if not self.trigger_bots:
+            return
+
+        now = now or datetime.now()
+
+        with self.lock:
+            for bot_name in config_bots:
+                interval_minutes = self._interval_minutes(config_bots[bot_name])
+                if self._scheduled_bots.get(bot_name) != interval_minutes:
+                    self._scheduled_bots[bot_name] = interval_minutes
+                    self._push(self._first_fire_time(bot_name, interval_minutes, now), 'bot', bot_name,
+                               interval_minutes)
+
+        self._wakeup.set()
+
+    def _first_fire_time(self, bot_name: str, interval_minutes: int, now):
+        if bot_name in self._catch_up:
+            self._catch_up.discard(bot_name)
+
+            fire_time = last_fire_time(interval_minutes, now)
+            last_fired = self._last_fired.get(bot_name)
+            if (fire_time is not None and (last_fired is None or last_fired < fire_time) and
+                    (now - fire_time).total_seconds() <= 60 * interval_minutes * CATCH_UP_FRACTION):
+                print(f'Bot {bot_name} missed tick {fire_time} during restart, run now')
+                return fire_time
+
+        return next_fire_time(interval_minutes, now)
+
+    def get_position(self):
+        """
+        Время последнего срабатывания каждого бота для снимка состояния.
+        """
+        with self.lock:
+            return dict(self._last_fired)
+
+    def start(self):
+        config_bots = self.get_configs()
+        now = datetime.now()
+
+        self.executor = ThreadPoolExecutor(max_workers=self.max_workers or max(32, 2 * len(config_bots)))
+
+        with self.lock:
+            self._push(next_retraining_time(now), 'retraining', '')
+            if self.trigger_bots:
+                self._push(now + timedelta(seconds=self.sync_interval), 'sync', '')
+        self.sync_bots(config_bots, now)
+
+    def stop(self):
+        self._stop.set()
+        self._wakeup.set()
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+
+    def run(self):
+        if self.executor is None:
+            self.start()
+
+        while not self._stop.is_set():
+            with self.lock:
+                fire_time, _, kind, name, interval_minutes = self._queue[0]
+
+            timeout = (fire_time - datetime.now()).total_seconds()
+            if timeout > 0:
+                self._wakeup.wait(timeout)
+                self._wakeup.clear()
+                continue
+
+            with self.lock:
+                heapq.heappop(self._queue)
+
+            if kind == 'retraining':
+                self._dispatch_retraining(fire_time)
+            elif kind == 'sync':
+                self._dispatch_sync()
+            else:
+                self._dispatch_bot(name, interval_minutes, fire_time)
+
+    def _dispatch_bot(self, bot_name: str, interval_minutes: int, fire_time):
+        with self.lock:
+            if self._scheduled_bots.get(bot_name) != interval_minutes:
+                return
+
+        config_bots = self.get_configs()
+
+        if bot_name not in config_bots or self._interval_minutes(config_bots[bot_name]) != interval_minutes:
+            with self.lock:
+                self._scheduled_bots.pop(bot_name, None)
+            self.sync_bots(config_bots)
+            return
+
+        with self.lock:
+            self._last_fired[bot_name] = fire_time
+            self._push(next_fire_time(interval_minutes, max(fire_time, datetime.now())),
+                       'bot', bot_name, interval_minutes)
+
+        lag = (datetime.now() - fire_time).total_seconds()
+        metrics.observe(metrics.SCHEDULER_LAG, lag + START_DELAY_SECONDS, bot=bot_name)
+        if lag > 1:
+            print(f'Scheduler lag for bot {bot_name}: {lag:.3f} s')
+
+        future = self.executor.submit(self.run_bot, bot_name, config_bots)
+        future.add_done_callback(lambda f: f.exception() and
+                                 print(f"An error occurred in thread for bot {bot_name}: {f.exception()}"))
+
+        self.sync_bots(config_bots)
+
+    def _dispatch_sync(self):
+        with self.lock:
+            self._push(datetime.now() + timedelta(seconds=self.sync_interval), 'sync', '')
+
+        try:
+            self.sync_bots(self.get_configs())
+        except Exception as e:
+            print(f'Bots not synced with config. Error: {e}')
+
+    def _dispatch_retraining(self, fire_time):
+        with self.lock:
+            self._push(next_retraining_time(fire_time), 'retraining', '')
+
+        if self._retraining_thread is not None and self._retraining_thread.is_alive():
+            print('Retraining is still running, skip')
+            return
+
+        self._retraining_thread = threading.Thread(target=self.run_retraining, daemon=True)
+        self._retraining_thread.start()
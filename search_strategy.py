@@ -0,0 +1,101 @@
+import math
+import time as t
+import numpy as np
+
+
+MIN_TEST_WINDOWS = 50
+
+
+class GridSearch:
+    """
+    Полный перебор: каждая пара (day, order) проверяется на всех тестовых данных.
+    При заданном deadline дни проверяются группами по workers, и перебор останавливается
+    после группы, на которой закончилось время.
+    """
+
+    def search(self, evaluate, days, orders, test_rows: int, min_test_rows: int, workers: int = 1, deadline=None):
+        if deadline is None:
+            return evaluate([(day, orders) for day in days], test_rows)
+
+        error = []
+        days = list(days)
+        step = max(workers, 1)
+        for start in range(0, len(days), step):
+            error += evaluate([(day, orders) for day in days[start:start + step]], test_rows)
+
+            if t.monotonic() > deadline and start + step < len(days):
+                print(f'Search budget exceeded: checked {start + step} of {len(days)} days')
+                break
+
+        return error
+
+
+class SuccessiveHalving:
+    """
+    Successive halving по парам (day, order): все пары оцениваются на последних min_test_rows строках
+    теста, лучшая 1/eta часть переходит в следующий раунд с тестом в eta раз длиннее. Оставшаяся пара
+    всегда проверяется заново на всех тестовых данных, поэтому результат имеет тот же вид, что у GridSearch,
+    и сравним с ошибкой текущей модели. Если время вышло, на всех данных проверяется лучшая пара
+    последнего завершённого раунда.
+    """
+
+    def __init__(self, eta: int = 3, min_test_windows: int = MIN_TEST_WINDOWS):
+        self.eta = eta
+        self.min_test_windows = min_test_windows
+
+    def search(self, evaluate, days, orders, test_rows: int, min_test_rows: int, workers: int = 1, deadline=None):
+        candidates = [(day, order) for day in days for order in orders]
+
+        count_rounds = max(math.ceil(math.log(max(len(candidates), 1), self.eta)), 1)
+        rows = max(test_rows // self.eta ** (count_rounds - 1), min_test_rows + self.min_test_windows)
+
+        while True:
+            rows = min(rows, test_rows)
+            error = evaluate(group_by_day(candidates), rows)
+
+            if rows >= test_rows:
+                return error
+
+            if deadline is not None and t.monotonic() > deadline:
+                print(f'Search budget exceeded: {len(candidates)} candidates checked on {rows} of {test_rows} rows')
+                candidates = get_top_candidates(error, 1)
+            else:
+                candidates = get_top_candidates(error, max(len(candidates) // self.eta, 1))
+
+            if len(candidates) <= 1:
+                return evaluate(group_by_day(candidates), test_rows) if candidates else error
+
+            rows *= self.eta
+
+
+def group_by_day(candidates):
+    cells = {}
+    for day, order in candidates:
+        cells.setdefault(day, []).append(order)
+    return list(cells.items())
+
+
+def get_top_candidates(error, count: int):
+    """
+    count лучших пар (day, order) по минимальной mean_relative_error среди их num_values_for_predict/num_predictions.
+    """
+    best = {}
+    for entry in error:
+        key = (entry['day'], entry['order'])
+        value = entry['mean_relative_error']
+        if not np.isnan(value) and value < best.get(key, np.inf):
+            best[key] = value
+
+    return sorted(best, key=best.get)[:count]
+
+
+SEARCH_STRATEGIES = {
+    'grid': GridSearch,
+    'successive_halving': SuccessiveHalving
+}
+
+
+def get_search_strategy(strategy='grid'):
+    if isinstance(strategy, str):
+        return SEARCH_STRATEGIES[strategy]()
+    return strategy
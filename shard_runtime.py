@@ -0,0 +1,317 @@
+import os
+import sys
+import json
+import zlib
+import queue
+import signal
+import threading
+import time as t
+import multiprocessing
+
+import metrics
+
+
+SHARD_COUNT = os.cpu_count() or 1
+METRICS_SEND_INTERVAL = 5
+CHECK_INTERVAL = 1.0
+RESTART_DELAY = 5
+MAX_RESTART_DELAY = 300
+
+
+def get_shard(bot_config, count_shards: int) -> int:
+    """
+    Шард бота по (figi, interval_time): боты одного инструмента попадают в один процесс
+    и делят загрузку свечей.
+    """
+    parameters_model = bot_config['parameters_model']
+    key = f'{parameters_model["figi"]}:{parameters_model["interval_time"]}'
+    return zlib.crc32(key.encode()) % count_shards
+
+
+def assign_bots(config_bots, count_shards: int):
+    shards = [[] for _ in range(count_shards)]
+    for bot_name in sorted(config_bots):
+        shards[get_shard(config_bots[bot_name], count_shards)].append(bot_name)
+    return shards
+
+
+class QueueWriter:
+    """
+    stdout процесса шарда: строки print отправляются супервизору.
+    """
+
+    def __init__(self, log_queue, shard_id: int):
+        self.log_queue = log_queue
+        self.shard_id = shard_id
+        self._buffer = ''
+        self.lock = threading.Lock()
+
+    def write(self, text: str):
+        with self.lock:
+            self._buffer += text
+            *lines, self._buffer = self._buffer.split('\n')
+        for line in lines:
+            self.log_queue.put(('log', self.shard_id, line))
+        return len(text)
+
+    def flush(self):
+        with self.lock:
+            line, self._buffer = self._buffer, ''
+        if line:
+            self.log_queue.put(('log', self.shard_id, line))
+
+
+def get_supervisor_rate_limits():
+    """
+    Лимиты запросов супервизора: опрос get_orders счёта раз в POLL_INTERVAL (запросов в минуту).
+    """
+    from order_tracker import POLL_INTERVAL
+    from request_scheduler import METHOD_BUCKETS
+
+    return {METHOD_BUCKETS['get_orders']: 60 / POLL_INTERVAL}
+
+
+def get_shard_rate_limits(count_shards: int):
+    """
+    Лимиты одного шарда: лимиты счёта без доли супервизора, поровну на count_shards шардов.
+    """
+    from request_scheduler import RATE_LIMITS
+
+    supervisor_rate_limits = get_supervisor_rate_limits()
+    return {group: (rate - supervisor_rate_limits.get(group, 0)) / count_shards
+            for group, rate in RATE_LIMITS.items()}
+
+
+def receive_order_events(order_queue, order_tracker):
+    """
+    События счёта от супервизора: ('trade', order_id) и ('active_orders', множество order_id).
+    """
+    while True:
+        kind, payload = order_queue.get()
+        if kind == 'trade':
+            order_tracker.on_trade(payload)
+        elif kind == 'active_orders':
+            order_tracker.apply_active_orders(payload)
+
+
+def run_shard(shard_id: int, bot_names, count_shards: int, log_queue, order_queue, core: int = None):
+    """
+    Точка входа процесса шарда: запускает control_module.main только для своих ботов. Состояние
+    (limitations_cash в <конфиг>.state.json) каждого бота меняет только процесс, которому бот назначен.
+    Стрим сделок и опрос get_orders счёта ведёт супервизор, шард получает их через order_queue.
+    """
+    sys.stdout = sys.stderr = QueueWriter(log_queue, shard_id)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    if core is not None and hasattr(os, 'sched_setaffinity'):
+        try:
+            os.sched_setaffinity(0, {core})
+        except OSError as e:
+            print(f'Shard {shard_id} not pinned to core {core}. Error: {e}')
+
+    import control_module
+    from config_store import ConfigStore
+    from parallel_search import shutdown_search_pool
+    from request_scheduler import RequestScheduler, set_request_scheduler
+
+    set_request_scheduler(RequestScheduler(rate_limits=get_shard_rate_limits(count_shards)))
+    control_module.config_store = ConfigStore(bot_names=bot_names)
+    control_module.SEARCH_WORKERS = max((os.cpu_count() or 1) // count_shards, 1)
+    control_module.METRICS_PORT = None
+    control_module.ORDER_EVENTS = False
+    root, ext = os.path.splitext(control_module.WARM_START_PATH)
+    control_module.WARM_START_PATH = f'{root}_shard{shard_id}{ext}'
+    if control_module.METRICS_TRACE_PATH:
+        root, ext = os.path.splitext(control_module.METRICS_TRACE_PATH)
+        control_module.METRICS_TRACE_PATH = f'{root}_shard{shard_id}{ext}'
+
+    if control_module.METRICS_ENABLED:
+        def send_metrics():
+            while True:
+                t.sleep(METRICS_SEND_INTERVAL)
+                log_queue.put(('metrics', shard_id, metrics.registry.snapshot()))
+
+        threading.Thread(target=send_metrics, daemon=True).start()
+
+    threading.Thread(target=receive_order_events, args=(order_queue, control_module.order_tracker),
+                     daemon=True).start()
+
+    def send_order_state():
+        has_orders = None
+        while True:
+            current = control_module.order_tracker.has_orders()
+            if current != has_orders:
+                has_orders = current
+                log_queue.put(('orders', shard_id, has_orders))
+            t.sleep(CHECK_INTERVAL)
+
+    threading.Thread(target=send_order_state, daemon=True).start()
+
+    print(f'Shard {shard_id} started with bots: {bot_names}')
+    try:
+        control_module.main()
+    finally:
+        shutdown_search_pool()
+
+
+class ShardSupervisor:
+    """
+    Запускает ботов из path_to_config_bots в count_shards процессах (опционально с привязкой к ядрам),
+    перезапускает упавшие процессы с растущей задержкой, печатает их логи и собирает метрики.
+    При изменении списка ботов перезапускаются только шарды, у которых изменился состав.
+    Стрим сделок и опрос get_orders счёта ведёт только супервизор и рассылает события всем шардам;
+    get_orders опрашивается, только пока у какого-нибудь шарда есть отслеживаемые заявки.
+
+    Процессы шардов не daemon: в них переобучение создаёт свой пул процессов поиска. При выходе
+    супервизор останавливает их сам.
+    """
+
+    def __init__(self, path_to_config_bots: str, count_shards: int = SHARD_COUNT, pin_cores: bool = False):
+        self.path_to_config_bots = path_to_config_bots
+        self.count_shards = count_shards
+        self.pin_cores = pin_cores
+
+        self.context = multiprocessing.get_context('spawn')
+        self.log_queue = self.context.Queue()
+        self.processes = [None] * count_shards
+        self.order_queues = [None] * count_shards
+        self.has_orders = [False] * count_shards
+        self.order_events = None
+        self.assignment = [[] for _ in range(count_shards)]
+        self.restart_delays = [RESTART_DELAY] * count_shards
+        self.restart_at = [0] * count_shards
+        self.started_at = [0] * count_shards
+        self._stop = threading.Event()
+        self._config_mtime = None
+
+    def _read_config_bots(self):
+        with open(self.path_to_config_bots, 'r') as file:
+            config_paths = json.load(file)
+
+        config_bots = {}
+        for bot_name, config_path in config_paths.items():
+            try:
+                with open(config_path, 'r') as file:
+                    config_bots[bot_name] = json.load(file)
+            except Exception as e:
+                print(f'Config {config_path} not load. Error: {e}')
+        return config_bots
+
+    def _start(self, shard_id: int):
+        core = None
+        if self.pin_cores:
+            core = shard_id % (os.cpu_count() or 1)
+
+        self.order_queues[shard_id] = self.context.Queue()
+        process = self.context.Process(target=run_shard,
+                                       args=(shard_id, self.assignment[shard_id], self.count_shards,
+                                             self.log_queue, self.order_queues[shard_id], core),
+                                       name=f'bot-shard-{shard_id}',
+                                       daemon=False)
+        process.start()
+        self.processes[shard_id] = process
+        self.started_at[shard_id] = t.monotonic()
+
+    def _stop_shard(self, shard_id: int):
+        process = self.processes[shard_id]
+        if process is not None and process.is_alive():
+            process.terminate()
+            process.join(10)
+            if process.is_alive():
+                process.kill()
+                process.join()
+        self.processes[shard_id] = None
+        self.order_queues[shard_id] = None
+        self.has_orders[shard_id] = False
+
+    def broadcast_order_event(self, kind: str, payload):
+        for process, order_queue in zip(self.processes, self.order_queues):
+            if process is not None and order_queue is not None and process.is_alive():
+                order_queue.put((kind, payload))
+
+    def start_order_events(self):
+        from my_client_config import TOKEN, account_id
+        from order_tracker import OrderEvents
+        from request_scheduler import RequestScheduler, set_request_scheduler
+
+        set_request_scheduler(RequestScheduler(rate_limits=get_supervisor_rate_limits()))
+        self.order_events = OrderEvents(token=TOKEN,
+                                        account_id=account_id,
+                                        on_trade=lambda order_id: self.broadcast_order_event('trade', order_id),
+                                        on_active_orders=lambda orders: self.broadcast_order_event('active_orders',
+                                                                                                  orders),
+                                        need_poll=lambda: any(self.has_orders))
+        self.order_events.start()
+
+    def update_assignment(self):
+        try:
+            mtime = os.stat(self.path_to_config_bots).st_mtime_ns
+        except OSError as e:
+            print(f'Config {self.path_to_config_bots} not found. Error: {e}')
+            return
+
+        if mtime == self._config_mtime:
+            return
+        self._config_mtime = mtime
+
+        assignment = assign_bots(self._read_config_bots(), self.count_shards)
+
+        for shard_id, bot_names in enumerate(assignment):
+            if bot_names != self.assignment[shard_id] or self.processes[shard_id] is None:
+                self._stop_shard(shard_id)
+                self.assignment[shard_id] = bot_names
+                if bot_names:
+                    self._start(shard_id)
+
+    def check_processes(self):
+        for shard_id, process in enumerate(self.processes):
+            if process is None or process.is_alive() or not self.assignment[shard_id]:
+                continue
+
+            now = t.monotonic()
+            if not self.restart_at[shard_id]:
+                if now - self.started_at[shard_id] > MAX_RESTART_DELAY:
+                    self.restart_delays[shard_id] = RESTART_DELAY
+                print(f'Shard {shard_id} exited with code {process.exitcode}, '
+                      f'restart in {self.restart_delays[shard_id]} s')
+                self.restart_at[shard_id] = now + self.restart_delays[shard_id]
+                self.restart_delays[shard_id] = min(self.restart_delays[shard_id] * 2, MAX_RESTART_DELAY)
+            elif now >= self.restart_at[shard_id]:
+                self.restart_at[shard_id] = 0
+                self._start(shard_id)
+
+    def drain_logs(self, timeout: float):
+        deadline = t.monotonic() + timeout
+        while True:
+            try:
+                kind, shard_id, payload = self.log_queue.get(timeout=max(deadline - t.monotonic(), 0))
+            except queue.Empty:
+                return
+
+            if kind == 'log':
+                print(f'[shard {shard_id}] {payload}')
+            elif kind == 'orders':
+                self.has_orders[shard_id] = payload
+            elif kind == 'metrics':
+                metrics.set_source(str(shard_id), payload)
+
+    def run(self):
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGTERM, lambda signum, frame: self.stop())
+
+        try:
+            self.update_assignment()
+            self.start_order_events()
+
+            while not self._stop.is_set():
+                self.drain_logs(CHECK_INTERVAL)
+                self.check_processes()
+                self.update_assignment()
+        finally:
+            if self.order_events is not None:
+                self.order_events.stop()
+            for shard_id in range(self.count_shards):
+                self._stop_shard(shard_id)
+
+    def stop(self):
+        self._stop.set()
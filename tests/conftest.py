@@ -0,0 +1,48 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from candle_store import CANDLE_DTYPE
+
+MINUTE_NS = 60 * 10**9
+
+
+def generate_data(count_rows=300, k=3, seed=0, coefficient=0.5, level=100):
+    """
+    Ряд VAR(1) y(t) = coefficient * y(t-1) + e(t) вокруг level (count_rows x k).
+    """
+    rng = np.random.default_rng(seed)
+    data = np.zeros((count_rows, k))
+    for row in range(1, count_rows):
+        data[row] = coefficient * data[row - 1] + rng.normal(size=k)
+    return data + level
+
+
+def generate_candles(count, seed=0, start=0):
+    """
+    Минутные свечи CANDLE_DTYPE со случайным блужданием цены, время с минуты start.
+    """
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, count)))
+    candles = np.zeros(count, dtype=CANDLE_DTYPE)
+    candles['time'] = (start + np.arange(count)) * MINUTE_NS
+    candles['open'] = np.concatenate([[100], close[:-1]])
+    candles['close'] = close
+    candles['high'] = np.maximum(candles['open'], close) * (1 + rng.uniform(0, 0.005, count))
+    candles['low'] = np.minimum(candles['open'], close) * (1 - rng.uniform(0, 0.005, count))
+    candles['volume'] = rng.integers(1, 1000, count)
+    return candles
+
+
+@pytest.fixture
+def make_data():
+    return generate_data
+
+
+@pytest.fixture
+def make_candles():
+    return generate_candles
@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+
+from backtest import get_fills, get_max_drawdown, simulate
+from candle_store import CANDLE_DTYPE
+from my_client_config import EXCHANGE_COMMISSION
+
+
+def make_path():
+    candles = np.zeros(5, dtype=CANDLE_DTYPE)
+    candles['time'] = np.arange(5) * 60 * 10**9
+    candles['low'] = [10, 9, 11, 8, 12]
+    candles['high'] = [11, 12, 13, 10, 14]
+    candles['close'] = [10.5, 11, 12, 9, 13]
+    return candles
+
+
+def make_limitations_cash(money=1000, lots=1):
+    return {'quantity': 1, 'stock_in_lot': 10, 'min_count_lot': 0, 'min_count_money': 0,
+            'current_count_money': money, 'current_count_lot': lots}
+
+
+def test_fills_look_ttl_candles_ahead():
+    candles = make_path()
+    ticks = np.arange(4)
+    buy = np.full(4, 9.0)
+    sell = np.array([12.0, 14.0, 10.0, 20.0])
+
+    buy_filled, sell_filled = get_fills(candles, ticks, buy, sell, ttl_candles=1)
+    np.testing.assert_array_equal(buy_filled, [True, False, True, False])
+    np.testing.assert_array_equal(sell_filled, [True, False, True, False])
+
+    buy_filled, sell_filled = get_fills(candles, ticks, buy, sell, ttl_candles=2)
+    np.testing.assert_array_equal(buy_filled, [True, True, True, False])
+    np.testing.assert_array_equal(sell_filled, [True, False, True, False])
+
+
+def test_simulate_settles_after_ttl_with_commission():
+    candles = make_path()
+    ticks = np.arange(4)
+    benefit = np.array([True, False, False, False])
+    buy = np.array([9.0, 0, 0, 0])
+    sell = np.array([12.0, 0, 0, 0])
+    filled = np.array([True, False, False, False])
+
+    equity, placed, count_filled, money, lots = simulate(candles, ticks, benefit, buy, sell, filled, filled,
+                                                         make_limitations_cash(), ttl_candles=2)
+
+    expected_money = 1000 - 90 * (1 + EXCHANGE_COMMISSION) + 120 * (1 - EXCHANGE_COMMISSION)
+    assert (placed, count_filled, lots) == (2, 2, 1)
+    assert money == pytest.approx(expected_money)
+    np.testing.assert_allclose(equity, [1105, 1110, expected_money + 120, expected_money + 90])
+
+
+def test_simulate_respects_limitations_cash():
+    candles = make_path()
+    ticks = np.arange(2)
+    benefit = np.array([True, True])
+    price = np.array([9.0, 9.0])
+    filled = np.array([True, True])
+
+    _, placed, count_filled, money, lots = simulate(candles, ticks, benefit, price, price, filled, filled,
+                                                    make_limitations_cash(money=100, lots=0), ttl_candles=1)
+
+    # на первом тике нечего продавать, на втором не хватает денег на покупку
+    assert (placed, count_filled, lots) == (2, 2, 0)
+    assert money == pytest.approx(100 - 90 * (1 + EXCHANGE_COMMISSION) + 90 * (1 - EXCHANGE_COMMISSION))
+
+
+def test_max_drawdown():
+    assert get_max_drawdown(np.array([100, 120, 90, 130, 65])) == pytest.approx(0.5)
+    assert get_max_drawdown(np.array([100, 110, 120])) == 0.0
+    assert get_max_drawdown(np.array([0, -10, 5, 4])) == pytest.approx(0.2)
+    assert get_max_drawdown(np.array([])) == 0.0
@@ -0,0 +1,75 @@
+import numpy as np
+
+from candle_store import CandleStore, get_values
+
+
+def make_store(tmp_path):
+    return CandleStore('figi', '1min', root=str(tmp_path))
+
+
+def test_append_overwrites_overlap_and_truncates(tmp_path, make_candles):
+    store = make_store(tmp_path)
+    candles = make_candles(100)
+    store.append(candles[:60])
+    store.append(candles[59:80])
+    assert store.count == 80
+    np.testing.assert_array_equal(store.window(1000), candles[:80])
+
+    update = make_candles(5, seed=1, start=70)
+    store.append(update)
+    assert store.count == 75
+    np.testing.assert_array_equal(store.window(1000), np.concatenate([candles[:70], update]))
+    assert store.last_time() == int(update['time'][-1])
+
+
+def test_append_grows_and_reopens(tmp_path, make_candles):
+    store = make_store(tmp_path)
+    candles = make_candles(5000)
+    store.append(candles[:3000])
+    store.append(candles[2999:])
+
+    reopened = make_store(tmp_path)
+    assert reopened.count == 5000
+    np.testing.assert_array_equal(reopened.since(int(candles['time'][4990])), candles[4990:])
+    np.testing.assert_array_equal(reopened.until(int(candles['time'][9])), candles[:10])
+
+
+def test_replace_and_restore(tmp_path, make_candles):
+    store = make_store(tmp_path)
+    store.append(make_candles(50))
+
+    deeper = make_candles(80, seed=2, start=-30)
+    store.replace(deeper, covered_from=int(deeper['time'][0]))
+    assert store.covered_from == int(deeper['time'][0])
+    np.testing.assert_array_equal(store.window(1000), deeper)
+
+    store.restore(make_candles(90, seed=2, start=-30))
+    assert store.count == 90
+    np.testing.assert_array_equal(store.window(10), make_candles(90, seed=2, start=-30)[-10:])
+
+    store.restore(make_candles(10, seed=3, start=500))
+    assert store.count == 90
+
+    empty = CandleStore('other', '1min', root=str(tmp_path))
+    empty.restore(deeper)
+    np.testing.assert_array_equal(empty.window(1000), deeper)
+
+
+def test_windows_stay_stable(tmp_path, make_candles):
+    store = make_store(tmp_path)
+    candles = make_candles(100)
+    store.append(candles)
+
+    closed = store.until(int(candles['time'][-2]))
+    window = store.window(30)
+    history = store.since(int(candles['time'][50]))
+    values = get_values(window)
+    expected = [np.array(closed), np.array(window), np.array(history), values.copy()]
+
+    store.append(make_candles(3, seed=4, start=99))
+    store.append(make_candles(10, seed=5, start=80))
+    store.replace(make_candles(20, seed=6, start=90), covered_from=int(candles['time'][90]))
+
+    for actual, before in zip([closed, window, history, values], expected):
+        np.testing.assert_array_equal(actual, before)
+    assert not window.flags.writeable
@@ -0,0 +1,85 @@
+import asyncio
+
+import pytest
+from grpc import StatusCode
+
+from client_pool import AsyncClientSession
+
+
+class UnavailableError(Exception):
+    code = StatusCode.UNAVAILABLE
+
+
+class FakeAsyncClient:
+    def __init__(self, token, healthy=True):
+        self.token = token
+        self.healthy = healthy
+        self.closed = False
+        self.users = self
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        self.closed = True
+
+    async def get_accounts(self):
+        if not self.healthy:
+            raise UnavailableError()
+
+
+def make_session(clients, health_check_interval=60):
+    def factory(token):
+        clients.append(FakeAsyncClient(token))
+        return clients[-1]
+    return AsyncClientSession('token', health_check_interval=health_check_interval, client_factory=factory)
+
+
+def test_async_session_reuses_channel_and_closes_retired_one_after_last_call():
+    clients = []
+    session = make_session(clients)
+
+    async def run():
+        started, release = asyncio.Event(), asyncio.Event()
+
+        async def slow_call():
+            async with session.client() as services:
+                started.set()
+                await release.wait()
+                return services
+
+        slow = asyncio.ensure_future(slow_call())
+        await started.wait()
+
+        with pytest.raises(UnavailableError):
+            async with session.client():
+                raise UnavailableError()
+        assert not clients[0].closed
+
+        release.set()
+        assert await slow is clients[0]
+        assert clients[0].closed
+
+        async with session.client() as services:
+            assert services is clients[1]
+        await session.close()
+
+    asyncio.run(run())
+    assert len(clients) == 2
+    assert clients[1].closed
+
+
+def test_async_session_reconnects_after_failed_health_check():
+    clients = []
+    session = make_session(clients, health_check_interval=-1)
+
+    async def run():
+        async with session.client() as services:
+            assert services is clients[0]
+        clients[0].healthy = False
+        async with session.client() as services:
+            assert services is clients[1]
+
+    asyncio.run(run())
+    assert clients[0].closed
+    assert not clients[1].closed
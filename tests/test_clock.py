@@ -0,0 +1,15 @@
+from datetime import datetime, timezone
+
+import clock
+
+
+def test_set_clock_pins_and_restores_time():
+    pinned = datetime(2026, 3, 4, 12, 0, tzinfo=timezone.utc)
+    clock.set_clock(int(pinned.timestamp()) * 10**9)
+    try:
+        assert clock.now_ns() == int(pinned.timestamp()) * 10**9
+        assert clock.now() == pinned
+    finally:
+        clock.set_clock()
+
+    assert clock.now_ns() > int(pinned.timestamp()) * 10**9
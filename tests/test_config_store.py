@@ -0,0 +1,114 @@
+import os
+import json
+import time as t
+
+from config_store import ConfigStore, get_state_path
+
+
+def make_bot(tmp_path, bot_name='bot', other_bots=()):
+    config_paths = {}
+    for name in (bot_name,) + tuple(other_bots):
+        config_paths[name] = str(tmp_path / f'{name}.json')
+        with open(config_paths[name], 'w') as file:
+            json.dump({'parameters_model': {'order': 1},
+                       'limitations_cash': {'current_count_money': 100, 'current_count_lot': 0, 'quantity': 1}},
+                      file)
+
+    path_to_config_bots = str(tmp_path / 'path_to_config_bots.json')
+    with open(path_to_config_bots, 'w') as file:
+        json.dump(config_paths, file)
+    return path_to_config_bots, config_paths[bot_name]
+
+
+def edit_file(path, update):
+    with open(path, 'r') as file:
+        data = json.load(file)
+    update(data)
+    with open(path, 'w') as file:
+        json.dump(data, file)
+    os.utime(path, ns=(t.time_ns() + 10**9, t.time_ns() + 10**9))
+
+
+def test_update_state_is_written_to_state_file(tmp_path):
+    path_to_config_bots, config_path = make_bot(tmp_path)
+    store = ConfigStore(path_to_config_bots, write_delay=60)
+
+    store.update_state('bot', lambda state: state.update(current_count_money=50))
+    store.flush()
+
+    with open(get_state_path(config_path), 'r') as file:
+        assert json.load(file)['state']['current_count_money'] == 50
+    assert ConfigStore(path_to_config_bots).get_config('bot')['limitations_cash']['current_count_money'] == 50
+
+
+def test_reload_keeps_unflushed_config_update(tmp_path):
+    path_to_config_bots, config_path = make_bot(tmp_path)
+    store = ConfigStore(path_to_config_bots, write_delay=60)
+
+    store.update_config('bot', lambda config: config['parameters_model'].update(order=7))
+    edit_file(config_path, lambda config: config.update(comment='operator'))
+    store.check_changes()
+
+    config = store.get_config('bot')
+    assert config['parameters_model']['order'] == 7
+    assert config['comment'] == 'operator'
+
+    store.flush()
+    with open(config_path, 'r') as file:
+        config = json.load(file)
+    assert config['parameters_model']['order'] == 7
+    assert config['comment'] == 'operator'
+
+
+def test_operator_state_edit_keeps_unflushed_fill(tmp_path):
+    path_to_config_bots, config_path = make_bot(tmp_path)
+    store = ConfigStore(path_to_config_bots, write_delay=60)
+
+    store.update_state('bot', lambda state: state.update(current_count_lot=state['current_count_lot'] + 1))
+    edit_file(config_path, lambda config: config['limitations_cash'].update(current_count_money=1000))
+    store.check_changes()
+
+    limitations_cash = store.get_config('bot')['limitations_cash']
+    assert limitations_cash['current_count_money'] == 1000
+    assert limitations_cash['current_count_lot'] == 1
+
+
+def test_bots_in_one_directory_keep_separate_states(tmp_path):
+    path_to_config_bots, _ = make_bot(tmp_path, 'first', other_bots=['second'])
+    store = ConfigStore(path_to_config_bots, write_delay=60)
+
+    store.update_state('first', lambda state: state.update(current_count_money=10))
+    store.update_state('second', lambda state: state.update(current_count_money=20))
+    store.flush()
+
+    restarted = ConfigStore(path_to_config_bots)
+    assert restarted.get_config('first')['limitations_cash']['current_count_money'] == 10
+    assert restarted.get_config('second')['limitations_cash']['current_count_money'] == 20
+
+
+def test_operator_edit_while_stopped_wins_over_state(tmp_path):
+    path_to_config_bots, config_path = make_bot(tmp_path)
+    store = ConfigStore(path_to_config_bots, write_delay=60)
+    store.update_state('bot', lambda state: state.update(current_count_lot=3))
+    store.flush()
+
+    edit_file(config_path, lambda config: config['parameters_model'].update(order=2))
+    assert ConfigStore(path_to_config_bots).get_config('bot')['limitations_cash']['current_count_lot'] == 3
+
+    edit_file(config_path, lambda config: config['limitations_cash'].update(current_count_money=500))
+    limitations_cash = ConfigStore(path_to_config_bots).get_config('bot')['limitations_cash']
+    assert limitations_cash['current_count_money'] == 500
+    assert limitations_cash['current_count_lot'] == 0
+
+
+def test_update_config_keeps_state_after_restart(tmp_path):
+    path_to_config_bots, config_path = make_bot(tmp_path)
+    store = ConfigStore(path_to_config_bots, write_delay=60)
+    store.update_state('bot', lambda state: state.update(current_count_lot=2))
+    store.flush()
+    store.update_config('bot', lambda config: config['parameters_model'].update(order=4))
+    store.flush()
+
+    config = ConfigStore(path_to_config_bots).get_config('bot')
+    assert config['parameters_model']['order'] == 4
+    assert config['limitations_cash']['current_count_lot'] == 2
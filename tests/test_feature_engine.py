@@ -0,0 +1,86 @@
+import numpy as np
+import pytest
+
+from candle_store import CandleStore
+from feature_engine import EMA, ATR, Feature, FeatureCache, get_feature_values, get_pipeline, parse_feature, smooth
+
+FEATURES = ('close', 'log_return', 'ema_20', 'atr_14', 'volatility_10', 'volume_zscore_10')
+
+
+@pytest.mark.parametrize('spec', FEATURES)
+def test_update_and_peek_match_compute(make_candles, spec):
+    feature = parse_feature(spec)
+    candles = make_candles(300)
+    expected = feature.compute(candles)
+
+    state = feature.get_state(candles[:100], feature.compute(candles[:100]))
+    for row in range(100, len(candles)):
+        assert feature.peek(state, candles[row]) == pytest.approx(expected[row], rel=1e-9, nan_ok=True)
+        assert feature.update(state, candles[row]) == pytest.approx(expected[row], rel=1e-9, nan_ok=True)
+
+
+def test_smoothing_warm_up_forgets_start(make_candles):
+    assert EMA(20).warm_up > 2 * 20
+    assert ATR(14).warm_up > 4 * 14
+
+    candles = make_candles(500)
+    for feature in (EMA(20), ATR(14)):
+        full = feature.compute(candles)
+        tail = feature.compute(candles[100:])
+        assert abs(tail[feature.warm_up] - full[100 + feature.warm_up]) < 0.01 * abs(tail[0] - full[100]) + 1e-12
+
+
+def test_cached_values_match_fresh_compute(make_candles):
+    candles = make_candles(400)
+    pipeline = get_pipeline(FEATURES)
+    cache = FeatureCache(capacity=128)
+
+    for end in list(range(120, 200)) + [260, 261, 300]:
+        window = candles[end - 100:end]
+        expected = pipeline.compute(candles[20:end])[-30:]
+        np.testing.assert_allclose(cache.get(window, pipeline, 30), expected, rtol=1e-9)
+
+
+def test_cache_is_seeded_from_store_history(make_candles, tmp_path):
+    candles = make_candles(400)
+    store = CandleStore('figi', '1min', root=str(tmp_path))
+    store.append(candles)
+
+    pipeline = get_pipeline(FEATURES)
+    cache = FeatureCache(history=store.until)
+    expected = pipeline.compute(candles)
+
+    for end in (300, 301, 350):
+        window = candles[end - 60:end]
+        np.testing.assert_allclose(cache.get(window, pipeline, 20), expected[end - 20:end], rtol=1e-9)
+
+
+def test_cache_ignores_history_not_matching_window(make_candles, tmp_path):
+    store = CandleStore('figi', '1min', root=str(tmp_path))
+    store.append(make_candles(400, seed=1))
+
+    window = make_candles(100, seed=2, start=1000)
+    cache = FeatureCache(history=store.until)
+    pipeline = get_pipeline(FEATURES)
+    np.testing.assert_allclose(cache.get(window, pipeline), pipeline.compute(window), rtol=1e-9)
+
+
+def test_get_feature_values_without_cache(make_candles):
+    candles = make_candles(50)
+    values = get_feature_values(candles, FEATURES, count_rows=10)
+    np.testing.assert_allclose(values, get_pipeline(FEATURES).compute(candles)[-10:], rtol=1e-9)
+
+
+@pytest.mark.parametrize('alpha', [1e-4, 1 / 14, 2 / 21, 0.5, 1.0])
+def test_smooth_matches_recursion(alpha):
+    values = np.random.default_rng(0).normal(100, 5, 5000)
+    expected = np.empty(len(values))
+    expected[0] = values[0]
+    for row in range(1, len(values)):
+        expected[row] = alpha * values[row] + (1 - alpha) * expected[row - 1]
+    np.testing.assert_allclose(smooth(values, alpha), expected, rtol=1e-12)
+
+
+def test_feature_is_abstract():
+    with pytest.raises(TypeError):
+        Feature()
@@ -0,0 +1,76 @@
+import numpy as np
+
+from market_stream import CLOSE_GRACE_SECONDS, CandleAggregator, CandleRingBuffer
+
+MINUTE_NS = 60 * 10**9
+
+
+def test_ring_buffer_wraps_around(make_candles):
+    candles = make_candles(12)
+    buffer = CandleRingBuffer(5)
+    buffer.extend(candles[:3])
+    np.testing.assert_array_equal(buffer.window(10), candles[:3])
+
+    for candle in candles[3:8]:
+        buffer.push(candle)
+    assert buffer.count == 5
+    np.testing.assert_array_equal(buffer.view(), candles[3:8])
+    np.testing.assert_array_equal(buffer.window(3), candles[5:8])
+    np.testing.assert_array_equal(buffer.window(3, end_time=int(candles['time'][6])), candles[4:7])
+
+    buffer.extend(candles)
+    np.testing.assert_array_equal(buffer.view(), candles[-5:])
+    assert buffer.last()['time'] == candles['time'][-1]
+
+
+def test_ring_buffer_windows_stay_stable(make_candles):
+    candles = make_candles(20)
+    buffer = CandleRingBuffer(5)
+    buffer.extend(candles[:5])
+
+    closed = buffer.window(2, end_time=int(candles['time'][3]))
+    latest = buffer.window(5)
+    expected = [np.array(closed), np.array(latest)]
+
+    updated = candles[4].copy()
+    updated['close'] += 1
+    buffer.update_last(updated)
+    buffer.extend(candles[5:20])
+
+    np.testing.assert_array_equal(closed, expected[0])
+    np.testing.assert_array_equal(latest, expected[1])
+    assert not closed.flags.writeable
+
+
+def test_aggregator_builds_interval_candles_from_minutes(make_candles):
+    minutes = make_candles(12)
+    buffer = CandleRingBuffer(10)
+    closed = []
+    aggregator = CandleAggregator('figi', '5min', 5, buffer,
+                                  on_close=lambda figi, interval_time, candle_time: closed.append(candle_time))
+
+    for minute in minutes:
+        aggregator.add_minute_candle(int(minute['time']), minute['open'], minute['close'], minute['high'],
+                                     minute['low'], minute['volume'])
+    # повтор минуты с новым объёмом заменяет её объём, а не добавляет
+    last = minutes[-1]
+    aggregator.add_minute_candle(int(last['time']), last['open'], last['close'], last['high'], last['low'], 7)
+    # минута из закрытой свечи игнорируется
+    aggregator.add_minute_candle(0, 1.0, 1.0, 1.0, 1.0, 1)
+
+    assert closed == [0, 5 * MINUTE_NS]
+    candles = buffer.view()
+    np.testing.assert_array_equal(candles['time'], [0, 5 * MINUTE_NS, 10 * MINUTE_NS])
+    for candle, part in zip(candles, [minutes[:5], minutes[5:10], minutes[10:]]):
+        assert candle['open'] == part['open'][0]
+        assert candle['close'] == part['close'][-1]
+        assert candle['high'] == part['high'].max()
+        assert candle['low'] == part['low'].min()
+    assert candles['volume'][0] == minutes['volume'][:5].sum()
+    assert candles['volume'][2] == minutes['volume'][10] + 7
+
+    aggregator.check_closed(15 * MINUTE_NS)
+    assert closed == [0, 5 * MINUTE_NS]
+    aggregator.check_closed(15 * MINUTE_NS + CLOSE_GRACE_SECONDS * 10**9)
+    aggregator.check_closed(16 * MINUTE_NS)
+    assert closed == [0, 5 * MINUTE_NS, 10 * MINUTE_NS]
@@ -0,0 +1,51 @@
+import os
+
+import numpy as np
+from statsmodels.tsa.vector_ar.var_model import VAR
+
+from model_func import save_model
+from model_registry import ModelRegistry
+from var_engine import fit_var_orders, get_compact_model_path, save_compact_model
+
+
+def test_pkl_is_converted_to_npz_with_same_forecast(make_data, tmp_path):
+    data = make_data(count_rows=300, k=3)
+    model = VAR(data).fit(maxlags=3, ic=None, trend='c')
+    path_model = str(tmp_path / 'model.pkl')
+    save_model(model, path_model)
+
+    loaded = ModelRegistry().get(path_model)
+
+    assert os.path.exists(get_compact_model_path(path_model))
+    np.testing.assert_allclose(loaded.forecast(data[-10:], steps=4), model.forecast(data[-10:], steps=4),
+                               rtol=1e-12)
+
+    os.remove(path_model)
+    reloaded = ModelRegistry().get(path_model)
+    np.testing.assert_array_equal(reloaded.forecast(data[-10:], steps=4), loaded.forecast(data[-10:], steps=4))
+
+
+def test_registry_reloads_rewritten_model(make_data, tmp_path):
+    data = make_data(count_rows=300, k=3)
+    models = fit_var_orders(data, [2, 3])
+    path_model = str(tmp_path / 'model.pkl')
+    path_compact = get_compact_model_path(path_model)
+    save_compact_model(models[2], path_compact)
+
+    registry = ModelRegistry()
+    first = registry.get(path_model)
+    assert registry.get(path_model) is first
+    assert first.k_ar == 2
+
+    save_compact_model(models[3], path_compact)
+    assert registry.get(path_model).k_ar == 3
+
+    # тот же размер файла, изменился только mtime
+    save_compact_model(models[2], path_compact)
+    cached = registry.get(path_model)
+    save_compact_model(models[2], path_compact)
+    stat = os.stat(path_compact)
+    os.utime(path_compact, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    reloaded = registry.get(path_model)
+    assert reloaded is not cached
+    assert reloaded.k_ar == 2
@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+
+from online_var import OnlineVAR
+from var_engine import fit_var_orders
+
+
+@pytest.mark.parametrize('trend', ['c', 'ct'])
+def test_updates_without_forgetting_match_batch_refit(make_data, trend):
+    data = make_data(count_rows=400, k=2, coefficient=0.6, level=50)
+    order = 3
+    online = OnlineVAR(fit_var_orders(data[:200], [order], trend=trend)[order], forgetting_factor=1.0)
+    online.warm_up(data[:200])
+
+    for row in range(200, len(data)):
+        online.update(data[row - order:row], data[row])
+
+    expected = fit_var_orders(data, [order], trend=trend)[order]
+    np.testing.assert_allclose(online.model.coefs, expected.coefs, rtol=1e-6, atol=1e-8)
+    np.testing.assert_allclose(online.model.coefs_exog, expected.coefs_exog, rtol=1e-6, atol=1e-8)
+    assert online.count_updates == 200
+    assert online.mean_relative_error is not None
+
+
+def test_update_candles_skips_seen_candles(make_data, tmp_path):
+    data = make_data(count_rows=400, k=2, coefficient=0.6, level=50)
+    times = np.arange(len(data)) * 60 * 10**9
+    order = 2
+    model = fit_var_orders(data[:200], [order])[order]
+
+    online = OnlineVAR(model)
+    online.warm_up(data[:200])
+    online.last_time = int(times[199])
+    online.update_candles(times[:300], data[:300])
+    online.update_candles(times[250:350], data[250:350])
+
+    reference = OnlineVAR(model)
+    reference.warm_up(data[:200])
+    for row in range(200, 350):
+        reference.update(data[row - order:row], data[row])
+
+    assert online.count_updates == 150
+    np.testing.assert_allclose(online.theta, reference.theta, rtol=1e-12)
+
+    file_path = str(tmp_path / 'online.npz')
+    online.save(file_path, base_version=(1, 2))
+    restored = OnlineVAR(model)
+    assert not restored.load(file_path, base_version=(1, 3))
+    assert restored.load(file_path, base_version=(1, 2))
+    np.testing.assert_allclose(restored.theta, online.theta)
+    assert restored.last_time == online.last_time
@@ -0,0 +1,120 @@
+import os
+import time as t
+
+import order_journal
+from order_journal import ARCHIVE_DIR, OrderJournal
+
+
+def make_order(number: int):
+    return {'buy_or_sell': 'BUY', 'price': 100.0 + number, 'time': f'2026-01-01 10:{number // 60:02d}:{number % 60:02d}'}
+
+
+def test_append_and_get(tmp_path):
+    journal = OrderJournal(str(tmp_path))
+    journal.append('a', make_order(1))
+    journal.append('b', make_order(2))
+
+    assert journal.get('a') == make_order(1)
+    assert journal.get('b') == make_order(2)
+    assert journal.get('c') is None
+
+
+def test_index_survives_reopen(tmp_path):
+    journal = OrderJournal(str(tmp_path), segment_max_bytes=400)
+    for number in range(20):
+        journal.append(f'order_{number}', make_order(number))
+    journal.close()
+
+    journal = OrderJournal(str(tmp_path), segment_max_bytes=400)
+    assert all(journal.get(f'order_{number}') == make_order(number) for number in range(20))
+
+
+def test_later_record_supersedes(tmp_path):
+    journal = OrderJournal(str(tmp_path))
+    journal.append('a', make_order(1))
+    journal.append('a', make_order(5))
+
+    assert journal.get('a') == make_order(5)
+    assert list(journal.orders_between('', '\uffff')) == ['a']
+
+
+def test_orders_between(tmp_path):
+    journal = OrderJournal(str(tmp_path))
+    for number in range(10):
+        journal.append(f'order_{number}', make_order(number))
+
+    orders = journal.orders_between(make_order(3)['time'], make_order(5)['time'])
+    assert list(orders) == ['order_3', 'order_4', 'order_5']
+
+
+def test_compact_rewrites_only_superseded_segments(tmp_path):
+    journal = OrderJournal(str(tmp_path), segment_max_bytes=10**6, max_segments=100)
+    for number in range(10):
+        journal.append(f'order_{number}', make_order(number))
+    journal._open_segment(journal._segment + 1)
+    for number in range(8):
+        journal.append(f'order_{number}', make_order(100 + number))
+    journal._open_segment(journal._segment + 1)
+
+    first, second = journal.segments()[:2]
+    size_second = os.path.getsize(journal._segment_path(second))
+    journal.compact()
+
+    assert journal.segment_records[first] == 2
+    assert os.path.getsize(journal._segment_path(second)) == size_second
+    assert all(journal.get(f'order_{number}') == make_order(100 + number) for number in range(8))
+    assert journal.get('order_9') == make_order(9)
+
+    journal.close()
+    journal = OrderJournal(str(tmp_path))
+    assert all(journal.get(f'order_{number}') == make_order(100 + number) for number in range(8))
+    assert journal.get('order_8') == make_order(8)
+
+
+def test_old_segments_are_archived(tmp_path):
+    journal = OrderJournal(str(tmp_path), segment_max_bytes=300, max_segments=3)
+    for number in range(60):
+        journal.append(f'order_{number}', make_order(number))
+
+    assert len(journal.segments()) <= 3
+    assert os.listdir(os.path.join(str(tmp_path), ARCHIVE_DIR))
+    assert journal.get('order_0') is None
+    assert journal.get('order_59') == make_order(59)
+
+    archived = set()
+    for name in os.listdir(os.path.join(str(tmp_path), ARCHIVE_DIR)):
+        with open(os.path.join(str(tmp_path), ARCHIVE_DIR, name), 'rb') as file:
+            archived.update(line for line in file)
+    assert len(archived) + len(journal.index) == 60
+
+
+def count_fsyncs(monkeypatch):
+    calls = []
+    fsync = os.fsync
+    monkeypatch.setattr(order_journal.os, 'fsync', lambda fd: (calls.append(fd), fsync(fd)))
+    return calls
+
+
+def test_last_records_are_synced_without_new_appends(tmp_path, monkeypatch):
+    calls = count_fsyncs(monkeypatch)
+    journal = OrderJournal(str(tmp_path), fsync_every=100, fsync_interval=0.1)
+    journal.append('a', make_order(1))
+    journal.append('b', make_order(2))
+    assert calls == []
+
+    deadline = t.monotonic() + 5
+    while journal._pending and t.monotonic() < deadline:
+        t.sleep(0.02)
+    assert journal._pending == 0
+    assert len(calls) == 1
+    journal.close()
+
+
+def test_close_syncs_pending_records(tmp_path, monkeypatch):
+    calls = count_fsyncs(monkeypatch)
+    journal = OrderJournal(str(tmp_path), fsync_every=100, fsync_interval=60)
+    journal.append('a', make_order(1))
+    journal.close()
+
+    assert len(calls) == 1
+    assert journal._fsync_timer is None
@@ -0,0 +1,101 @@
+import time as t
+
+import pytest
+
+import order_tracker
+from order_tracker import OrderTracker, TimerWheel
+
+
+def test_timer_wheel_expires_after_delay():
+    wheel = TimerWheel(tick=1.0, slots=4)
+    now = t.monotonic()
+    wheel.schedule('short', 2)
+    wheel.schedule('long', 10)
+
+    assert wheel.advance(now + 1) == []
+    assert wheel.advance(now + 4) == ['short']
+    assert wheel.advance(now + 8) == []
+    assert wheel.advance(now + 12) == ['long']
+
+
+def test_timer_wheel_cancel_and_reschedule():
+    wheel = TimerWheel(tick=1.0)
+    now = t.monotonic()
+    wheel.schedule('cancelled', 2)
+    wheel.schedule('moved', 2)
+    wheel.cancel('cancelled')
+    wheel.schedule('moved', 6)
+
+    assert wheel.advance(now + 4) == []
+    assert wheel.advance(now + 8) == ['moved']
+
+
+@pytest.fixture
+def broker(monkeypatch):
+    calls = {'status': 'FILL', 'checked': [], 'cancelled': []}
+
+    def check_status_order(token, account_id, order_id):
+        calls['checked'].append(order_id)
+        return calls['status']
+
+    monkeypatch.setattr(order_tracker, 'check_status_order', check_status_order)
+    monkeypatch.setattr(order_tracker, 'cansel_order',
+                        lambda token, account_id, order_id: calls['cancelled'].append(order_id))
+    return calls
+
+
+def make_tracker():
+    done = []
+    tracker = OrderTracker('token', 'account', lambda *args: done.append(args), use_stream=False)
+    return tracker, done
+
+
+def test_order_is_finished_once(broker):
+    tracker, done = make_tracker()
+    tracker.track('bot', 'order', {'price': 1}, ttl_seconds=60)
+
+    tracker.on_trade('order')
+    tracker.on_trade('order')
+    tracker.apply_active_orders({})
+    tracker.executor.shutdown(wait=True)
+
+    assert done == [('bot', 'order', {'price': 1, 'status': 'FILL'}, 'FILL')]
+    assert not tracker.has_orders()
+
+
+def test_events_for_untracked_or_active_orders_are_ignored(broker):
+    tracker, done = make_tracker()
+    tracker.track('bot', 'order', {}, ttl_seconds=60)
+
+    tracker.on_trade('other')
+    tracker.apply_active_orders({'order': object()})
+    tracker.executor.shutdown(wait=True)
+
+    assert broker['checked'] == []
+    assert done == []
+    assert tracker.has_orders()
+
+
+def test_not_final_status_keeps_order(broker):
+    broker['status'] = 'NEW'
+    tracker, done = make_tracker()
+    tracker.track('bot', 'order', {}, ttl_seconds=60)
+
+    tracker.on_trade('order')
+    tracker.executor.shutdown(wait=True)
+
+    assert broker['checked'] == ['order']
+    assert done == []
+    assert tracker.has_orders()
+
+
+def test_expired_order_is_cancelled(broker):
+    broker['status'] = 'NEW'
+    tracker, done = make_tracker()
+    tracker.track('bot', 'order', {}, ttl_seconds=60)
+
+    tracker.expire_order('order')
+    tracker.expire_order('order')
+
+    assert broker['cancelled'] == ['order']
+    assert done == [('bot', 'order', {'status': 'CANCELLED'}, 'CANCELLED')]
@@ -0,0 +1,86 @@
+import threading
+
+import pytest
+
+import request_scheduler
+from request_scheduler import RequestScheduler, TokenBucket
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_token_bucket_refills_with_clock():
+    clock = FakeClock()
+    bucket = TokenBucket(60, burst=2, clock=clock)
+
+    bucket.take()
+    bucket.take()
+    assert bucket.wait_time() == pytest.approx(1.0)
+
+    clock.now += 0.5
+    assert bucket.wait_time() == pytest.approx(0.5)
+    clock.now += 10
+    assert bucket.wait_time() == 0
+    assert bucket.tokens == 2
+
+    bucket.block(3)
+    assert bucket.wait_time() == pytest.approx(3)
+
+
+def test_rate_limit_is_per_method_group():
+    clock = FakeClock()
+    scheduler = RequestScheduler(rate_limits={'market_data': 4, 'orders': 4}, clock=clock)
+    calls = []
+
+    for n in range(int(scheduler.buckets['market_data'].capacity)):
+        scheduler.call('get_candles', lambda: calls.append('candles'))
+
+    waiting = threading.Thread(target=scheduler.call, args=('get_candles', lambda: calls.append('late candles')))
+    waiting.start()
+    waiting.join(0.2)
+    assert waiting.is_alive()
+
+    scheduler.call('post_order', lambda: calls.append('order'))
+    assert calls == ['candles', 'order']
+    assert scheduler.buckets['market_data'].wait_time() == pytest.approx(15)
+
+    clock.now += 15
+    scheduler.call('post_order', lambda: calls.append('order'))
+    waiting.join(5)
+    assert not waiting.is_alive()
+    assert calls.count('late candles') == 1
+
+
+def test_same_key_requests_are_coalesced(monkeypatch):
+    scheduler = RequestScheduler(clock=FakeClock())
+    started, release, joined = threading.Event(), threading.Event(), threading.Event()
+    calls = []
+    results = []
+
+    def request():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return 'accounts'
+
+    monkeypatch.setattr(request_scheduler.metrics, 'inc', lambda name, **labels: joined.set())
+
+    owner = threading.Thread(target=lambda: results.append(scheduler.call('get_accounts', request, key='accounts')))
+    owner.start()
+    assert started.wait(5)
+
+    follower = threading.Thread(target=lambda: results.append(scheduler.call('get_accounts', request, key='accounts')))
+    follower.start()
+    assert joined.wait(5)
+    release.set()
+    owner.join(5)
+    follower.join(5)
+
+    assert calls == [1]
+    assert results == ['accounts', 'accounts']
+    assert scheduler.call('get_accounts', lambda: 'again', key='accounts') == 'again'
@@ -0,0 +1,91 @@
+import threading
+import time as t
+from datetime import datetime, timedelta
+
+from retraining_queue import RetrainingQueue, SearchCheckpoint, estimate_job_memory_mb
+
+
+def make_config(priority=0):
+    return {'retraining_priority': priority,
+            'parameters_model': {'interval_time': '1m', 'day_for_training': 10, 'spread_days_percent': 0.5,
+                                 'order': 10, 'spread_order_percent': 0.5}}
+
+
+class Jobs:
+    def __init__(self, duration=0.0):
+        self.duration = duration
+        self.lock = threading.Lock()
+        self.started = []
+        self.budgets = []
+        self.running = 0
+        self.max_running = 0
+
+    def __call__(self, bot_name, bot_config, budget_seconds):
+        with self.lock:
+            self.started.append(bot_name)
+            self.budgets.append(budget_seconds)
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        t.sleep(self.duration)
+        with self.lock:
+            self.running -= 1
+
+
+def test_jobs_start_by_priority():
+    jobs = Jobs()
+    queue = RetrainingQueue(jobs, max_jobs=1)
+    for bot_name, priority in [('low', 0), ('high', 5), ('middle', 1), ('low_2', 0)]:
+        queue.put(bot_name, make_config(priority))
+
+    queue.run()
+
+    assert jobs.started == ['high', 'middle', 'low', 'low_2']
+
+
+def test_max_jobs_and_memory_budget_limit_concurrency():
+    memory = estimate_job_memory_mb(make_config()['parameters_model'])
+
+    jobs = Jobs(duration=0.05)
+    queue = RetrainingQueue(jobs, max_jobs=2, memory_budget_mb=memory * 10)
+    for n in range(5):
+        queue.put(f'bot_{n}', make_config())
+    queue.run()
+    assert len(jobs.started) == 5
+    assert jobs.max_running == 2
+
+    jobs = Jobs(duration=0.05)
+    queue = RetrainingQueue(jobs, max_jobs=4, memory_budget_mb=memory * 1.5)
+    for n in range(3):
+        queue.put(f'bot_{n}', make_config())
+    queue.run()
+    assert len(jobs.started) == 3
+    assert jobs.max_running == 1
+
+
+def test_deadline_stops_new_jobs_and_limits_budget():
+    jobs = Jobs()
+    queue = RetrainingQueue(jobs)
+    queue.put('bot', make_config())
+    queue.run(deadline=datetime.now() - timedelta(seconds=1))
+    assert jobs.started == []
+
+    queue.put('bot', make_config())
+    queue.run(deadline=datetime.now() + timedelta(minutes=5))
+    assert jobs.started == ['bot']
+    assert 0 < jobs.budgets[0] <= 300
+
+
+def test_checkpoint_resumes_only_same_key(tmp_path):
+    path = str(tmp_path / 'checkpoints' / 'bot.pkl')
+    checkpoint = SearchCheckpoint(path, key=('data', 1))
+    checkpoint.put({(5, 3): [{'day': 5, 'order': 3, 'mean_relative_error': 0.1}]})
+    checkpoint.put({(6, 3): [{'day': 6, 'order': 3, 'mean_relative_error': 0.2}]})
+
+    resumed = SearchCheckpoint(path, key=('data', 1))
+    assert resumed.get((5, 3)) == [{'day': 5, 'order': 3, 'mean_relative_error': 0.1}]
+    assert resumed.get((6, 3)) is not None
+
+    assert SearchCheckpoint(path, key=('data', 2)).results == {}
+
+    resumed.remove()
+    assert SearchCheckpoint(path, key=('data', 1)).results == {}
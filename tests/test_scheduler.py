@@ -0,0 +1,45 @@
+import threading
+import time as t
+
+from scheduler import BotScheduler
+
+
+def make_config(interval_time='10m'):
+    return {'parameters_model': {'interval_time': interval_time}}
+
+
+def test_bot_added_to_empty_config_is_scheduled():
+    config_bots = {}
+    scheduler = BotScheduler(get_configs=lambda: dict(config_bots),
+                             run_bot=lambda bot_name, configs: None,
+                             run_retraining=lambda: None,
+                             get_interval_minutes=lambda interval_time: int(interval_time[:-1]),
+                             sync_interval=0.05)
+    thread = threading.Thread(target=scheduler.run, daemon=True)
+    thread.start()
+
+    config_bots['bot'] = make_config()
+    deadline = t.monotonic() + 5
+    while 'bot' not in scheduler._scheduled_bots and t.monotonic() < deadline:
+        t.sleep(0.01)
+    scheduler.stop()
+    thread.join(5)
+
+    assert scheduler._scheduled_bots == {'bot': 10}
+    assert any(kind == 'bot' and name == 'bot' for _, _, kind, name, _ in scheduler._queue)
+
+
+def test_changed_interval_is_rescheduled():
+    config_bots = {'bot': make_config('10m')}
+    scheduler = BotScheduler(get_configs=lambda: dict(config_bots),
+                             run_bot=lambda bot_name, configs: None,
+                             run_retraining=lambda: None,
+                             get_interval_minutes=lambda interval_time: int(interval_time[:-1]))
+    scheduler.start()
+
+    config_bots['bot'] = make_config('5m')
+    scheduler._dispatch_sync()
+    scheduler.stop()
+
+    assert scheduler._scheduled_bots == {'bot': 5}
+    assert sum(kind == 'sync' for _, _, kind, _, _ in scheduler._queue) == 2
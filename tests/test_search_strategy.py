@@ -0,0 +1,72 @@
+import time as t
+
+from search_strategy import GridSearch, SuccessiveHalving, get_top_candidates
+
+DAYS = range(1, 10)
+ORDERS = [1, 2, 3, 4, 5]
+TEST_ROWS = 900
+
+
+class FakeEvaluate:
+    """
+    Ошибка пары (day, order) с минимумом в (6, 3); на коротком тесте к ней добавляется шум,
+    который не меняет лучшую пару.
+    """
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, cells, rows):
+        self.calls.append((cells, rows))
+        error = []
+        for day, orders in cells:
+            for order in orders:
+                noise = ((day * 7 + order * 13) % 5) / rows
+                error.append({'day': day, 'order': order,
+                              'mean_relative_error': (day - 6) ** 2 + (order - 3) ** 2 + 0.5 + noise})
+        return error
+
+
+def get_winner(error):
+    return get_top_candidates(error, 1)[0]
+
+
+def test_successive_halving_finds_grid_winner():
+    grid_error = GridSearch().search(FakeEvaluate(), DAYS, ORDERS, TEST_ROWS, min_test_rows=10)
+
+    evaluate = FakeEvaluate()
+    error = SuccessiveHalving(min_test_windows=10).search(evaluate, DAYS, ORDERS, TEST_ROWS, min_test_rows=10)
+
+    assert get_winner(error) == get_winner(grid_error) == (6, 3)
+    assert evaluate.calls[-1] == ([(6, [3])], TEST_ROWS)
+    assert [rows for _, rows in evaluate.calls] == sorted(rows for _, rows in evaluate.calls)
+    assert (sum(len(orders) * rows for cells, rows in evaluate.calls for _, orders in cells) <
+            len(DAYS) * len(ORDERS) * TEST_ROWS)
+
+
+def test_grid_search_stops_at_deadline():
+    evaluate = FakeEvaluate()
+    error = GridSearch().search(evaluate, DAYS, ORDERS, TEST_ROWS, min_test_rows=10, workers=2,
+                                deadline=t.monotonic() - 1)
+
+    assert evaluate.calls == [([(1, ORDERS), (2, ORDERS)], TEST_ROWS)]
+    assert {entry['day'] for entry in error} == {1, 2}
+
+
+def test_grid_search_without_deadline_checks_all_days():
+    evaluate = FakeEvaluate()
+    error = GridSearch().search(evaluate, DAYS, ORDERS, TEST_ROWS, min_test_rows=10, workers=2,
+                                deadline=t.monotonic() + 60)
+
+    assert len(error) == len(DAYS) * len(ORDERS)
+
+
+def test_successive_halving_stops_at_deadline():
+    evaluate = FakeEvaluate()
+    error = SuccessiveHalving(min_test_windows=10).search(evaluate, DAYS, ORDERS, TEST_ROWS, min_test_rows=10,
+                                                         deadline=t.monotonic() - 1)
+
+    assert len(evaluate.calls) == 2
+    assert evaluate.calls[0][1] < TEST_ROWS
+    assert evaluate.calls[1] == ([(6, [3])], TEST_ROWS)
+    assert get_winner(error) == (6, 3)
@@ -0,0 +1,80 @@
+from datetime import date, datetime, time, timedelta
+import numpy as np
+import pytest
+
+from candle_store import CANDLE_DTYPE
+from trading_calendar import TradingCalendar, align_down, from_ns, to_ns
+
+MINUTE_NS = 60 * 10**9
+OFFSET_NS = 3 * 60 * MINUTE_NS
+WEDNESDAY = date(2026, 3, 4)
+
+
+def local(day: date, hours: int, minutes: int = 0) -> int:
+    return to_ns(datetime.combine(day, time(hours, minutes)))
+
+
+def brute_candles_start(calendar, count_candles, interval_minutes, now_ns, days=200):
+    """
+    Начала свечей, в которые попала хотя бы одна минута сессий до now, перебором минут.
+    """
+    interval_ns = interval_minutes * MINUTE_NS
+    end = now_ns + OFFSET_NS
+    end_day = from_ns(end).date()
+    buckets = set()
+    for number in range(days):
+        day = end_day - timedelta(days=number)
+        for start, stop in calendar.get_sessions(day):
+            minutes = np.arange(to_ns(datetime.combine(day, start)), to_ns(datetime.combine(day, stop)), MINUTE_NS)
+            buckets.update(align_down(minutes[minutes <= end], interval_ns).tolist())
+    return sorted(buckets)[-count_candles] - OFFSET_NS
+
+
+@pytest.fixture
+def calendar():
+    return TradingCalendar(holidays={date(2026, 3, 2)},
+                           days={date(2026, 2, 27): [(time(10, 10), time(14))]})
+
+
+@pytest.mark.parametrize('interval_minutes', [1, 5, 60, 1440])
+@pytest.mark.parametrize('now', [(WEDNESDAY, 9, 0), (WEDNESDAY, 10, 10), (WEDNESDAY, 12, 37), (WEDNESDAY, 14, 5),
+                                 (WEDNESDAY, 19, 30), (WEDNESDAY, 23, 50), (date(2026, 3, 8), 15, 0)])
+@pytest.mark.parametrize('count_candles', [1, 7, 200, 1500])
+def test_candles_start_matches_brute_force(calendar, interval_minutes, now, count_candles):
+    if interval_minutes == 1440 and count_candles > 7:
+        count_candles = 7
+    now_ns = local(*now) - OFFSET_NS
+    assert (calendar.get_candles_start(count_candles, interval_minutes, now_ns) ==
+            brute_candles_start(calendar, count_candles, interval_minutes, now_ns))
+
+
+def test_daily_candles_count_once_per_trading_day(calendar):
+    now_ns = local(WEDNESDAY, 20) - OFFSET_NS
+    # среда, вторник, (понедельник - праздник), пятница, четверг
+    assert calendar.get_candles_start(4, 1440, now_ns) == local(date(2026, 2, 26), 0) - OFFSET_NS
+
+
+def test_special_day_and_holiday(calendar):
+    # 2026-03-03 открывается в 10:10; предыдущий торговый день - сокращённая пятница до 14:00
+    now_ns = local(date(2026, 3, 3), 10, 10) - OFFSET_NS
+    assert calendar.get_candles_start(11, 1, now_ns) == local(date(2026, 2, 27), 13, 50) - OFFSET_NS
+
+    assert not calendar.is_trading_day(date(2026, 3, 2))
+    assert calendar.is_trading_time(datetime(2026, 2, 27, 13, 59))
+    assert not calendar.is_trading_time(datetime(2026, 2, 27, 14, 10))
+    assert calendar.next_session_start(datetime(2026, 2, 27, 15)) == datetime(2026, 3, 3, 10, 10)
+
+
+def test_filter_candles(calendar):
+    candles = np.zeros(3, dtype=CANDLE_DTYPE)
+    candles['time'] = [local(WEDNESDAY, 11) - OFFSET_NS, local(date(2026, 3, 4), 12) - OFFSET_NS,
+                       local(date(2026, 3, 5), 12) - OFFSET_NS]
+    assert calendar.filter_candles(candles) is candles
+
+    candles['time'][1] = local(date(2026, 3, 2), 12) - OFFSET_NS
+    assert calendar.filter_candles(candles)['time'].tolist() == [candles['time'][0], candles['time'][2]]
+
+
+def test_index_extends_for_old_dates(calendar):
+    now_ns = local(date(2023, 6, 7), 12) - OFFSET_NS
+    assert calendar.get_candles_start(3, 1440, now_ns) == local(date(2023, 6, 5), 0) - OFFSET_NS
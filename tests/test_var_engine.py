@@ -0,0 +1,20 @@
+import numpy as np
+import pytest
+from statsmodels.tsa.vector_ar.var_model import VAR
+
+from var_engine import fit_var_orders
+
+
+@pytest.mark.parametrize('trend', ['c', 'ct', 'n'])
+def test_fit_var_orders_matches_statsmodels(make_data, trend):
+    data = make_data()
+    orders = [1, 2, 5, 8]
+    models = fit_var_orders(data, orders, trend=trend)
+
+    for order in orders:
+        expected = VAR(data).fit(maxlags=order, ic=None, trend=trend)
+        np.testing.assert_allclose(models[order].coefs, expected.coefs, rtol=1e-7, atol=1e-9)
+        np.testing.assert_allclose(models[order].coefs_exog, expected.coefs_exog, rtol=1e-7, atol=1e-9)
+        np.testing.assert_allclose(models[order].forecast(data[-order:], 5), expected.forecast(data[-order:], 5),
+                                   rtol=1e-9)
+
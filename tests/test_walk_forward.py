@@ -0,0 +1,32 @@
+import numpy as np
+import pytest
+from statsmodels.tsa.vector_ar.var_model import VAR
+
+from retraining_module import calc_avg_local_error, calc_local_error, calc_walk_forward_errors, get_test_data
+
+
+def get_window_errors(model, data, num_values_for_predict, num_predictions):
+    local_error = [calc_local_error(predict_data=model.forecast(values, steps=num_predictions), real_data=real)
+                   for values, real in get_test_data(data=data,
+                                                     num_values_in_array=num_values_for_predict,
+                                                     num_predictions=num_predictions)]
+    return calc_avg_local_error(local_error=local_error)
+
+
+@pytest.mark.parametrize('trend', ['c', 'ct'])
+@pytest.mark.parametrize('order', [1, 3])
+def test_walk_forward_errors_match_window_loop(make_data, trend, order):
+    data = make_data(count_rows=260, k=4)
+    model = VAR(data[:200]).fit(maxlags=order, ic=None, trend=trend)
+    test_data = data[200:]
+    num_values_range = range(order, order + 5)
+
+    errors = calc_walk_forward_errors(model=model, data=test_data, num_values_range=num_values_range,
+                                      max_num_predictions=4)
+
+    for num_values_for_predict in num_values_range:
+        for num_predictions in range(1, 5):
+            expected = get_window_errors(model, test_data, num_values_for_predict, num_predictions)
+            actual = errors[(num_values_for_predict, num_predictions)]
+            np.testing.assert_allclose(actual['absolute_error'], expected['absolute_error'], rtol=1e-12)
+            np.testing.assert_allclose(actual['relative_error'], expected['relative_error'], rtol=1e-12)
@@ -0,0 +1,58 @@
+import time as t
+
+import joblib
+import numpy as np
+
+from warm_start import MAX_SNAPSHOT_AGE, WarmStartSnapshots
+
+
+def make_state():
+    return {'windows': {('figi', '1min'): np.arange(12.0).reshape(3, 4)},
+            'orders': [{'order_id': '1', 'expires_at': 123}],
+            'scheduler': {'bot': 10}}
+
+
+def set_snapshot_age(path, age):
+    snapshot = joblib.load(path)
+    snapshot['saved_at'] = t.time() - age
+    joblib.dump(snapshot, path)
+
+
+def test_snapshot_round_trip(tmp_path):
+    snapshots = WarmStartSnapshots(path=str(tmp_path / 'warm' / 'snapshot.pkl'))
+    assert snapshots.load() is None
+
+    state = make_state()
+    snapshots.save(state)
+    restored = snapshots.load()
+
+    np.testing.assert_array_equal(restored['windows'][('figi', '1min')], state['windows'][('figi', '1min')])
+    assert restored['orders'] == state['orders']
+    assert restored['scheduler'] == state['scheduler']
+
+
+def test_snapshot_older_than_max_age_is_rejected(tmp_path):
+    path = str(tmp_path / 'snapshot.pkl')
+    snapshots = WarmStartSnapshots(path=path)
+    snapshots.save(make_state())
+
+    set_snapshot_age(path, MAX_SNAPSHOT_AGE - 60)
+    assert snapshots.load() is not None
+
+    set_snapshot_age(path, MAX_SNAPSHOT_AGE + 60)
+    assert snapshots.load() is None
+
+
+def test_request_saves_before_interval(tmp_path):
+    path = tmp_path / 'snapshot.pkl'
+    snapshots = WarmStartSnapshots(path=str(path), interval=3600)
+    snapshots.start(make_state)
+    try:
+        snapshots.request()
+        deadline = t.monotonic() + 5
+        while snapshots.load() is None and t.monotonic() < deadline:
+            t.sleep(0.01)
+    finally:
+        snapshots.stop()
+
+    assert snapshots.load()['scheduler'] == {'bot': 10}
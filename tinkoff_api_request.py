@@ -1,79 +1,145 @@
-from datetime import timedelta
+from datetime import datetime, timedelta, timezone
+import numpy as np
 import pandas as pd
 
 from decimal import Decimal
 
 from tinkoff.invest import (
-    Client,
     CandleInterval,
     OrderType,
     OrderDirection
 )
 
-from tinkoff.invest.utils import (
-    decimal_to_quotation,
-    now
-)
+from tinkoff.invest.utils import decimal_to_quotation
+
+import clock
+from candle_store import CANDLE_DTYPE, PRICE_FIELDS, get_candle_store
+from trading_calendar import get_calendar
+from client_pool import api_client
+from request_scheduler import get_request_scheduler
+import math
+import metrics
+
+
+# Максимальный период одного запроса GetCandles для интервала, дней (get_all_candles делит запрос на части).
+CANDLE_REQUEST_DAYS = {
+    '1m': 1, '2m': 1, '3m': 1, '5m': 1, '10m': 1, '15m': 1,
+    '30m': 2, '1h': 7, '2h': 30, '4h': 30, '24h': 365
+}
+
+
+def call_api(token: str, method: str, request, key=None, cost: float = 1):
+    """
+    request(client) выполняется через общий планировщик запросов (лимиты, приоритеты, повтор при throttling).
+    """
+    def run():
+        with api_client(token) as client:
+            return request(client)
+
+    return get_request_scheduler().call(method, run, cost=cost, key=key)
 
 
 def get_trading_data(token: str, figi: str, delta_day: int, interval_time: str):
+    candles = get_trading_candles(token=token, figi=figi, delta_day=delta_day, interval_time=interval_time)
+
+    return pd.DataFrame({
+        'time': pd.to_datetime(candles['time'], utc=True),
+        'open': candles['open'],
+        'close': candles['close'],
+        'high': candles['high'],
+        'low': candles['low'],
+        'volume': candles['volume']
+    })
+
+
+def get_trading_candles(token: str, figi: str, delta_day: float = None, interval_time: str = None,
+                        from_time_ns: int = None):
+    """
+    То же, что get_trading_data, но без pandas: массив CANDLE_DTYPE (только чтение) за delta_day дней
+    или начиная с from_time_ns, только торговые дни календаря. Обычно это срез хранилища свечей без копирования.
+    """
+    store = get_candle_store(figi=figi, interval_time=interval_time)
+    if from_time_ns is None:
+        from_time_ns = datetime_to_ns(clock.now() - timedelta(days=delta_day))
+
+    try:
+        store.update(fetch_candles=lambda from_ns: get_candles(token=token,
+                                                               figi=figi,
+                                                               from_time_ns=from_ns,
+                                                               interval_time=interval_time),
+                     from_time_ns=from_time_ns)
+    except Exception as e:
+        metrics.api_error('get_all_candles', e)
+        print(f'ERROR: candle store {figi} {interval_time} not update. Error: {e}')
+
+    return get_calendar().filter_candles(store.since(from_time_ns))
+
+
+def get_candles(token: str, figi: str, from_time_ns: int, interval_time: str):
+    """
+    Свечи из API в массив CANDLE_DTYPE за один проход: из protobuf берутся только целые units/nano,
+    перевод в float делается сразу для всех свечей.
+    """
     interval = get_candle_interval(interval_time)
-    candles_data = []
-    with Client(token) as client:
-        for candle in client.get_all_candles(
-                figi=figi,
-                from_=now() - timedelta(days=delta_day),
-                interval=interval,
-        ):
-            candles_data.append({
-                'time': candle.time,
-                'open': money_to_decimal(candle.open),
-                'close': money_to_decimal(candle.close),
-                'high': money_to_decimal(candle.high),
-                'low': money_to_decimal(candle.low),
-                'volume': candle.volume
-            })
+    from_ = ns_to_datetime(from_time_ns)
+
+    def request(client):
+        return [(int(candle.time.timestamp()),
+                 candle.open.units, candle.open.nano,
+                 candle.close.units, candle.close.nano,
+                 candle.high.units, candle.high.nano,
+                 candle.low.units, candle.low.nano,
+                 candle.volume)
+                for candle in client.get_all_candles(figi=figi, from_=from_, interval=interval)]
 
-    df = pd.DataFrame(candles_data)
-    df['time'] = pd.to_datetime(df['time'])
-    filtered_df = df[~df['time'].dt.weekday.isin([5, 6])]
+    days = (clock.now() - from_).total_seconds() / (24 * 60 * 60)
+    rows = call_api(token, 'get_candles', request,
+                    cost=max(math.ceil(days / CANDLE_REQUEST_DAYS.get(interval_time, 1)), 1))
 
-    return filtered_df
+    raw = np.array(rows, dtype=np.int64).reshape(-1, 10)
+    candles = np.empty(len(raw), dtype=CANDLE_DTYPE)
+    candles['time'] = raw[:, 0] * 10**9
+    for number, field in enumerate(PRICE_FIELDS):
+        candles[field] = raw[:, 1 + 2 * number] + raw[:, 2 + 2 * number] / 10**9
+    candles['volume'] = raw[:, 9]
+
+    return candles
 
 
 def create_order(token: str, account_id: str, figi: str, quantity: int,
                  price: float, direction_type: str, order_t: str = "LIMIT"):
-    with Client(token) as client:
-        if order_t == "LIMIT":
-            order_type = OrderType.ORDER_TYPE_LIMIT
+    if order_t == "LIMIT":
+        order_type = OrderType.ORDER_TYPE_LIMIT
 
-        if order_t == "MARKET":
-            order_type = OrderType.ORDER_TYPE_MARKET
+    if order_t == "MARKET":
+        order_type = OrderType.ORDER_TYPE_MARKET
 
-        if order_t == "BESTPRICE":
-            order_type = OrderType.ORDER_TYPE_BESTPRICE
+    if order_t == "BESTPRICE":
+        order_type = OrderType.ORDER_TYPE_BESTPRICE
 
-        if direction_type == "BUY":
-            direction = OrderDirection.ORDER_DIRECTION_BUY
+    if direction_type == "BUY":
+        direction = OrderDirection.ORDER_DIRECTION_BUY
 
-        if direction_type == "SELL":
-            direction = OrderDirection.ORDER_DIRECTION_SELL
+    if direction_type == "SELL":
+        direction = OrderDirection.ORDER_DIRECTION_SELL
 
-        try:
-            response = client.orders.post_order(
+    try:
+        with metrics.stage('post_order'):
+            response = call_api(token, 'post_order', lambda client: client.orders.post_order(
                 figi=figi,
                 quantity=quantity,
                 price=decimal_to_quotation(Decimal(price)),
                 direction=direction,
                 account_id=account_id,
                 order_type=order_type,
-            )
-            print(f'create order: {response.order_id} : direction_type: {direction_type} : price : {price}')
-            return response.order_id
+            ))
+        print(f'create order: {response.order_id} : direction_type: {direction_type} : price : {price}')
+        return response.order_id
 
-        except Exception as error:
-            print(f"Posting trade limit order failed. Exception: {error}")
-            return 0
+    except Exception as error:
+        metrics.api_error('post_order', error)
+        print(f"Posting trade limit order failed. Exception: {error}")
+        return 0
 
 
 def check_status_order(token: str, account_id: str, order_id: str) -> str:
@@ -83,25 +149,47 @@ def check_status_order(token: str, account_id: str, order_id: str) -> str:
     :param order_id:
     :return: FILL - заявка исполнена, REJECTED - отклонена, CANCELLED - отменена пользователем, NEW - новая, PARTIALLYFILL - частично исполнена
     """
-    with Client(token) as client:
-        try:
-            order_state = str(client.orders.get_order_state(account_id=account_id, order_id=order_id)
+    try:
+        with metrics.stage('order_status'):
+            order_state = str(call_api(token, 'get_order_state',
+                                       lambda client: client.orders.get_order_state(account_id=account_id,
+                                                                                    order_id=order_id),
+                                       key=('get_order_state', account_id, order_id))
                               .execution_report_status)
-            status_parts = order_state.split("_")
-            status_code = status_parts[-1]
-        except Exception as e:
-            print(f'ERROR: check_status_order {e}')
-            status_code = "NOT_FOUND"
+        status_parts = order_state.split("_")
+        status_code = status_parts[-1]
+    except Exception as e:
+        metrics.api_error('get_order_state', e)
+        print(f'ERROR: check_status_order {e}')
+        status_code = "NOT_FOUND"
 
-        return status_code
+    return status_code
+
+
+def get_active_orders(token: str, account_id: str):
+    """
+    :return: множество order_id активных заявок счёта или None, если запрос не удался
+    """
+    try:
+        response = call_api(token, 'get_orders',
+                            lambda client: client.orders.get_orders(account_id=account_id),
+                            key=('get_orders', account_id))
+        return {order.order_id for order in response.orders}
+    except Exception as e:
+        metrics.api_error('get_orders', e)
+        print(f'ERROR: get_active_orders {e}')
+        return None
 
 
 def cansel_order(token: str, account_id: str, order_id: str):
-    with Client(token) as client:
-        try:
-            client.orders.cancel_order(account_id=account_id, order_id=order_id)
-        except Exception as error:
-            print(f"Failed to cancel orders. Error: {error}")
+    try:
+        with metrics.stage('cancel_order'):
+            call_api(token, 'cancel_order',
+                     lambda client: client.orders.cancel_order(account_id=account_id, order_id=order_id),
+                     key=('cancel_order', account_id, order_id))
+    except Exception as error:
+        metrics.api_error('cancel_order', error)
+        print(f"Failed to cancel orders. Error: {error}")
 
 
 def get_candle_interval(interval_time: str):
@@ -131,3 +219,11 @@ def get_candle_interval(interval_time: str):
 
 def money_to_decimal(money):
     return money.units + money.nano/10**9
+
+
+def datetime_to_ns(date):
+    return int(date.timestamp()) * 10**9
+
+
+def ns_to_datetime(time_ns: int):
+    return datetime.fromtimestamp(time_ns / 10**9, tz=timezone.utc)
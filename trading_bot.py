@@ -1,31 +1,57 @@
-from tinkoff_api_request import get_trading_data, create_order, check_status_order
-from model_func import preprocess_data_for_predict, predict_next_values
+from tinkoff_api_request import get_trading_candles, create_order, check_status_order
+from model_func import predict_next_values
+from feature_engine import get_bot_features, get_feature_values, get_pipeline
 from my_client_config import EXCHANGE_COMMISSION
+from trading_calendar import get_calendar
+from candle_store import DAY_NS
+import metrics
 import numpy as np
+import clock
+from datetime import datetime, timezone
 import math
-from datetime import datetime, timedelta, timezone
 
 
-def trading_bot(model, token: str, account_id: str, config_bot):
+# Запас свечей при запросе истории: доля от нужного числа, но не меньше FETCH_SLACK_MIN_CANDLES.
+FETCH_SLACK = 0.2
+FETCH_SLACK_MIN_CANDLES = 10
+
+
+def trading_bot(model, token: str, account_id: str, config_bot, candles=None):
     figi                   = config_bot['parameters_model']['figi']
     interval_time          = config_bot['parameters_model']['interval_time']
     num_values_for_predict = config_bot['limitations_technical']['num_values_for_predict']
     num_predictions        = config_bot['limitations_technical']['num_predictions']
     model_accuracy         = config_bot['limitations_technical']['model_accuracy']
     min_price_increment    = config_bot['limitations_cash']['min_price_increment']
-
-    data = get_trading_data(token=token,
-                            figi=figi,
-                            delta_day=get_delta_day(num_values_for_predict, interval_time),
-                            interval_time=interval_time)
-
-    data = preprocess_data_for_predict(data=data,
-                                       selected_features=['open', 'close', 'high', 'low'],
-                                       count_rows=num_values_for_predict)
-
-    predict_values = predict_next_values(model=model,
-                                         data=data,
-                                         steps=num_predictions)
+    features               = get_bot_features(config_bot['parameters_model'])
+    pipeline               = get_pipeline(features)
+
+    if not pipeline.price_columns:
+        print(f'ERROR: features {features} have no price columns for orders')
+        return "NOT ORDER"
+
+    if candles is None:
+        with metrics.stage('candle_fetch'):
+            count_candles = num_values_for_predict + pipeline.warm_up
+            candles = get_trading_candles(token=token,
+                                          figi=figi,
+                                          interval_time=interval_time,
+                                          from_time_ns=get_candles_from(count_candles, interval_time))[-count_candles:]
+
+    with metrics.stage('preprocess'):
+        data = get_feature_values(candles=candles,
+                                  features=features,
+                                  figi=figi,
+                                  interval_time=interval_time,
+                                  count_rows=num_values_for_predict)
+
+    with metrics.stage('forecast'):
+        predict_values = predict_next_values(model=model,
+                                             data=data,
+                                             steps=num_predictions)
+
+    if len(predict_values) and not pipeline.is_raw:
+        predict_values = predict_values[:, pipeline.price_columns]
 
     benefit, buy, sell = buy_sell_benefit(predict_values=predict_values,
                                           model_accuracy=model_accuracy,
@@ -127,29 +153,22 @@ def create_order_data(token, account_id, figi, quantity, price, direction_type,
     return order_id, order_info
 
 
-def get_delta_day(num_values_for_predict, interval_time):
-    interval_time_int = get_interval_minutes(interval_time)
-    all_interval_time_in_minute = num_values_for_predict * interval_time_int
-
-    minutes_in_a_day = 24 * 60
-    delta_day = math.ceil(all_interval_time_in_minute / minutes_in_a_day)
+def get_candles_from(num_values_for_predict, interval_time):
+    """
+    Время (ns UTC) начала последних num_values_for_predict свечей по календарю торговых сессий с запасом
+    FETCH_SLACK на минуты без сделок и неточности календаря: лишние свечи отрезаются по количеству.
+    """
+    slack = max(FETCH_SLACK_MIN_CANDLES, math.ceil(num_values_for_predict * FETCH_SLACK))
+    return get_calendar().get_candles_start(count_candles=num_values_for_predict + slack,
+                                            interval_minutes=get_interval_minutes(interval_time),
+                                            now_ns=clock.now_ns())
 
-    return adjust_delta_for_weekend(delta_day)
 
-
-def adjust_delta_for_weekend(delta_day):
-    current_date = datetime.now()
-    target_date = current_date - timedelta(days=delta_day)
-
-    while is_weekend(target_date):
-        target_date -= timedelta(days=1)
-        delta_day += 1
-
-    return delta_day
-
-
-def is_weekend(date):
-    return date.weekday() >= 5
+def get_delta_day(num_values_for_predict, interval_time):
+    """
+    Сколько дней (дробное число) назад началась первая из последних num_values_for_predict свечей.
+    """
+    return (clock.now_ns() - get_candles_from(num_values_for_predict, interval_time)) / DAY_NS
 
 
 def get_interval_minutes(interval_minutes_str):
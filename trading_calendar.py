@@ -0,0 +1,265 @@
+import os
+import json
+import threading
+from datetime import datetime, date, time, timedelta
+import numpy as np
+
+from candle_store import DAY_NS, read_only
+
+
+PATH_CALENDAR = 'trading_calendar.json'
+
+# Сессии, в которые работают боты (время биржи). Перерывы между ними - клиринг и аукционы.
+DEFAULT_SESSIONS = [
+    (time(10, 10), time(14)),
+    (time(14, 10), time(18, 45)),
+    (time(19, 10), time(23, 50)),
+]
+DEFAULT_WEEKENDS = (5, 6)
+UTC_OFFSET_HOURS = 3
+
+INDEX_PAST_DAYS = 400
+INDEX_FUTURE_DAYS = 60
+MAX_INDEX_DAYS = 3650
+EPOCH = datetime(1970, 1, 1)
+
+
+def parse_time(value: str) -> time:
+    hours, minutes = value.split(':')
+    return time(int(hours), int(minutes))
+
+
+def to_ns(value: datetime) -> int:
+    """
+    Время биржи без часового пояса -> ns с 1970-01-01 по часам биржи.
+    """
+    return (value - EPOCH) // timedelta(microseconds=1) * 1000
+
+
+def from_ns(value: int) -> datetime:
+    return EPOCH + timedelta(microseconds=int(value) // 1000)
+
+
+def align_down(value, step: int):
+    return value - value % step
+
+
+class TradingCalendar:
+    """
+    Календарь торговых сессий биржи: сессии обычного дня, выходные дни недели, праздники и особые дни
+    (сокращённые сессии или торговые выходные). По нему заранее строится индекс - отсортированные
+    массивы начал и концов всех сессий за INDEX_PAST_DAYS дней назад и INDEX_FUTURE_DAYS вперёд
+    (в ns по часам биржи), поэтому проверки времени и подсчёт свечей - бинарный поиск. Индекс не меняется
+    на месте, а строится заново: читается одним снимком под lock.
+
+    Сессии не должны быть шире реальных: тогда запрос последних N свечей не окажется короче нужного.
+    """
+
+    def __init__(self, sessions=DEFAULT_SESSIONS, weekends=DEFAULT_WEEKENDS, holidays=(), days=None,
+                 utc_offset_hours: float = UTC_OFFSET_HOURS):
+        """
+        :param holidays: даты без торгов
+        :param days: {дата: [(начало, конец), ...]} - сессии особых дней, пустой список - нет торгов
+        """
+        self.sessions = list(sessions)
+        self.weekends = set(weekends)
+        self.holidays = set(holidays)
+        self.days = dict(days or {})
+        self.utc_offset_ns = int(utc_offset_hours * 60 * 60 * 10**9)
+
+        self.lock = threading.Lock()
+        self.first_day = None
+        self.last_day = None
+        self.starts = np.empty(0, dtype=np.int64)
+        self.ends = np.empty(0, dtype=np.int64)
+        self.trading_days = np.empty(0, dtype=bool)
+        self._prefix_counts = {}
+
+        today = datetime.now().date()
+        self._build(today - timedelta(days=INDEX_PAST_DAYS), today + timedelta(days=INDEX_FUTURE_DAYS))
+
+    def get_sessions(self, day: date):
+        if day in self.days:
+            return self.days[day]
+        if day in self.holidays or day.weekday() in self.weekends:
+            return []
+        return self.sessions
+
+    def _build(self, first_day: date, last_day: date):
+        starts, ends, trading_days = [], [], []
+
+        day = first_day
+        while day <= last_day:
+            sessions = self.get_sessions(day)
+            trading_days.append(bool(sessions))
+            for start, end in sessions:
+                starts.append(to_ns(datetime.combine(day, start)))
+                ends.append(to_ns(datetime.combine(day, end)))
+            day += timedelta(days=1)
+
+        self.starts = np.array(starts, dtype=np.int64)
+        self.ends = np.array(ends, dtype=np.int64)
+        self.trading_days = np.array(trading_days, dtype=bool)
+        self.first_day, self.last_day = first_day, last_day
+        self._prefix_counts = {}
+
+    def _ensure(self, value_ns: int):
+        """
+        Расширяет индекс, если value_ns вне него.
+        """
+        day = from_ns(value_ns).date()
+        with self.lock:
+            if self.first_day <= day <= self.last_day:
+                return
+            self._build(min(self.first_day, day - timedelta(days=INDEX_FUTURE_DAYS)),
+                        max(self.last_day, day + timedelta(days=INDEX_FUTURE_DAYS)))
+
+    def _get_index(self, value_ns: int):
+        """
+        Снимок индекса, содержащего value_ns: (first_day, last_day, starts, ends, trading_days).
+        """
+        self._ensure(value_ns)
+        with self.lock:
+            return self.first_day, self.last_day, self.starts, self.ends, self.trading_days
+
+    def is_trading_day(self, value) -> bool:
+        value = datetime.combine(value, time()) if not isinstance(value, datetime) else value
+        first_day, _, _, _, trading_days = self._get_index(to_ns(value))
+        return bool(trading_days[(value.date() - first_day).days])
+
+    def is_trading_time(self, value: datetime) -> bool:
+        value_ns = to_ns(value)
+        _, _, starts, ends, _ = self._get_index(value_ns)
+
+        number = int(np.searchsorted(starts, value_ns, side='right')) - 1
+        return bool(number >= 0 and value_ns < ends[number])
+
+    def next_session_start(self, value: datetime) -> datetime:
+        """
+        Начало ближайшей сессии не раньше value.
+        """
+        value_ns = to_ns(value)
+
+        while True:
+            first_day, last_day, starts, _, _ = self._get_index(value_ns)
+            number = int(np.searchsorted(starts, value_ns, side='left'))
+            if number < len(starts):
+                return from_ns(starts[number])
+            if (last_day - first_day).days > MAX_INDEX_DAYS:
+                raise ValueError('Trading calendar has no sessions')
+            value_ns = max(value_ns, to_ns(datetime.combine(last_day + timedelta(days=1), time())))
+
+    def _get_prefix_counts(self, interval_ns: int):
+        """
+        (prefix, firsts): firsts[i] - начало первой свечи интервала interval_ns, которая открывается в i-й сессии
+        (свеча дня или нескольких часов может накрывать несколько сессий и считается один раз - в первой),
+        prefix[i] - число свечей в сессиях до i-й. Вызывается под lock.
+        """
+        counts = self._prefix_counts.get(interval_ns)
+        if counts is None:
+            firsts = align_down(self.starts, interval_ns)
+            lasts = align_down(self.ends - 1, interval_ns)
+            if len(firsts) > 1:
+                firsts[1:] = np.maximum(firsts[1:], lasts[:-1] + interval_ns)
+            new_counts = np.maximum((lasts - firsts) // interval_ns + 1, 0)
+            counts = self._prefix_counts[interval_ns] = np.concatenate([[0], np.cumsum(new_counts)]), firsts
+        return counts
+
+    def get_candles_start(self, count_candles: int, interval_minutes: int, now_ns: int) -> int:
+        """
+        Время (ns UTC) начала самой ранней из последних count_candles свечей интервала interval_minutes
+        к моменту now_ns (ns UTC), включая текущую незакрытую свечу.
+        """
+        interval_ns = interval_minutes * 60 * 10**9
+        end = now_ns + self.utc_offset_ns
+        self._ensure(end)
+
+        while True:
+            with self.lock:
+                first_day, last_day, starts, ends = self.first_day, self.last_day, self.starts, self.ends
+                prefix, firsts = self._get_prefix_counts(interval_ns)
+
+            last = int(np.searchsorted(starts, end, side='right')) - 1
+            if last >= 0 and end < ends[last]:
+                count_last = max((align_down(end, interval_ns) - firsts[last]) // interval_ns + 1, 0)
+                if count_candles <= count_last:
+                    return int(align_down(end, interval_ns) - (count_candles - 1) * interval_ns) - self.utc_offset_ns
+                remaining = count_candles - count_last
+            else:
+                remaining = count_candles
+            full = last + 1 if last >= 0 and end >= ends[last] else max(last, 0)
+
+            first = int(np.searchsorted(prefix[:full + 1], prefix[full] - remaining, side='right')) - 1
+            if first >= 0:
+                remaining -= prefix[full] - prefix[first + 1]
+                start = align_down(ends[first] - 1, interval_ns) - (remaining - 1) * interval_ns
+                return int(start) - self.utc_offset_ns
+
+            if (last_day - first_day).days > MAX_INDEX_DAYS:
+                return now_ns - count_candles * interval_ns
+            self._ensure(to_ns(datetime.combine(first_day - timedelta(days=INDEX_FUTURE_DAYS), time())))
+
+    def filter_candles(self, candles):
+        """
+        Свечи только торговых дней (по часам биржи). Если лишних нет, возвращается тот же массив без копирования.
+        """
+        if len(candles) == 0:
+            return candles
+
+        times = candles['time'] + self.utc_offset_ns
+        self._ensure(int(times[0]))
+        first_day, _, _, _, trading_days = self._get_index(int(times[-1]))
+
+        first_day = (to_ns(datetime.combine(first_day, time())) // DAY_NS)
+        mask = trading_days[times // DAY_NS - first_day]
+        if np.all(mask):
+            return candles
+        return read_only(candles[mask])
+
+
+def load_calendar(path: str = PATH_CALENDAR) -> TradingCalendar:
+    """
+    Календарь из JSON файла:
+    {"sessions": [["10:10", "14:00"], ...], "weekends": [5, 6], "utc_offset_hours": 3,
+     "holidays": ["2026-01-01", ...], "days": {"2026-12-30": [["10:10", "14:00"]], "2026-11-01": [...]}}
+    Все поля необязательные. Если файла нет, используются сессии DEFAULT_SESSIONS без праздников.
+    """
+    if not os.path.exists(path):
+        return TradingCalendar()
+
+    with open(path, 'r') as file:
+        config = json.load(file)
+
+    def parse_sessions(sessions):
+        return [(parse_time(start), parse_time(end)) for start, end in sessions]
+
+    return TradingCalendar(
+        sessions=parse_sessions(config['sessions']) if 'sessions' in config else DEFAULT_SESSIONS,
+        weekends=config.get('weekends', DEFAULT_WEEKENDS),
+        holidays={date.fromisoformat(day) for day in config.get('holidays', [])},
+        days={date.fromisoformat(day): parse_sessions(sessions) for day, sessions in config.get('days', {}).items()},
+        utc_offset_hours=config.get('utc_offset_hours', UTC_OFFSET_HOURS))
+
+
+_calendar = None
+_calendar_lock = threading.Lock()
+
+
+def get_calendar() -> TradingCalendar:
+    global _calendar
+
+    with _calendar_lock:
+        if _calendar is None:
+            try:
+                _calendar = load_calendar()
+            except Exception as e:
+                print(f'Trading calendar {PATH_CALENDAR} not load. Error: {e}')
+                _calendar = TradingCalendar()
+        return _calendar
+
+
+def set_calendar(calendar: TradingCalendar):
+    global _calendar
+
+    with _calendar_lock:
+        _calendar = calendar
@@ -0,0 +1,192 @@
+import os
+import numpy as np
+
+
+def get_trend_offset(model, steps: int):
+    """
+    Вклад константы/тренда VAR в прогноз на steps шагов, как в statsmodels VARResults.forecast.
+    Для всех окон он одинаковый, поэтому считается один раз.
+    """
+    k = model.coefs.shape[1]
+    offset = np.zeros((steps, k))
+
+    if model.coefs_exog.size == 0:
+        return offset
+
+    exogs = []
+    if model.trend.startswith('c'):
+        exogs.append(np.ones(steps))
+    exog_lin_trend = np.arange(model.n_totobs + 1, model.n_totobs + 1 + steps)
+    if 't' in model.trend:
+        exogs.append(exog_lin_trend)
+    if 'tt' in model.trend:
+        exogs.append(exog_lin_trend ** 2)
+
+    return offset + np.column_stack(exogs) @ model.coefs_exog.T
+
+
+def batch_forecast(coefs, trend_offset, data, ends, steps: int):
+    """
+    Прогнозы VAR сразу для всех окон data[:end] (end из ends) на steps шагов вперёд.
+
+    :param coefs: матрицы коэффициентов (p x k x k), coefs[i] умножается на y(t-i-1)
+    :param trend_offset: вклад константы/тренда (steps x k)
+    :param data: ряд (T x k)
+    :param ends: индексы концов окон (не включительно), каждый >= p
+    :return: прогнозы (len(ends) x steps x k)
+    """
+    p, k = coefs.shape[:2]
+    ends = np.asarray(ends)
+
+    lags = np.lib.stride_tricks.sliding_window_view(data, p, axis=0)
+    history = lags[ends - p].transpose(0, 2, 1)[:, ::-1, :].reshape(len(ends), p * k)
+    weights = coefs.transpose(0, 2, 1).reshape(p * k, k)
+
+    forecasts = np.empty((len(ends), steps, k))
+
+    for h in range(steps):
+        forecasts[:, h] = history @ weights + trend_offset[h]
+        history = np.concatenate([forecasts[:, h], history[:, :-k]], axis=1)
+
+    return forecasts
+
+
+class VARCoefficients:
+    """
+    Лёгкая замена VARResults: только то, что нужно для прогноза (predict_next_values, batch_forecast).
+    """
+
+    def __init__(self, coefs, coefs_exog, trend: str = 'c', n_totobs: int = 0):
+        self.coefs = np.asarray(coefs, dtype=float)
+        self.coefs_exog = np.asarray(coefs_exog, dtype=float).reshape(self.coefs.shape[1], -1)
+        self.trend = trend
+        self.n_totobs = n_totobs
+        self.k_ar = self.coefs.shape[0]
+
+    def forecast(self, y, steps: int):
+        y = np.asarray(y, dtype=float)
+        if y.shape[0] < self.k_ar:
+            raise ValueError(f'y must by have at least order ({self.k_ar}) observations. Got {y.shape[0]}.')
+
+        return batch_forecast(coefs=self.coefs,
+                              trend_offset=get_trend_offset(self, steps),
+                              data=y,
+                              ends=[len(y)],
+                              steps=steps)[0]
+
+
+def get_trend_columns(trend: str, rows):
+    """
+    Столбцы константы/тренда для строк rows так же, как в statsmodels VAR (тренд = номер наблюдения + 1).
+    """
+    columns = []
+    if trend.startswith('c'):
+        columns.append(np.ones(len(rows)))
+    if 't' in trend:
+        columns.append(rows + 1.0)
+    if 'tt' in trend:
+        columns.append((rows + 1.0) ** 2)
+
+    return np.column_stack(columns) if columns else np.empty((len(rows), 0))
+
+
+def get_design_rows(data, rows, order: int, trend: str):
+    """
+    Строки матрицы регрессоров [тренд, y(t-1), ..., y(t-order)] и целевые y(t) для индексов rows.
+    """
+    lags = [data[rows - lag] for lag in range(1, order + 1)]
+    return np.column_stack([get_trend_columns(trend, rows)] + lags + [data[rows]])
+
+
+def fit_var_orders(data, orders, trend: str = 'c'):
+    """
+    МНК оценки VAR для всех порядков из orders по одной матрице лагов.
+    QR разложение строится один раз для максимального порядка; для меньшего порядка берётся ведущий блок R
+    (первые столбцы регрессоров) и добавляются строки, которые statsmodels использует для этого порядка
+    дополнительно (начало ряда). Результат совпадает с VAR(data).fit(maxlags=order, ic=None, trend=trend).
+
+    :return: словарь {order: VARCoefficients}
+    """
+    data = np.asarray(data, dtype=float)
+    count_rows, k = data.shape
+    orders = sorted(set(orders), reverse=True)
+    k_trend = get_trend_columns(trend, np.arange(1)).shape[1]
+
+    models = {}
+    block = None
+    first_row = count_rows
+
+    for order in orders:
+        count_columns = k_trend + k * order
+        rows = np.arange(order, first_row)
+
+        if block is None:
+            block = np.linalg.qr(get_design_rows(data, rows, order, trend), mode='r')
+        else:
+            block = np.delete(block[:count_columns], np.s_[count_columns:block.shape[1] - k], axis=1)
+            if len(rows):
+                block = np.linalg.qr(np.vstack([block, get_design_rows(data, rows, order, trend)]), mode='r')
+
+        block = block[:count_columns]
+        if block.shape[0] < count_columns:
+            block = np.vstack([block, np.zeros((count_columns - block.shape[0], block.shape[1]))])
+
+        first_row = order
+
+        params = np.linalg.lstsq(block[:, :count_columns], block[:, count_columns:], rcond=1e-15)[0]
+        models[order] = VARCoefficients(coefs=params[k_trend:].reshape(order, k, k).swapaxes(1, 2),
+                                        coefs_exog=params[:k_trend].T,
+                                        trend=trend,
+                                        n_totobs=count_rows)
+
+    return models
+
+
+COMPACT_MODEL_VERSION = 1
+
+
+def to_var_coefficients(model) -> VARCoefficients:
+    if isinstance(model, VARCoefficients):
+        return model
+
+    return VARCoefficients(coefs=model.coefs,
+                           coefs_exog=model.coefs_exog,
+                           trend=model.trend,
+                           n_totobs=model.n_totobs)
+
+
+def get_compact_model_path(path_model: str) -> str:
+    return os.path.splitext(path_model)[0] + '.npz'
+
+
+def save_compact_model(model, file_path: str):
+    """
+    Сохраняет только то, что нужно для прогноза: коэффициенты, константу/тренд, порядок.
+    Файл пишется во временный и атомарно подменяет старый. Модель None (не обучилась) не сохраняется.
+    """
+    if model is None:
+        print(f'Compact model {file_path} not save: model is None')
+        return
+
+    model = to_var_coefficients(model)
+    path_tmp = file_path + '.tmp.npz'
+
+    np.savez(path_tmp,
+             version=COMPACT_MODEL_VERSION,
+             coefs=model.coefs,
+             coefs_exog=model.coefs_exog,
+             trend=model.trend,
+             n_totobs=model.n_totobs,
+             k_ar=model.k_ar)
+    os.replace(path_tmp, file_path)
+
+
+def load_compact_model(file_path: str) -> VARCoefficients:
+    with np.load(file_path) as data:
+        if int(data['version']) != COMPACT_MODEL_VERSION:
+            raise ValueError(f'Unsupported compact model version {int(data["version"])}')
+
+        return VARCoefficients(coefs=data['coefs'],
+                               coefs_exog=data['coefs_exog'],
+                               trend=str(data['trend']),
+                               n_totobs=int(data['n_totobs']))
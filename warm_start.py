@@ -0,0 +1,90 @@
+import os
+import threading
+import time as t
+
+import joblib
+
+
+PATH_WARM_START = 'data_warm_start.pkl'
+SNAPSHOT_INTERVAL = 30
+MAX_SNAPSHOT_AGE = 12 * 60 * 60
+WARM_START_VERSION = 1
+
+
+class WarmStartSnapshots:
+    """
+    Снимок состояния демона на диске для быстрого перезапуска: окна свечей, модели в памяти,
+    живые заявки с их сроками и позиция планировщика. Снимок пишется раз в interval секунд
+    во временный файл и атомарно подменяет старый; снимок старше max_age секунд не восстанавливается.
+    """
+
+    def __init__(self, path: str = PATH_WARM_START, interval: float = SNAPSHOT_INTERVAL,
+                 max_age: float = MAX_SNAPSHOT_AGE):
+        self.path = path
+        self.interval = interval
+        self.max_age = max_age
+        self._stop = threading.Event()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def save(self, state):
+        try:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            path_tmp = self.path + '.tmp'
+            joblib.dump({'version': WARM_START_VERSION, 'saved_at': t.time(), 'state': state}, path_tmp)
+            os.replace(path_tmp, self.path)
+        except Exception as e:
+            print(f'Warm start snapshot {self.path} not save. Error: {e}')
+
+    def load(self):
+        """
+        Состояние из снимка или None, если снимка нет, он устарел или не читается.
+        """
+        if not os.path.exists(self.path):
+            return None
+
+        try:
+            snapshot = joblib.load(self.path)
+        except Exception as e:
+            print(f'Warm start snapshot {self.path} not load. Error: {e}')
+            return None
+
+        if snapshot.get('version') != WARM_START_VERSION:
+            return None
+
+        age = t.time() - snapshot['saved_at']
+        if age > self.max_age:
+            print(f'Warm start snapshot {self.path} is too old: {age:.0f} s')
+            return None
+
+        return snapshot['state']
+
+    def start(self, get_state):
+        """
+        Запускает периодическое сохранение get_state() в отдельном потоке.
+        """
+        def run():
+            while not self._stop.is_set():
+                self._wakeup.wait(self.interval)
+                self._wakeup.clear()
+                if self._stop.is_set():
+                    break
+                try:
+                    state = get_state()
+                except Exception as e:
+                    print(f'Warm start state not collected. Error: {e}')
+                    continue
+                self.save(state)
+
+        self._thread = threading.Thread(target=run, daemon=True)
+        self._thread.start()
+
+    def request(self):
+        """
+        Сохранить снимок, не дожидаясь interval (например, после выставления заявок).
+        """
+        self._wakeup.set()
+
+    def stop(self):
+        self._stop.set()
+        self._wakeup.set()